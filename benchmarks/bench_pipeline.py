@@ -0,0 +1,260 @@
+"""Stage-level benchmarks of the glass_cannon simulation pipeline.
+
+Each stage of :func:`glass_cannon.glass_pipeline.simulator`, as well as the
+compression and noise utilities, is timed and its peak traced memory is
+recorded for a range of resolutions. Results are written to a JSON file and
+can be compared against an earlier results file to flag regressions.
+
+Timings depend on the machine, so no baseline is stored with the package.
+Record one on the machine that runs the comparisons, e.g. before a change,
+and compare the runs after the change against it::
+
+    python benchmarks/bench_pipeline.py --nside 64 128 --output baseline.json
+    python benchmarks/bench_pipeline.py --nside 64 128 --baseline baseline.json
+
+Comparison is opt-in: with ``--baseline`` the script exits with status 1 if
+any stage is slower than the baseline by more than the given tolerance.
+Stages and resolutions missing from the baseline are not compared. The
+Python version and the CPU of every run are recorded and a warning is
+printed if the CPU differs from that of the baseline.
+
+Heavy imports are loaded and the in-memory caches of the package are
+cleared before every stage, so that the timings do not depend on the order
+in which stages and resolutions are run.
+
+The peak memory is traced with :mod:`tracemalloc`, which only sees memory
+allocated through Python, including NumPy arrays. The native allocations of
+CAMB and HEALPix are not traced, so the peaks of the spectrum and field
+generation stages are lower bounds.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+
+import numpy as np
+
+import glass
+
+from glass_cannon.cosmo_setup import make_cosmology_class
+from glass_cannon.Cls import angular_power_spectrum
+import glass_cannon.matter as ma
+from glass_cannon.glass_pipeline import convert_DM_to_tracers
+from glass_cannon.compression import do_CCA
+from glass_cannon.noisy import init_cov, add_noise
+from glass_cannon.instrument import Profiler
+from glass_cannon.cache import clear_caches
+
+
+def warm_up():
+    """Import the modules that the package only loads on first use.
+
+    Otherwise the import of CAMB is timed as part of the first stage that
+    needs it.
+    """
+    import camb
+    import cosmology.compat.camb
+    import glass.ext.camb
+
+
+def measure(func, *args, repeat=1):
+    """Time a call and trace its peak memory.
+
+    Parameters
+    ----------
+    func : callable
+        Function to call.
+    *args
+        Arguments of ``func``.
+    repeat : int, optional
+        Number of calls; the fastest one is reported. Default is 1.
+
+    Returns
+    -------
+    tuple
+        The result of the last call and a dict with the fastest ``wall``
+        time and mean ``cpu`` time in seconds and the ``peak_bytes`` of
+        traced memory.
+    """
+    profiler = Profiler(memory=True)
+    for _ in range(repeat):
+        with profiler.stage("call"):
+            result = func(*args)
+    stats = profiler.stats["call"]
+    return result, {"wall": stats["wall_min"], "cpu": stats["cpu"] / stats["calls"],
+                    "peak_bytes": stats["peak_bytes"]}
+
+
+def bench_resolution(nside, repeat=1, h=0.7, Oc=0.25, Ob=0.05, zmax=1.0):
+    """Benchmark every stage of the pipeline at one resolution.
+
+    Parameters
+    ----------
+    nside : int
+        HEALPix resolution, also used as lmax.
+    repeat : int, optional
+        Number of calls per stage. Default is 1.
+    h, Oc, Ob : float, optional
+        Cosmological parameters of the benchmark.
+    zmax : float, optional
+        Redshift of the last shell boundary. Default is 1.
+
+    Returns
+    -------
+    list of dict
+        One record per stage.
+    """
+    lmax = nside
+    records = []
+
+    def record(stage, func, *args):
+        clear_caches()
+        result, stats = measure(func, *args, repeat=repeat)
+        records.append({"stage": stage, "nside": nside, "lmax": lmax, "zmax": zmax, **stats})
+        return result
+
+    cosmo, pars = record("cosmology", make_cosmology_class, h, Oc, Ob)
+    zb = glass.distance_grid(cosmo, 0.0, zmax, dx=200.0)
+    cls, shells = record("angular_power_spectrum", angular_power_spectrum, pars, lmax, zb)
+    fields = ma.run_ln_fields(shells)
+    cls = record("run_discretized_cls", ma.run_discretized_cls, cls, nside, lmax)
+    gls = record("run_solve_gauss_spectra", ma.run_solve_gauss_spectra, fields, cls)
+
+    def generate():
+        rng = np.random.default_rng(seed=42)
+        return list(ma.run_generate(fields, gls, nside, rng))
+
+    matter = record("run_generate", generate)
+    record("tracer_conversion", convert_DM_to_tracers, shells, matter)
+
+    # data vectors of the size of one spectrum per shell pair
+    rng = np.random.default_rng(seed=42)
+    nsims = 2000
+    params = rng.normal(size=(nsims, 3))
+    data = params @ rng.normal(size=(3, lmax + 1)) + rng.normal(size=(nsims, lmax + 1))
+    record("do_CCA", do_CCA, params, data)
+
+    spectra = rng.normal(size=(3, 3, lmax + 1))
+    cov = init_cov(lmax + 1, rng)
+    record("add_noise", lambda: add_noise(spectra, cov=cov, rng=rng))
+
+    return records
+
+
+def machine_info():
+    """Describe the machine that runs the benchmarks.
+
+    Returns
+    -------
+    dict
+        The ``machine`` architecture, the ``cpu`` model and the
+        ``cpu_count``.
+    """
+    cpu = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {"machine": platform.machine(), "cpu": cpu, "cpu_count": os.cpu_count()}
+
+
+def machine_mismatch(meta, baseline_meta):
+    """Describe how the machine of a run differs from that of a baseline.
+
+    Parameters
+    ----------
+    meta, baseline_meta : dict
+        Metadata of the run and of the baseline, see :func:`machine_info`.
+
+    Returns
+    -------
+    list of str
+        One message per differing entry; entries missing from the baseline
+        are reported as unknown.
+    """
+    return [f"{key}: {meta[key]!r} vs baseline {baseline_meta.get(key, 'unknown')!r}"
+            for key in machine_info() if meta.get(key) != baseline_meta.get(key)]
+
+
+def compare(results, baseline, tolerance):
+    """Find stages that are slower than the baseline.
+
+    Parameters
+    ----------
+    results, baseline : list of dict
+        Records from :func:`bench_resolution`.
+    tolerance : float
+        Allowed relative slow-down, e.g. 0.2 for 20 per cent.
+
+    Returns
+    -------
+    list of str
+        One message per regression.
+    """
+    reference = {(r["stage"], r["nside"], r["zmax"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        ref = reference.get((r["stage"], r["nside"], r["zmax"]))
+        if ref is None:
+            continue
+        if r["wall"] > ref["wall"] * (1 + tolerance):
+            regressions.append(
+                f"{r['stage']} (nside={r['nside']}): {r['wall']:.3g} s "
+                f"vs baseline {ref['wall']:.3g} s"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nside", type=int, nargs="+", default=[64, 128],
+                        help="resolutions to benchmark (also used as lmax)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="calls per stage, the fastest is reported")
+    parser.add_argument("--zmax", type=float, default=1.0,
+                        help="redshift of the last shell boundary")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline",
+                        help="compare against this JSON file of an earlier run "
+                             "(default: no comparison)")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slow-down before flagging")
+    args = parser.parse_args(argv)
+
+    warm_up()
+    results = []
+    for nside in args.nside:
+        results += bench_resolution(nside, repeat=args.repeat, zmax=args.zmax)
+
+    for r in results:
+        print(f"{r['stage']:>24s}  nside={r['nside']:<4d}  "
+              f"{r['wall']:9.4f} s  {r['peak_bytes'] / 2**20:9.1f} MiB")
+
+    meta = {"python": sys.version, "platform": platform.platform(),
+            "numpy": np.__version__, **machine_info()}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for message in machine_mismatch(meta, baseline.get("meta", {})):
+            print("WARNING: baseline from another machine,", message)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for message in regressions:
+            print("REGRESSION:", message)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
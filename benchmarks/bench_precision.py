@@ -0,0 +1,98 @@
+"""Accuracy of the single precision simulation mode.
+
+The same realisation is simulated with ``dtype=np.float64`` and
+``dtype=np.float32``, and the tracer maps, their estimated spectra and
+noisy data vectors are compared. Results are printed and optionally written
+to a JSON file.
+
+Usage::
+
+    python benchmarks/bench_precision.py --nside 64 --lmax 96 --output precision.json
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from glass_cannon.glass_pipeline import simulator
+from glass_cannon.noisy import init_cov, add_noise
+from glass_cannon.spectra import estimate_spectra
+
+
+def relative_error(approx, exact, axis=None):
+    """Largest absolute difference relative to the largest exact value."""
+    approx = np.asarray(approx, dtype=float)
+    exact = np.asarray(exact, dtype=float)
+    return float(np.max(np.abs(approx - exact), axis=axis).max()
+                 / np.max(np.abs(exact), axis=axis).max())
+
+
+def compare(nside, lmax, zb, seed=42):
+    """Compare single and double precision outputs of one realisation.
+
+    Parameters
+    ----------
+    nside, lmax : int
+        Resolution and maximum multipole of the simulation.
+    zb : ndarray
+        Redshift boundaries of the shells.
+    seed : int, optional
+        Seed of the realisation. Default is 42.
+
+    Returns
+    -------
+    dict
+        Relative errors of the ``galaxy`` and ``HI`` maps, of the
+        ``spectra`` per spectrum for multipoles above 1, of the ``noisy``
+        spectra, and the ``bytes`` of the maps in both precisions.
+    """
+    results = {}
+    maps = {}
+    for dtype in (np.float64, np.float32):
+        galaxy, hi = simulator(h=0.7, OmegaB=0.05, OmegaC=0.25, nside=nside, lmax=lmax,
+                               seed=np.random.default_rng(seed), zb=zb, dtype=dtype)
+        maps[dtype] = np.stack([galaxy, hi])
+    exact, approx = maps[np.float64], maps[np.float32]
+
+    results["galaxy"] = relative_error(approx[0], exact[0])
+    results["HI"] = relative_error(approx[1], exact[1])
+
+    exact_cls = estimate_spectra(exact, lmax)
+    approx_cls = estimate_spectra(approx, lmax)
+    assert approx_cls.dtype == np.float32
+    # worst spectrum, each relative to its own amplitude
+    errors = (np.abs(approx_cls[..., 2:] - exact_cls[..., 2:]).max(axis=-1)
+              / np.abs(exact_cls[..., 2:]).max(axis=-1))
+    results["spectra"] = float(errors.max())
+
+    data = exact_cls[0, 2:]
+    cov = init_cov(len(data), np.random.default_rng(seed)) * np.mean(data)**2
+    noisy64 = add_noise(data, cov, rng=seed)
+    noisy32 = add_noise(data.astype(np.float32), cov, rng=seed)
+    results["noisy"] = relative_error(noisy32, noisy64)
+
+    results["bytes"] = {"float64": exact.nbytes, "float32": approx.nbytes}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nside", type=int, default=64)
+    parser.add_argument("--lmax", type=int, default=96)
+    parser.add_argument("--zb", type=float, nargs="+", default=[0.0, 0.2, 0.4, 0.6, 0.8])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="JSON file for the results")
+    args = parser.parse_args(argv)
+
+    results = compare(args.nside, args.lmax, np.array(args.zb), args.seed)
+    results.update(nside=args.nside, lmax=args.lmax, zb=args.zb)
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
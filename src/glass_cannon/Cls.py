@@ -1,19 +1,62 @@
 """Computation of angular matter power spectra with CAMB via GLASS.
 
 This module exposes a helper to compute the angular power spectra for a set
-of linear redshift shells using the CAMB-backed GLASS extension.
+of linear redshift shells using the CAMB-backed GLASS extension. Results can
+optionally be kept in a persistent on-disk cache so that repeated runs at
+the same cosmology skip CAMB entirely.
 """
 
-# use the CAMB cosmology that generated the matter power spectra
-import camb
-from cosmology.compat.camb import Cosmology
+import numpy as np
 
 # almost all GLASS functionality is available from the `glass` namespace
 import glass
-import glass.ext.camb
 
+from glass_cannon.cache import DiskCache, hash_key
+from glass_cannon.instrument import stage
 
-def angular_power_spectrum(pars,lmax,zb):
+
+def make_cls_cache(directory, max_bytes=2**30):
+    """Create an on-disk cache for angular matter power spectra.
+
+    Parameters
+    ----------
+    directory : str or os.PathLike
+        Directory holding the cached spectra.
+    max_bytes : int, optional
+        Size cap of the cache in bytes, beyond which the least recently
+        used spectra are evicted. Default is 1 GiB.
+
+    Returns
+    -------
+    glass_cannon.cache.DiskCache
+        Cache to pass to :func:`angular_power_spectrum`. Its ``hits`` and
+        ``misses`` attributes count the CAMB runs saved and performed.
+    """
+    return DiskCache(directory, max_bytes=max_bytes)
+
+
+def _pack(cls, shells):
+    """Flatten spectra and windows into a dict of arrays for storage."""
+    arrays = {f"cl_{i}": np.asarray(cl) for i, cl in enumerate(cls)}
+    for i, shell in enumerate(shells):
+        arrays[f"za_{i}"] = np.asarray(shell.za)
+        arrays[f"wa_{i}"] = np.asarray(shell.wa)
+    arrays["zeff"] = np.array([shell.zeff for shell in shells])
+    return arrays
+
+
+def _unpack(arrays):
+    """Rebuild spectra and windows from a dict of stored arrays."""
+    ncls = sum(1 for name in arrays if name.startswith("cl_"))
+    cls = [arrays[f"cl_{i}"] for i in range(ncls)]
+    shells = [
+        glass.RadialWindow(arrays[f"za_{i}"], arrays[f"wa_{i}"], zeff)
+        for i, zeff in enumerate(arrays["zeff"].tolist())
+    ]
+    return cls, shells
+
+
+def angular_power_spectrum(pars,lmax,zb, cache=None, profiler=None, shells=None):
     """Compute angular matter power spectra for linear redshift shells.
 
     Parameters
@@ -25,6 +68,17 @@ def angular_power_spectrum(pars,lmax,zb):
     zb : ndarray
         Grid in comoving distance or redshift boundaries passed to
         ``glass.linear_windows`` to build shells.
+    cache : glass_cannon.cache.DiskCache, optional
+        On-disk cache from :func:`make_cls_cache`. If given, the spectra
+        and windows are looked up by a hash of ``pars``, ``lmax`` and
+        ``zb``, and CAMB is only run on a miss. Default is None (no
+        caching).
+    profiler : glass_cannon.instrument.Profiler, optional
+        Collector timing the ``cls_cache`` lookup and the ``camb_matter_cls``
+        computation. Default is None.
+    shells : Sequence, optional
+        Linear radial windows of ``zb`` if already built, e.g. from
+        :func:`glass_cannon.cosmo_setup.get_cosmology`. Default is None.
 
     Returns
     -------
@@ -33,9 +87,27 @@ def angular_power_spectrum(pars,lmax,zb):
         matter spectra in the GLASS format and ``shells`` are the associated
         linear radial window functions.
     """
-    
+
+    if cache is not None:
+        key = hash_key("angular_power_spectrum", repr(pars), int(lmax),
+                       np.asarray(zb, dtype=float))
+        with stage(profiler, "cls_cache"):
+            arrays = cache.load(key)
+        if arrays is not None:
+            return _unpack(arrays)
+
     # linear radial window functions
-    shells = glass.linear_windows(zb)
+    if shells is None:
+        shells = glass.linear_windows(zb)
     
-    # compute the angular matter power spectra of the shells with CAMB
-    return glass.ext.camb.matter_cls(pars, lmax, shells), shells
\ No newline at end of file
+    # compute the angular matter power spectra of the shells with CAMB,
+    # importing the CAMB extension only when a spectrum is not cached
+    from glass.ext import camb as glass_camb
+
+    with stage(profiler, "camb_matter_cls"):
+        cls = glass_camb.matter_cls(pars, lmax, shells)
+
+    if cache is not None:
+        cache.save(key, _pack(cls, shells))
+
+    return cls, shells
@@ -0,0 +1,254 @@
+"""Instrumental beam and foregrounds of HI intensity maps.
+
+This module turns simulated HI brightness temperature shells into mock
+observations. Every shell is transformed to spherical harmonics once, the
+synthetic foregrounds are added and the frequency-dependent Gaussian beam of
+a single-dish telescope is applied in harmonic space, where smoothing is a
+multiplication per multipole instead of a convolution on the sphere.
+
+The foregrounds follow the model of Santos et al. (2005): every component
+has an angular power spectrum ``A (1000 / l)^beta`` at the reference
+frequency and scales as ``(nu_ref / nu)^alpha``. The components are taken
+to be fully coherent in frequency and independent of each other, so that
+one harmonic template per component is drawn from its own seed and rescaled
+for every shell. Beam kernels and the templates of a fixed foreground sky
+are cached and shared across shells and realisations.
+
+References
+----------
+Santos, M. G., Cooray, A. & Knox, L. (2005), doi:10.1086/429857
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import healpy as hp
+
+# rest frequency of the 21 cm line in MHz
+NU_HI = 1420.405751768
+
+# speed of light in m/s
+C_LIGHT = 299792458.0
+
+# foreground components as (A in mK^2, beta, alpha) at NU_REF, Santos et al. (2005)
+NU_REF = 130.0
+FOREGROUNDS = {
+    "synchrotron": (700.0, 2.4, 2.80),
+    "point_sources": (57.0, 1.1, 2.07),
+    "galactic_free_free": (0.088, 3.0, 2.15),
+    "extragalactic_free_free": (0.014, 1.0, 2.10),
+}
+
+
+def frequency(z):
+    """Observed frequency of the 21 cm line in MHz.
+
+    Parameters
+    ----------
+    z : float or ndarray
+        Redshift value(s).
+
+    Returns
+    -------
+    float or ndarray
+        Frequency ``NU_HI / (1 + z)``.
+    """
+    return NU_HI / (1 + np.asarray(z))
+
+
+def beam_fwhm(nu, dish_diameter=15.0):
+    """Full width at half maximum of a single-dish Gaussian beam.
+
+    Parameters
+    ----------
+    nu : float or ndarray
+        Frequency in MHz.
+    dish_diameter : float, optional
+        Diameter of the dish in metres. Default is 15, as for MeerKAT.
+
+    Returns
+    -------
+    float or ndarray
+        Beam FWHM ``1.22 lambda / D`` in radians.
+    """
+    return 1.22 * C_LIGHT / (np.asarray(nu) * 1e6) / dish_diameter
+
+
+@lru_cache(maxsize=256)
+def beam_window(fwhm, lmax):
+    """Harmonic transfer function of a Gaussian beam.
+
+    Results are cached and returned read-only, so that shells and
+    realisations at the same frequency share one kernel.
+
+    Parameters
+    ----------
+    fwhm : float
+        Beam FWHM in radians.
+    lmax : int
+        Maximum angular multipole.
+
+    Returns
+    -------
+    ndarray
+        Beam window ``b_l`` of shape ``(lmax + 1,)``.
+    """
+    window = hp.gauss_beam(fwhm, lmax=lmax)
+    window.flags.writeable = False
+    return window
+
+
+@lru_cache(maxsize=8)
+def _alm_ell(lmax):
+    """Multipole of every coefficient in HEALPix ordering, read-only."""
+    ell, _ = hp.Alm.getlm(lmax)
+    ell.flags.writeable = False
+    return ell
+
+
+def foreground_cl(amplitude, beta, lmax):
+    """Angular power spectrum ``A (1000 / l)^beta`` of a foreground component.
+
+    The monopole is set to zero.
+    """
+    ell = np.arange(lmax + 1, dtype=float)
+    cl = np.zeros(lmax + 1)
+    cl[1:] = amplitude * (1000.0 / ell[1:])**beta
+    return cl
+
+
+def _draw_foreground(amplitude, beta, lmax, seed):
+    """Read-only Gaussian harmonic realisation of a foreground component."""
+    cl = foreground_cl(amplitude, beta, lmax)
+    ell, m = hp.Alm.getlm(lmax)
+    rng = np.random.default_rng(seed)
+
+    # real coefficients for m = 0, complex with half the variance per part else
+    sigma = np.sqrt(np.where(m == 0, cl[ell], cl[ell] / 2))
+    alm = sigma * rng.standard_normal(len(ell)) + 0j
+    alm[m > 0] += 1j * sigma[m > 0] * rng.standard_normal(np.count_nonzero(m > 0))
+    alm.flags.writeable = False
+    return alm
+
+
+@lru_cache(maxsize=8)
+def foreground_template(amplitude, beta, lmax, seed=0):
+    """Gaussian harmonic realisation of a foreground component.
+
+    Results are cached and returned read-only, so that shells and
+    realisations observing a fixed foreground sky share one template. The
+    cache holds a few templates only, as each is as large as a full set of
+    harmonic coefficients.
+
+    Parameters
+    ----------
+    amplitude, beta : float
+        Parameters of the spectrum, see :func:`foreground_cl`.
+    lmax : int
+        Maximum angular multipole.
+    seed : int or tuple of int, optional
+        Seed of the realisation. Default is 0.
+
+    Returns
+    -------
+    ndarray
+        Complex coefficients in HEALPix ordering at the reference frequency.
+    """
+    return _draw_foreground(amplitude, beta, lmax, seed)
+
+
+def observe_HI(maps, shells, lmax, nside=None, dish_diameter=15.0, foregrounds=FOREGROUNDS,
+               foreground_seed=0, foreground_amplitude=1.0, return_alms=False,
+               footprint=None):
+    """Apply the instrument beam and add foregrounds to HI shells.
+
+    Parameters
+    ----------
+    maps : ndarray
+        HI brightness temperature maps in mK of shape ``(nshells, npix)``,
+        e.g. from :func:`glass_cannon.HI_tracer.convert_DM_to_HI`.
+    shells : Sequence
+        GLASS radial window shells with a ``zeff`` attribute, one per map.
+    lmax : int
+        Maximum angular multipole of the observation.
+    nside : int, optional
+        HEALPix resolution of the output maps. Default is None, which uses
+        the resolution of ``maps``.
+    dish_diameter : float or None, optional
+        Dish diameter in metres, setting the beam width at the frequency of
+        each shell, see :func:`beam_fwhm`. None applies no beam. Default is
+        15.
+    foregrounds : dict or None, optional
+        Foreground components as ``(A, beta, alpha)`` by name. None adds no
+        foregrounds. Default is ``FOREGROUNDS``.
+    foreground_seed : int or numpy.random.SeedSequence, optional
+        Seed of the foreground templates, shared by all shells so that the
+        foregrounds are coherent in frequency. Every component draws its
+        template from ``(index, *seed)``, so that the components are
+        independent. Default is 0, which gives
+        every realisation the same foreground sky, as for a fixed observed
+        field. Pass ``simulation_seed(seed, index, "foregrounds")`` from
+        :mod:`glass_cannon.seeding` to draw an independent foreground sky
+        per simulation; such templates are not cached.
+    foreground_amplitude : float, optional
+        Factor applied to the foreground maps, e.g. to model residuals
+        after foreground removal. Default is 1.
+    return_alms : bool, optional
+        Return the harmonic coefficients instead of maps, e.g. for
+        :func:`glass_cannon.spectra.cross_spectra`. Default is False.
+    footprint : glass_cannon.footprint.Footprint, optional
+        If given, ``maps`` hold the compact values of the footprint pixels.
+        They are expanded one shell at a time with zeros outside the
+        footprint, and the observed maps are returned restricted to the
+        footprint, so the beam mixes in the empty sky near the edges.
+        Default is None.
+
+    Returns
+    -------
+    ndarray
+        Observed maps of shape ``(nshells, 12 * nside**2)``, or of shape
+        ``(nshells, footprint.size)`` with a footprint, in the precision of
+        ``maps``, or complex coefficients of shape ``(nshells, nalm)``.
+    """
+    maps = np.asarray(maps)
+    if footprint is not None and nside not in (None, footprint.nside):
+        raise ValueError(f"footprint has nside={footprint.nside}, output has nside={nside}")
+    if nside is None:
+        nside = footprint.nside if footprint is not None else hp.npix2nside(maps.shape[-1])
+    nu = frequency([shell.zeff for shell in shells])
+
+    if footprint is None:
+        # one transform for all shells
+        alms = np.atleast_2d(hp.map2alm(maps, lmax=lmax, pol=False))
+    else:
+        full = np.zeros(footprint.npix)
+        alms = np.stack([hp.map2alm(footprint.expand(values, out=full), lmax=lmax, pol=False)
+                         for values in np.atleast_2d(maps)])
+
+    # a fixed foreground sky is cached, a per-simulation one is drawn once
+    draw = foreground_template
+    if isinstance(foreground_seed, np.random.SeedSequence):
+        foreground_seed = foreground_seed.generate_state(4)
+        draw = _draw_foreground
+    foreground_seed = tuple(int(word) for word in np.atleast_1d(foreground_seed))
+    if foregrounds:
+        for index, (amplitude, beta, alpha) in enumerate(foregrounds.values()):
+            # one independent realisation per component
+            template = draw(float(amplitude), float(beta), lmax, (index, *foreground_seed))
+            factor = foreground_amplitude * (NU_REF / nu)**alpha
+            alms += factor[:, np.newaxis] * template
+
+    if dish_diameter is not None:
+        ell = _alm_ell(lmax)
+        for i, fwhm in enumerate(beam_fwhm(nu, dish_diameter)):
+            alms[i] *= beam_window(float(fwhm), lmax)[ell]
+
+    if return_alms:
+        return alms
+    if footprint is None:
+        observed = np.atleast_2d(hp.alm2map(list(alms), nside, lmax=lmax, pol=False))
+    else:
+        observed = np.stack([footprint.compress(hp.alm2map(alm, nside, lmax=lmax, pol=False))
+                             for alm in alms])
+    # keep single precision inputs in single precision
+    return observed.astype(np.result_type(maps.dtype, np.float32), copy=False)
@@ -12,7 +12,8 @@ Sarkar, T. G. et al. (2021), `2107.14057`.
 """
 
 import numpy as np
-import glass
+
+from glass_cannon.tracers import tracer_coefficients, fill_tracer_maps
 
 
 def b_HI(z):
@@ -52,7 +53,27 @@ def T_HI_bar(z):
     return 0.0559 + 0.2324*z - 0.0241*z**2
 
 
-def convert_DM_to_HI(shells, matter):
+def HI_coefficients(z):
+    """Affine coefficients mapping matter overdensity to HI temperature.
+
+    The HI brightness temperature ``T_HI_bar(z) * (1 + b_HI(z) * delta_m)``
+    is written as ``offset + scale * delta_m``.
+
+    Parameters
+    ----------
+    z : float or ndarray
+        Redshift value(s).
+
+    Returns
+    -------
+    tuple
+        The pair ``(offset, scale)`` evaluated at ``z``.
+    """
+    T = T_HI_bar(z)
+    return T, T * b_HI(z)
+
+
+def convert_DM_to_HI(shells, matter, dtype=np.float64, out=None):
     """Map matter overdensity shells to HI brightness temperature fields.
 
     For each redshift shell, the matter overdensity field ``delta_m`` is
@@ -60,36 +81,39 @@ def convert_DM_to_HI(shells, matter):
     temperature field ``T_HI = T_HI_bar(z) * (1 + delta_HI)`` following the
     convention in Cunnington et al. (2019).
 
+    Note that this is the observed temperature, not just fluctuations around
+    the mean, so the ``1 + delta_HI`` factor is included rather than
+    multiplying just by the fluctuation as in equation 3 of Cunnington et
+    al. (2019).
+
     Parameters
     ----------
     shells : Sequence
         Sequence of GLASS radial window shell objects. Each must provide a
         ``zeff`` attribute giving the effective redshift of the shell.
-    matter : Sequence of ndarray
-        Sequence of matter overdensity fields corresponding one-to-one to
-        ``shells``. Each element is an array on the HEALPix grid or similar
+    matter : Iterable of ndarray
+        Matter overdensity fields corresponding one-to-one to ``shells``.
+        Each element is an array on the HEALPix grid or similar
         discretisation used by GLASS.
+    dtype : data-type, optional
+        Data type of the output fields. Default is ``np.float64``.
+    out : ndarray, optional
+        Preallocated output of shape ``(nshells, npix)``. Default is None.
 
     Returns
     -------
-    list of ndarray
-        List of HI brightness temperature fields, one per input shell, with
-        the same shape as the input matter fields.
+    ndarray
+        HI brightness temperature fields of shape ``(nshells, npix)``, one
+        row per input shell.
+        Earlier versions returned a list of arrays, which the rows index
+        and iterate like.
+
+    Raises
+    ------
+    ValueError
+        If ``matter`` has more fields than there are ``shells``.
     """
-    hi_temperature_fields = []
-    for shell, delta_m in zip(shells, matter):
-        z = shell.zeff
-        #need mean not boundary
-        
-        # Apply bias to overdensity
-        delta_HI = b_HI(z) * delta_m
-        
-        # Map overdensity to brightness temperature
-        #  - this is the observed temperature, not just fluctuations around the mean
-        #  - so the 1 + fluctuation factor is included rather than multiplying just be the fluctuation 
-        #       as is the case in equation 3 in Cunnington et al. 2019
-        T_HI = T_HI_bar(z) * (1 + delta_HI)
-        
-        hi_temperature_fields.append(T_HI) #is this the correct way to combine?
-
-    return hi_temperature_fields
\ No newline at end of file
+    offset, scale = tracer_coefficients(shells, [HI_coefficients])
+    if out is not None:
+        out = out[np.newaxis]
+    return fill_tracer_maps(matter, offset, scale, out=out, dtype=dtype)[0]
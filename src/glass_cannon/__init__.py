@@ -7,5 +7,20 @@ Subpackages and modules provide:
 - Matter field generation helpers (`matter`).
 - High-level simulation pipeline (`glass_pipeline`).
 - Galaxy distribution utilities (`galaxies`).
+- Chunked galaxy catalogue sampling to disk or a callback (`catalogue`).
 - HI 21 cm tracer utilities (`HI_tracer`).
+- HI instrument beam and foregrounds in harmonic space (`HI_observation`).
+- PCA and FastICA foreground removal across HI shells (`cleaning`).
+- Fused tracer map kernel (`tracers`).
+- Auto and cross angular power spectrum estimation from maps (`spectra`).
+- Expected tracer spectra from the shell matter spectra (`theory`).
+- Emulation of the CAMB angular matter power spectra (`emulator`).
+- Resumable chunked on-disk store of simulation campaigns (`store`).
+- Out-of-core, shuffled training batches for neural estimators (`loader`).
+- Reproducible per-simulation random streams (`seeding`).
+- Partial-sky survey footprints with compact pixel storage (`footprint`).
+- Noise injection (`noisy`) and data compression (`compression`).
+- Gaussian likelihood and vectorised emcee/nautilus sampling (`inference`).
+- Content-addressed result caches (`cache`).
+- Per-stage profiling of the pipeline (`instrument`).
 """
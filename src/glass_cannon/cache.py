@@ -0,0 +1,262 @@
+"""Content-addressed caches for array results.
+
+This module provides a small cache that stores dictionaries of NumPy arrays
+as ``.npz`` files named after a hash of the inputs that produced them. The
+total size of the cache directory is capped, and the least recently used
+entries are evicted first. An in-memory counterpart with the same interface
+keeps a fixed number of recent results, and :func:`clear_caches` empties the
+module-level in-memory caches of the package.
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+
+def hash_key(*parts):
+    """Build a content hash from a sequence of inputs.
+
+    Parameters
+    ----------
+    *parts : object
+        Inputs identifying a result. Arrays are hashed by dtype, shape and
+        raw bytes, sequences element by element and every other object by
+        its ``repr``.
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 digest of the inputs.
+    """
+    digest = hashlib.sha256()
+
+    def update(part):
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f"ndarray:{part.dtype.str}:{part.shape}:".encode())
+            digest.update(part.tobytes())
+        elif isinstance(part, (list, tuple)):
+            digest.update(f"seq:{len(part)}:".encode())
+            for item in part:
+                update(item)
+        else:
+            digest.update(f"{type(part).__name__}:{part!r};".encode())
+
+    for part in parts:
+        update(part)
+
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Size-capped, least-recently-used store of arrays on disk.
+
+    Parameters
+    ----------
+    directory : str or os.PathLike
+        Directory holding the cache entries. Created if missing.
+    max_bytes : int, optional
+        Maximum total size of the entries in bytes. The least recently
+        used entries are removed once it is exceeded. Default is 1 GiB.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups answered from the cache.
+    misses : int
+        Number of lookups that found no entry.
+    """
+
+    suffix = ".npz"
+
+    def __init__(self, directory, max_bytes=2**30):
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        """Return the file path of the entry for ``key``."""
+        return os.path.join(self.directory, key + self.suffix)
+
+    def load(self, key):
+        """Look up an entry.
+
+        Parameters
+        ----------
+        key : str
+            Key as returned by :func:`hash_key`.
+
+        Returns
+        -------
+        dict of ndarray or None
+            The stored arrays, or None if there is no entry for ``key``.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (FileNotFoundError, OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # mark the entry as recently used
+        os.utime(path)
+        self.hits += 1
+        return arrays
+
+    def save(self, key, arrays):
+        """Store an entry and evict old entries if over the size cap.
+
+        Parameters
+        ----------
+        key : str
+            Key as returned by :func:`hash_key`.
+        arrays : dict of ndarray
+            Arrays to store under ``key``.
+        """
+        # write to a temporary file first so readers never see partial entries
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self.evict()
+
+    def entries(self):
+        """Return ``(mtime, size, path)`` for every entry, oldest first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """Remove least recently used entries until under ``max_bytes``."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        for _, _, path in self.entries():
+            os.remove(path)
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Summarise the cache state.
+
+        Returns
+        -------
+        dict
+            Number of ``hits`` and ``misses``, number of ``entries`` and
+            their total size in ``bytes``.
+        """
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+class MemoryCache:
+    """Least-recently-used store of results in memory.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of entries kept. Default is 32.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups answered from the cache.
+    misses : int
+        Number of lookups that found no entry.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def load(self, key):
+        """Look up an entry, returning None if there is none."""
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def save(self, key, value):
+        """Store an entry, evicting the least recently used if full."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Summarise the cache state as for :meth:`DiskCache.info`."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
+
+
+def clear_caches():
+    """Empty the module-level in-memory caches of the package.
+
+    These are the memoised cosmologies of
+    :func:`glass_cannon.cosmo_setup.get_cosmology`, the noise covariance
+    factors of :mod:`glass_cannon.noisy` and the beam kernels and
+    foreground templates of :mod:`glass_cannon.HI_observation`. Only
+    modules that are already imported are cleared, so no heavy dependency
+    is loaded. On-disk caches and caches passed by the caller are kept.
+    """
+    cosmo_setup = sys.modules.get("glass_cannon.cosmo_setup")
+    if cosmo_setup is not None:
+        cosmo_setup._get_cosmology.cache_clear()
+    noisy = sys.modules.get("glass_cannon.noisy")
+    if noisy is not None:
+        noisy._FACTOR_CACHE.clear()
+    observation = sys.modules.get("glass_cannon.HI_observation")
+    if observation is not None:
+        for cached in (observation.beam_window, observation._alm_ell,
+                       observation.foreground_template):
+            cached.cache_clear()
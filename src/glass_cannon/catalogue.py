@@ -0,0 +1,243 @@
+"""Memory-bounded sampling of galaxy catalogues from simulated shells.
+
+Galaxy positions are drawn shell by shell from the galaxy overdensity maps
+of :func:`glass_cannon.glass_pipeline.simulator`, in batches of a fixed
+number of galaxies. Every batch is handed to a sink as soon as it is drawn:
+either a callback or a :class:`CatalogueWriter` that appends the columns to
+chunked ``.npy`` files. Memory use therefore depends on the map resolution
+and the batch size, not on the number of galaxies.
+
+The galaxy density of every shell is obtained by partitioning a redshift
+distribution over the shells once, and is reused for all realisations.
+"""
+
+import json
+import os
+
+import numpy as np
+import glass
+
+from glass_cannon.cache import MemoryCache, hash_key
+from glass_cannon.galaxies import add_galaxies
+
+# columns of a catalogue
+COLUMNS = ("lon", "lat", "z", "shell")
+
+# galaxy densities per shell of recently used distributions and shells
+_DENSITY_CACHE = MemoryCache(maxsize=16)
+
+
+def shell_densities(z, dndz, shells):
+    """Galaxy density of every shell from a redshift distribution.
+
+    The partition is computed once per distribution and set of shells and
+    then served from memory.
+
+    Parameters
+    ----------
+    z : ndarray
+        Redshifts of the distribution.
+    dndz : ndarray
+        Galaxy redshift distribution in galaxies per arcmin2 per unit
+        redshift.
+    shells : Sequence
+        GLASS radial window shells.
+
+    Returns
+    -------
+    ndarray
+        Galaxies per arcmin2 in every shell, see
+        :func:`glass_cannon.galaxies.add_galaxies`. The array is read-only.
+    """
+    z = np.asarray(z, dtype=float)
+    dndz = np.asarray(dndz, dtype=float)
+    key = hash_key("shell_densities", z, dndz,
+                   [(np.asarray(shell.za), np.asarray(shell.wa)) for shell in shells])
+    ngal = _DENSITY_CACHE.load(key)
+    if ngal is None:
+        ngal = np.asarray(add_galaxies(z, dndz, shells))
+        ngal.flags.writeable = False
+        _DENSITY_CACHE.save(key, ngal)
+    return ngal
+
+
+class CatalogueWriter:
+    """Columnar on-disk catalogue written in fixed-size chunks.
+
+    Rows are buffered and written as one ``.npy`` file per column and
+    chunk, ``directory/<column>/<chunk>.npy``. Call :meth:`close` to write
+    the last, short chunk and the ``meta.json`` summary.
+
+    Parameters
+    ----------
+    directory : str or os.PathLike
+        Directory of the catalogue. Created if missing.
+    chunk_size : int, optional
+        Number of rows per chunk file. Default is 2**22.
+    """
+
+    def __init__(self, directory, chunk_size=2**22):
+        self.directory = os.fspath(directory)
+        self.chunk_size = chunk_size
+        self.nrows = 0
+        self.nchunks = 0
+        self._buffers = None
+        self._filled = 0
+        for column in COLUMNS:
+            os.makedirs(os.path.join(self.directory, column), exist_ok=True)
+
+    def __call__(self, columns):
+        """Append a batch of rows given as a dict of column arrays."""
+        count = len(columns[COLUMNS[0]])
+        if self._buffers is None:
+            self._buffers = {name: np.empty(self.chunk_size, dtype=np.asarray(columns[name]).dtype)
+                             for name in COLUMNS}
+        start = 0
+        while start < count:
+            n = min(count - start, self.chunk_size - self._filled)
+            for name in COLUMNS:
+                self._buffers[name][self._filled:self._filled + n] = columns[name][start:start + n]
+            self._filled += n
+            start += n
+            if self._filled == self.chunk_size:
+                self._flush()
+        self.nrows += count
+
+    def _flush(self):
+        if self._filled == 0:
+            return
+        for name in COLUMNS:
+            path = os.path.join(self.directory, name, f"{self.nchunks:08d}.npy")
+            np.save(path, self._buffers[name][:self._filled])
+        self.nchunks += 1
+        self._filled = 0
+
+    def close(self):
+        """Write the buffered rows and the catalogue summary."""
+        self._flush()
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump({"columns": list(COLUMNS), "nrows": self.nrows,
+                       "nchunks": self.nchunks, "chunk_size": self.chunk_size}, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_catalogue(directory, column, mmap=True):
+    """Iterate over the chunks of one column of a catalogue.
+
+    Parameters
+    ----------
+    directory : str or os.PathLike
+        Directory written by :class:`CatalogueWriter`.
+    column : str
+        Name of the column, one of ``COLUMNS``.
+    mmap : bool, optional
+        Return read-only memory maps. Default is True.
+
+    Yields
+    ------
+    ndarray
+        Values of the column in every chunk, in order.
+    """
+    with open(os.path.join(directory, "meta.json")) as f:
+        nchunks = json.load(f)["nchunks"]
+    for k in range(nchunks):
+        yield np.load(os.path.join(directory, column, f"{k:08d}.npy"),
+                      mmap_mode="r" if mmap else None)
+
+
+class CatalogueSampler:
+    """Sampler of galaxy positions, usable as a simulator sink.
+
+    Called as ``sampler(i, shell, delta_g, T_HI)``, as by the ``sink`` of
+    :func:`glass_cannon.glass_pipeline.simulator`, it draws Poisson counts
+    and positions for the galaxy overdensity of shell ``i`` and passes them
+    to ``sink`` in batches.
+
+    Parameters
+    ----------
+    ngal : ndarray
+        Galaxies per arcmin2 in every shell, e.g. from
+        :func:`shell_densities`.
+    sink : callable
+        Called with a dict of the ``COLUMNS`` arrays of every batch, e.g. a
+        :class:`CatalogueWriter`.
+    batch : int, optional
+        Maximum number of galaxies per batch. Default is 2**20.
+    rng : numpy.random.Generator, optional
+        Random number generator of the counts, positions and redshifts.
+        Default is None, which uses ``np.random.default_rng()``.
+    footprint : glass_cannon.footprint.Footprint, optional
+        If given, the overdensity maps hold the compact values of the
+        footprint pixels, as from a simulator with the same footprint, and
+        galaxies are only drawn inside the footprint. Default is None.
+
+    Attributes
+    ----------
+    counts : list of int
+        Number of galaxies drawn in every shell.
+    """
+
+    def __init__(self, ngal, sink, batch=2**20, rng=None, footprint=None):
+        self.ngal = np.asarray(ngal, dtype=float)
+        self.sink = sink
+        self.batch = batch
+        self.rng = np.random.default_rng(rng)
+        self.footprint = footprint
+        self.counts = []
+        # visibility of the full sky, zero outside the footprint
+        self._vis = None if footprint is None else footprint.mask().astype(float)
+
+    def __call__(self, i, shell, delta_g, T_HI=None):
+        # the linear bias can push the density contrast below -1
+        delta = np.maximum(delta_g, -1.0)
+        if self.footprint is not None:
+            delta = self.footprint.expand(delta)
+        total = 0
+        for lon, lat, count in glass.positions_from_delta(self.ngal[i], delta, vis=self._vis,
+                                                          batch=self.batch, rng=self.rng):
+            self.sink({
+                "lon": lon,
+                "lat": lat,
+                "z": glass.redshifts(count, shell, rng=self.rng),
+                "shell": np.full(count, i, dtype=np.int32),
+            })
+            total += count
+        self.counts.append(total)
+
+
+def sample_catalogue(shells, delta_g, ngal, sink, batch=2**20, rng=None, footprint=None):
+    """Draw a galaxy catalogue from galaxy overdensity shells.
+
+    Parameters
+    ----------
+    shells : Sequence
+        GLASS radial window shells.
+    delta_g : Iterable of ndarray
+        Galaxy overdensity map of every shell, e.g. the first output of
+        :func:`glass_cannon.glass_pipeline.simulator`.
+    ngal : ndarray
+        Galaxies per arcmin2 in every shell.
+    sink : callable
+        Receiver of the batches, see :class:`CatalogueSampler`.
+    batch : int, optional
+        Maximum number of galaxies per batch. Default is 2**20.
+    rng : numpy.random.Generator, optional
+        Random number generator. Default is None.
+    footprint : glass_cannon.footprint.Footprint, optional
+        Footprint of compact overdensity maps, see :class:`CatalogueSampler`.
+        Default is None.
+
+    Returns
+    -------
+    list of int
+        Number of galaxies drawn in every shell.
+    """
+    sampler = CatalogueSampler(ngal, sink, batch=batch, rng=rng, footprint=footprint)
+    for i, (shell, delta) in enumerate(zip(shells, delta_g)):
+        sampler(i, shell, delta)
+    return sampler.counts
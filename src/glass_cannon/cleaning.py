@@ -0,0 +1,241 @@
+"""Blind foreground removal from HI intensity shells.
+
+Foregrounds are orders of magnitude brighter than the HI signal but smooth
+in frequency, so they occupy a few modes along the shell axis of the
+``(nshells, npix)`` temperature cube. This module estimates these modes with
+principal component analysis (PCA) or FastICA and subtracts them.
+
+Both methods only need the ``(nshells, nshells)`` covariance between shells
+and a few passes over the pixels, which are streamed in chunks. The cube is
+never copied as a whole, and cleaning can overwrite it in place.
+
+References
+----------
+Hyvarinen, A. (1999), doi:10.1109/72.761722
+Wolz, L. et al. (2014), doi:10.1093/mnras/stt2133
+"""
+
+import numpy as np
+
+# number of pixels processed at a time
+CHUNK_SIZE = 2**16
+
+
+def _chunks(npix, chunk_size):
+    """Slices covering ``npix`` pixels in chunks."""
+    for start in range(0, npix, chunk_size):
+        yield slice(start, min(start + chunk_size, npix))
+
+
+def shell_covariance(cube, chunk_size=CHUNK_SIZE):
+    """Mean and covariance of the shells over the pixels.
+
+    Parameters
+    ----------
+    cube : ndarray
+        Temperature maps of shape ``(nshells, npix)``.
+    chunk_size : int, optional
+        Number of pixels accumulated at a time. Default is ``CHUNK_SIZE``.
+
+    Returns
+    -------
+    tuple of ndarray
+        Mean of every shell, of shape ``(nshells,)``, and covariance between
+        the shells, of shape ``(nshells, nshells)``.
+
+    Notes
+    -----
+    The centred co-moments of every chunk are merged with the pairwise
+    update of Chan et al., as in
+    :class:`glass_cannon.compression.CCAAccumulator`, so the covariance
+    does not lose precision when the mean temperature is much larger than
+    its fluctuations.
+    """
+    nshells, npix = cube.shape
+    count = 0
+    mean = np.zeros(nshells)
+    comoment = np.zeros((nshells, nshells))
+    for chunk in _chunks(npix, chunk_size):
+        x = np.asarray(cube[:, chunk], dtype=float)
+        n = x.shape[1]
+        chunk_mean = x.mean(axis=1)
+        centred = x - chunk_mean[:, np.newaxis]
+        delta = chunk_mean - mean
+        total = count + n
+        comoment += centred @ centred.T
+        comoment += np.outer(delta, delta) * (count * n / total)
+        mean += delta * (n / total)
+        count = total
+    return mean, comoment / npix
+
+
+def pca_modes(cov, nmodes):
+    """Leading principal modes of a shell covariance.
+
+    Parameters
+    ----------
+    cov : ndarray
+        Covariance of shape ``(nshells, nshells)``.
+    nmodes : int
+        Number of modes.
+
+    Returns
+    -------
+    tuple of ndarray
+        Eigenvalues of shape ``(nmodes,)`` in decreasing order, and the
+        orthonormal modes as columns of shape ``(nshells, nmodes)``.
+    """
+    evals, evecs = np.linalg.eigh(cov)
+    return evals[::-1][:nmodes], evecs[:, ::-1][:, :nmodes]
+
+
+def remove_modes(cube, mixing, unmixing, mean, chunk_size=CHUNK_SIZE, out=None):
+    """Subtract the foreground modes from a cube, chunk by chunk.
+
+    Every pixel is cleaned as ``r = (x - mean) - mixing @ (unmixing @ (x - mean))``.
+
+    Parameters
+    ----------
+    cube : ndarray
+        Temperature maps of shape ``(nshells, npix)``.
+    mixing : ndarray
+        Foreground modes of shape ``(nshells, nmodes)``.
+    unmixing : ndarray
+        Projection onto the mode amplitudes, of shape ``(nmodes, nshells)``.
+    mean : ndarray
+        Mean of every shell, which is removed as well.
+    chunk_size : int, optional
+        Number of pixels processed at a time. Default is ``CHUNK_SIZE``.
+    out : ndarray, optional
+        Output of the shape of ``cube``, which may be ``cube`` itself.
+        Default is None, which allocates it.
+
+    Returns
+    -------
+    ndarray
+        Cleaned maps.
+    """
+    if out is None:
+        out = np.empty_like(cube)
+    projection = mixing @ unmixing
+    for chunk in _chunks(cube.shape[1], chunk_size):
+        x = np.asarray(cube[:, chunk], dtype=float) - mean[:, np.newaxis]
+        x -= projection @ x
+        out[:, chunk] = x
+    return out
+
+
+def pca_clean(cube, nmodes, chunk_size=CHUNK_SIZE, inplace=False):
+    """Remove the leading principal modes along the shell axis.
+
+    Parameters
+    ----------
+    cube : ndarray
+        Temperature maps of shape ``(nshells, npix)``, e.g. from
+        :func:`glass_cannon.HI_observation.observe_HI`.
+    nmodes : int
+        Number of foreground modes removed.
+    chunk_size : int, optional
+        Number of pixels processed at a time. Default is ``CHUNK_SIZE``.
+    inplace : bool, optional
+        Overwrite ``cube`` with the cleaned maps. Default is False.
+
+    Returns
+    -------
+    tuple of ndarray
+        Cleaned maps of shape ``(nshells, npix)`` and the removed modes of
+        shape ``(nshells, nmodes)``.
+    """
+    mean, cov = shell_covariance(cube, chunk_size)
+    _, modes = pca_modes(cov, nmodes)
+    cleaned = remove_modes(cube, modes, modes.T, mean, chunk_size,
+                           out=cube if inplace else None)
+    return cleaned, modes
+
+
+def fastica(cube, ncomponents, chunk_size=CHUNK_SIZE, max_iter=200, tol=1e-6, seed=0):
+    """Independent components along the shell axis with FastICA.
+
+    The cube is modelled as ``x = mean + A s`` with ``ncomponents``
+    statistically independent source maps ``s``. Symmetric FastICA with the
+    ``log cosh`` contrast is run on the whitened data, whose expectations
+    over the pixels are accumulated chunk by chunk.
+
+    Parameters
+    ----------
+    cube : ndarray
+        Temperature maps of shape ``(nshells, npix)``.
+    ncomponents : int
+        Number of independent components.
+    chunk_size : int, optional
+        Number of pixels processed at a time. Default is ``CHUNK_SIZE``.
+    max_iter : int, optional
+        Maximum number of fixed-point iterations. Default is 200.
+    tol : float, optional
+        Convergence tolerance of the unmixing matrix. Default is 1e-6.
+    seed : int, optional
+        Seed of the initial unmixing matrix. Default is 0.
+
+    Returns
+    -------
+    tuple of ndarray
+        Mean of every shell of shape ``(nshells,)``, mixing matrix ``A`` of
+        shape ``(nshells, ncomponents)`` and unmixing matrix of shape
+        ``(ncomponents, nshells)`` that gives the sources from ``x - mean``.
+    """
+    nshells, npix = cube.shape
+    mean, cov = shell_covariance(cube, chunk_size)
+
+    # whitening of the leading principal subspace
+    evals, evecs = pca_modes(cov, ncomponents)
+    whiten = evecs.T / np.sqrt(evals)[:, np.newaxis]
+    dewhiten = evecs * np.sqrt(evals)
+
+    def decorrelate(w):
+        s, u = np.linalg.eigh(w @ w.T)
+        return (u / np.sqrt(s)) @ u.T @ w
+
+    w = decorrelate(np.random.default_rng(seed).standard_normal((ncomponents, ncomponents)))
+    for _ in range(max_iter):
+        gz = np.zeros((ncomponents, ncomponents))
+        dg = np.zeros(ncomponents)
+        for chunk in _chunks(npix, chunk_size):
+            z = whiten @ (np.asarray(cube[:, chunk], dtype=float) - mean[:, np.newaxis])
+            g = np.tanh(w @ z)
+            gz += g @ z.T
+            dg += np.sum(1 - g**2, axis=1)
+        new = decorrelate(gz / npix - (dg / npix)[:, np.newaxis] * w)
+        converged = np.max(np.abs(np.abs(np.sum(new * w, axis=1)) - 1)) < tol
+        w = new
+        if converged:
+            break
+
+    return mean, dewhiten @ w.T, w @ whiten
+
+
+def ica_clean(cube, ncomponents, chunk_size=CHUNK_SIZE, inplace=False, **kwargs):
+    """Remove the foreground components found by FastICA.
+
+    Parameters
+    ----------
+    cube : ndarray
+        Temperature maps of shape ``(nshells, npix)``.
+    ncomponents : int
+        Number of foreground components removed.
+    chunk_size : int, optional
+        Number of pixels processed at a time. Default is ``CHUNK_SIZE``.
+    inplace : bool, optional
+        Overwrite ``cube`` with the cleaned maps. Default is False.
+    **kwargs
+        Options of :func:`fastica`.
+
+    Returns
+    -------
+    tuple of ndarray
+        Cleaned maps of shape ``(nshells, npix)`` and the mixing matrix of
+        shape ``(nshells, ncomponents)``.
+    """
+    mean, mixing, unmixing = fastica(cube, ncomponents, chunk_size, **kwargs)
+    cleaned = remove_modes(cube, mixing, unmixing, mean, chunk_size,
+                           out=cube if inplace else None)
+    return cleaned, mixing
@@ -1,29 +1,296 @@
 import numpy as np
-from scipy.linalg import eigh
+from scipy.linalg import eigh, solve
 
-def do_CCA(sim_samples, data_to_compress, n_params=3):
+
+class CCAAccumulator:
+    """Streaming estimate of the covariances needed for CCA.
+
+    Means and centred co-moments of the parameters and the data are updated
+    chunk by chunk with the pairwise merge of Chan et al., so simulations can
+    be fed from disk or from a running simulator in bounded memory, and
+    partial accumulators from parallel workers can be merged.
+
+    Args:
+        n_params (int, optional): number of parameters which are varied in simulation. Defaults to 3.
+    """
+
+    def __init__(self, n_params=3):
+        self.n_params = n_params
+        self.count = 0
+        self.mean = None
+        self.comoment = None
+
+    def update(self, sim_samples, data_to_compress):
+        """add a chunk of simulations
+
+        Args:
+            sim_samples (numpy array): parameters of the chunk, shape (n, n_params)
+            data_to_compress (numpy array): data of the chunk, shape (n, ...), flattened per row
+        """
+        sim_samples = np.asarray(sim_samples, dtype=float).reshape(len(sim_samples), -1)
+        data_to_compress = np.asarray(data_to_compress, dtype=float)
+        data_to_compress = data_to_compress.reshape(len(data_to_compress), -1)
+        if sim_samples.shape != (len(data_to_compress), self.n_params):
+            raise ValueError("sim_samples must have shape (n, n_params) matching the data rows")
+
+        if len(sim_samples) == 0:
+            return self
+        joint = np.concatenate([sim_samples, data_to_compress], axis=1)
+        mean = joint.mean(axis=0)
+        centred = joint - mean
+        return self._merge(len(joint), mean, centred.T @ centred)
+
+    def merge(self, other):
+        """add the simulations of another accumulator, e.g. from a worker
+
+        Args:
+            other (CCAAccumulator): accumulator over other simulations
+        """
+        if other.n_params != self.n_params:
+            raise ValueError("cannot merge accumulators with different n_params")
+        if other.count == 0:
+            return self
+        return self._merge(other.count, other.mean, other.comoment)
+
+    def _merge(self, count, mean, comoment):
+        if self.count == 0:
+            self.count, self.mean, self.comoment = count, mean.copy(), comoment.copy()
+            return self
+        total = self.count + count
+        delta = mean - self.mean
+        self.comoment += comoment
+        self.comoment += np.outer(delta, delta) * (self.count * count / total)
+        self.mean += delta * (count / total)
+        self.count = total
+        return self
+
+    def covariance(self):
+        """unbiased joint covariance of parameters and data, as from ``np.cov``"""
+        if self.count < 2:
+            raise ValueError("need at least two simulations to estimate a covariance")
+        return self.comoment / (self.count - 1)
+
+    def solve(self):
+        """solve the CCA generalized eigenvalue problem
+
+        Returns:
+            evals (numpy array): the n_params largest eigenvalues
+            evecs (numpy array): the matching compression vectors, shape (ndata, n_params)
+        """
+        cca_cov = self.covariance()
+        n_params = self.n_params
+        cp = cca_cov[:n_params,:n_params]
+        cd = cca_cov[n_params:,n_params:]
+        cpd = cca_cov[:n_params,n_params:]
+
+        # This 'cl' can be understood as the projection of 'cp' to data vector space
+        cl = cpd.T@solve(cp, cpd, assume_a="pos")
+
+        # As seen in the paper, this generalized eigenvalue problem is equivalent to CCA
+        # but is more numerical stable as 'cd' and 'cd-cl' are both invertible.
+        # This problem is motivated as mutual information maximization under Gaussian linear model assumptions
+        evals, evecs = eigh(cd, cd - cl)
+
+        # In the context of the CCA, only min( dim(param), dim(data vector) ) components are real and the rest are noise.
+        evals = evals[::-1][:n_params]
+        evecs = evecs[:,::-1][:,:n_params]
+
+        return evals, evecs
+
+
+def fit_CCA(batches, n_params=3):
+    """fit CCA from an iterable of simulation chunks
+
+    Args:
+        batches (iterable): pairs (sim_samples, data_to_compress), e.g. from
+            ``glass_cannon.loader.MemmapDataset.batches``
+        n_params (int, optional): number of parameters which are varied in simulation. Defaults to 3.
+
+    Returns:
+        accumulator (CCAAccumulator): accumulated statistics; call ``solve`` for the compression
+    """
+    accumulator = CCAAccumulator(n_params)
+    for sim_samples, data_to_compress in batches:
+        accumulator.update(sim_samples, data_to_compress)
+    return accumulator
+
+
+def do_CCA(sim_samples, data_to_compress, n_params=3, chunk_size=4096):
     """function to compress the data using CCA
 
     Args:
         sim_samples (_type_): np.random.multivariate_normal(means, prior_cov, size=10000)
-        data_to_compress (numpy array): data to do CCA on
+        data_to_compress (numpy array): data to do CCA on, may be a memory map
         n_params (int, optional): number of parameters which are varied in simulation. Defaults to 3.
+        chunk_size (int, optional): number of simulations accumulated at a time. Defaults to 4096.
+    """
+    accumulator = CCAAccumulator(n_params)
+    for start in range(0, len(sim_samples), chunk_size):
+        accumulator.update(sim_samples[start:start + chunk_size],
+                           data_to_compress[start:start + chunk_size])
+
+    return accumulator.solve()
+
+
+def _jax_kernel(vectors, shift):
+    """jitted, vmapped projection on the CPU, or None if JAX is not installed"""
+    try:
+        import jax
+    except ImportError:
+        return None
+
+    cpu = jax.devices("cpu")[0]
+    vectors = jax.device_put(vectors, cpu)
+    shift = jax.device_put(shift, cpu)
+
+    def project(x):
+        return (x - shift) @ vectors
+
+    kernel = jax.jit(jax.vmap(project))
+    return lambda data: kernel(jax.device_put(data, cpu))
+
+
+class Compressor:
+    """Linear compression of data vectors with fitted projections.
+
+    The projection ``t = (x - shift) @ vectors`` is applied to batches of any
+    leading shape. With JAX installed it runs as a jitted, vmapped kernel on
+    the CPU, with batch sizes padded to powers of two so that a sampler
+    proposing varying numbers of points does not trigger recompilation;
+    otherwise NumPy is used. JAX computes in single precision unless
+    ``jax_enable_x64`` is set.
+
+    Args:
+        vectors (numpy array): projection vectors, shape (ndata, ncomponents)
+        shift (numpy array, optional): vector subtracted before projecting, shape (ndata,).
+            Defaults to zero.
+        backend (str, optional): "jax", "numpy" or "auto" for JAX when available. Defaults to "auto".
     """
-    cca_cov = np.cov(sim_samples.T, data_to_compress.T)
-    cp = cca_cov[:n_params,:n_params]
-    cd = cca_cov[n_params:,n_params:]
-    cpd = cca_cov[:n_params,n_params:]
-
-    # This 'cl' can be understood as the projection of 'cp' to data vector space
-    cl = cpd.T@np.linalg.inv(cp)@cpd
-
-    # As seen in the paper, this generalized eigenvalue problem is equivalent to CCA
-    # but is more numerical stable as 'cd' and 'cd-cl' are both invertible.
-    # This problem is motivated as mutual information maximization under Gaussian linear model assumptions
-    evals, evecs = eigh(cd, cd - cl)
-
-    # In the context of the CCA, only min( dim(param), dim(data vector) ) components are real and the rest are noise. 
-    evals = evals[::-1][:n_params]
-    evecs = evecs[:,::-1][:,:n_params]
-    
-    return evals, evecs
\ No newline at end of file
+
+    def __init__(self, vectors, shift=None, backend="auto"):
+        self.vectors = np.asarray(vectors, dtype=float)
+        ndata = self.vectors.shape[0]
+        self.shift = np.zeros(ndata) if shift is None else np.asarray(shift, dtype=float)
+        if backend not in ("auto", "jax", "numpy"):
+            raise ValueError(f"unknown backend {backend!r}")
+        self._kernel = None
+        if backend != "numpy":
+            self._kernel = _jax_kernel(self.vectors, self.shift)
+            if self._kernel is None and backend == "jax":
+                raise ImportError("the jax backend requires JAX to be installed")
+        self.backend = "numpy" if self._kernel is None else "jax"
+
+    @classmethod
+    def from_CCA(cls, accumulator, backend="auto"):
+        """compressor on the CCA vectors of a fitted accumulator
+
+        Args:
+            accumulator (CCAAccumulator): statistics of the training simulations
+            backend (str, optional): see ``Compressor``. Defaults to "auto".
+        """
+        _, evecs = accumulator.solve()
+        return cls(evecs, backend=backend)
+
+    @classmethod
+    def from_score(cls, mean, derivatives, cov, moped=True, backend="auto"):
+        """score (MOPED) compressor of a Gaussian likelihood at a fiducial point
+
+        The score compression ``t = dmu^T C^-1 (x - mu)`` keeps all the Fisher
+        information on the parameters near the fiducial point. With ``moped``
+        the vectors are Gram-Schmidt orthonormalised with respect to the
+        covariance, so that the compressed components are uncorrelated with
+        unit variance.
+
+        Args:
+            mean (numpy array): fiducial mean data vector, shape (ndata,)
+            derivatives (numpy array): derivatives of the mean with respect to the parameters,
+                shape (nparams, ndata)
+            cov (numpy array): data covariance, shape (ndata, ndata)
+            moped (bool, optional): orthonormalise the vectors. Defaults to True.
+            backend (str, optional): see ``Compressor``. Defaults to "auto".
+        """
+        derivatives = np.asarray(derivatives, dtype=float)
+        # C^-1 dmu for every parameter, shape (ndata, nparams)
+        weighted = solve(np.asarray(cov, dtype=float), derivatives.T, assume_a="pos")
+
+        if moped:
+            vectors = np.empty_like(weighted)
+            for m in range(len(derivatives)):
+                b = weighted[:, m] - vectors[:, :m] @ (vectors[:, :m].T @ derivatives[m])
+                norm = derivatives[m] @ weighted[:, m] - np.sum((vectors[:, :m].T @ derivatives[m])**2)
+                vectors[:, m] = b / np.sqrt(norm)
+        else:
+            vectors = weighted
+
+        return cls(vectors, shift=mean, backend=backend)
+
+    def apply(self, data):
+        """compress data vectors
+
+        Args:
+            data (numpy array): data vectors, shape (..., ndata)
+
+        Returns:
+            compressed (numpy array): compressed vectors, shape (..., ncomponents)
+        """
+        data = np.asarray(data)
+        lead = data.shape[:-1]
+        flat = data.reshape(-1, data.shape[-1])
+
+        if self._kernel is None:
+            compressed = (flat - self.shift) @ self.vectors
+        else:
+            n = len(flat)
+            padded = 1 << max(n - 1, 0).bit_length()
+            if padded != n:
+                flat = np.concatenate([flat, np.zeros((padded - n, flat.shape[1]), flat.dtype)])
+            compressed = np.asarray(self._kernel(flat))[:n]
+
+        return compressed.reshape(lead + (self.vectors.shape[1],))
+
+    __call__ = apply
+
+
+def finite_difference_statistics(simulate, fiducial, steps, nsims):
+    """estimate the fiducial mean, derivatives and covariance from simulations
+
+    All simulations are requested in a single batch. The simulations at the
+    shifted parameter points reuse the random streams of the fiducial
+    simulations (common random numbers), which cancels most of the sample
+    variance in the central differences.
+
+    Args:
+        simulate (callable): called as ``simulate(params, indices)`` with a table of parameters,
+            shape (n, nparams), and the campaign index of every row selecting its random streams
+            (see ``glass_cannon.seeding``); returns data vectors of shape (n, ...)
+        fiducial (numpy array): fiducial parameters, shape (nparams,)
+        steps (numpy array): finite difference step of every parameter, shape (nparams,)
+        nsims (int): number of simulations per parameter point
+
+    Returns:
+        mean (numpy array): mean fiducial data vector, shape (ndata,)
+        derivatives (numpy array): central difference derivatives, shape (nparams, ndata)
+        cov (numpy array): covariance of the fiducial data vectors, shape (ndata, ndata)
+    """
+    fiducial = np.asarray(fiducial, dtype=float)
+    steps = np.asarray(steps, dtype=float)
+    nparams = len(fiducial)
+
+    # fiducial block, then a +step and -step block for every parameter
+    shifts = [np.zeros(nparams)]
+    for p in range(nparams):
+        shifts += [steps[p] * np.eye(nparams)[p], -steps[p] * np.eye(nparams)[p]]
+    params = np.repeat(fiducial + np.array(shifts), nsims, axis=0)
+    indices = np.tile(np.arange(nsims), len(shifts))
+
+    data = np.asarray(simulate(params, indices), dtype=float)
+    data = data.reshape(len(shifts), nsims, -1)
+
+    mean = data[0].mean(axis=0)
+    cov = np.cov(data[0].T)
+    derivatives = np.stack([
+        (data[1 + 2 * p] - data[2 + 2 * p]).mean(axis=0) / (2 * steps[p])
+        for p in range(nparams)
+    ])
+
+    return mean, derivatives, cov
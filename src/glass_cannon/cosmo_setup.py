@@ -2,17 +2,15 @@
 
 This module provides small helpers to construct CAMB parameter objects,
 retrieve background quantities, and adapt them to the GLASS-compatible
-`Cosmology` wrapper used elsewhere in the package.
+`Cosmology` wrapper used elsewhere in the package. A memoising factory
+shares the background, distance grid and shell windows between all runs at
+the same parameters.
 """
 
-import pytest
-# use the CAMB cosmology that generated the matter power spectra
-import camb
-from cosmology.compat.camb import Cosmology
+import functools
 
 # almost all GLASS functionality is available from the `glass` namespace
 import glass
-import glass.ext.camb
 
 
 def set_cosmo(h, Oc, Ob):
@@ -32,6 +30,9 @@ def set_cosmo(h, Oc, Ob):
     camb.model.CAMBparams
         The configured CAMB parameter object.
     """
+    # CAMB is heavy to import, so only load it once a cosmology is needed
+    import camb
+
     pars = camb.set_params(
     H0=100 * h,
     omch2=Oc * h**2,
@@ -54,6 +55,8 @@ def make_bkg(cosmo):
     camb.results.CAMBdata
         Background results from CAMB.
     """
+    import camb
+
     results = camb.get_background(cosmo)
     return results
 
@@ -71,6 +74,9 @@ def make_cosmo(bkg):
     cosmology.compat.camb.Cosmology
         Wrapper providing the API that GLASS expects.
     """
+    # use the CAMB cosmology that generated the matter power spectra
+    from cosmology.compat.camb import Cosmology
+
     return Cosmology(bkg)
 
 
@@ -92,12 +98,82 @@ def make_cosmology_class(h, Oc, Ob):
         A pair ``(cosmo, pars)`` with a GLASS-compatible ``Cosmology`` and
         the corresponding CAMB parameters ``pars``.
     """
-    pars = camb.set_params(
-    H0=100 * h,
-    omch2=Oc * h**2,
-    ombh2=Ob * h**2,
-    NonLinear=camb.model.NonLinear_both)
+    pars = set_cosmo(h, Oc, Ob)
     
-    results = camb.get_background(pars)
+    results = make_bkg(pars)
     
-    return Cosmology(results), pars
\ No newline at end of file
+    return make_cosmo(results), pars
+
+
+class CosmologySetup:
+    """Lazily computed cosmology products for one parameter point.
+
+    Each product is computed on first access and then kept, so that it is
+    paid for once however many runs use it. Instances are shared through
+    :func:`get_cosmology` and must not be modified.
+
+    Parameters
+    ----------
+    h : float
+        Hubble parameter in units of 100 km s^-1 Mpc^-1.
+    Oc : float
+        Cold dark matter density parameter, Omega_c.
+    Ob : float
+        Baryon density parameter, Omega_b.
+    """
+
+    def __init__(self, h, Oc, Ob):
+        self.h = h
+        self.Oc = Oc
+        self.Ob = Ob
+
+    @functools.cached_property
+    def pars(self):
+        """CAMB parameter object, see :func:`set_cosmo`."""
+        return set_cosmo(self.h, self.Oc, self.Ob)
+
+    @functools.cached_property
+    def background(self):
+        """CAMB background results, see :func:`make_bkg`."""
+        return make_bkg(self.pars)
+
+    @functools.cached_property
+    def cosmo(self):
+        """GLASS-compatible cosmology, see :func:`make_cosmo`."""
+        return make_cosmo(self.background)
+
+    @functools.cached_property
+    def zb(self):
+        """Shell boundaries of 200 Mpc in comoving distance up to z=1."""
+        return glass.distance_grid(self.cosmo, 0.0, 1.0, dx=200.0)
+
+    @functools.cached_property
+    def shells(self):
+        """Linear radial window functions of the shells ``zb``."""
+        return glass.linear_windows(self.zb)
+
+
+@functools.lru_cache(maxsize=64)
+def _get_cosmology(h, Oc, Ob):
+    return CosmologySetup(h, Oc, Ob)
+
+
+def get_cosmology(h, Oc, Ob):
+    """Memoised cosmology factory.
+
+    Parameters
+    ----------
+    h : float
+        Hubble parameter in units of 100 km s^-1 Mpc^-1.
+    Oc : float
+        Cold dark matter density parameter, Omega_c.
+    Ob : float
+        Baryon density parameter, Omega_b.
+
+    Returns
+    -------
+    CosmologySetup
+        The shared setup for these parameters. The 64 most recently used
+        parameter points are kept.
+    """
+    return _get_cosmology(float(h), float(Oc), float(Ob))
@@ -0,0 +1,260 @@
+"""Emulator of angular matter power spectra for fast inference.
+
+Running CAMB for every parameter point of an inference campaign takes
+seconds per point. This module builds a training design over ``(h, Omega_c,
+Omega_b)``, computes the shell spectra with CAMB once for every design point
+on a fixed shell grid, and fits a fast interpolator of the spectra that can
+replace CAMB inside :func:`glass_cannon.glass_pipeline.simulator`.
+
+The emulator compresses the normalised spectra with a principal component
+decomposition and interpolates the component amplitudes with radial basis
+functions over the unit parameter cube.
+"""
+
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+from scipy.stats import qmc
+
+import glass
+
+from glass_cannon.cosmo_setup import get_cosmology
+from glass_cannon.Cls import angular_power_spectrum
+
+
+# parameter names of the emulator columns, as in simulate_batch
+PARAMETERS = ("h", "OmegaC", "OmegaB")
+
+
+def latin_hypercube(bounds, n, seed=None):
+    """Latin hypercube design over a box in parameter space.
+
+    Parameters
+    ----------
+    bounds : array_like
+        Array of shape ``(nparams, 2)`` with the lower and upper bound of
+        each parameter.
+    n : int
+        Number of design points.
+    seed : int or numpy.random.Generator, optional
+        Seed of the design. Default is None.
+
+    Returns
+    -------
+    ndarray
+        Design points of shape ``(n, nparams)``.
+    """
+    bounds = np.asarray(bounds, dtype=float)
+    sample = qmc.LatinHypercube(d=len(bounds), seed=seed).random(n)
+    return qmc.scale(sample, bounds[:, 0], bounds[:, 1])
+
+
+def build_training_set(design, zb, lmax, cache=None):
+    """Compute shell spectra with CAMB for every point of a design.
+
+    Parameters
+    ----------
+    design : ndarray
+        Parameter points of shape ``(n, 3)`` with columns ``h``,
+        ``OmegaC`` and ``OmegaB``.
+    zb : ndarray
+        Redshift boundaries of the shells, shared by all points.
+    lmax : int
+        Maximum angular multipole.
+    cache : glass_cannon.cache.DiskCache, optional
+        On-disk cache of angular matter power spectra. Default is None.
+
+    Returns
+    -------
+    ndarray
+        Spectra of shape ``(n, ncls, lmax + 1)`` in GLASS ordering.
+    """
+    cls_table = []
+    for h, OmegaC, OmegaB in np.asarray(design, dtype=float):
+        pars = get_cosmology(h=h, Oc=OmegaC, Ob=OmegaB).pars
+        cls, _ = angular_power_spectrum(pars, lmax, zb, cache=cache)
+        cls_table.append(np.stack(cls))
+    return np.stack(cls_table)
+
+
+class ClsEmulator:
+    """Interpolator of shell angular matter power spectra.
+
+    Parameters
+    ----------
+    design : ndarray
+        Training parameter points of shape ``(n, 3)``.
+    cls_table : ndarray
+        Training spectra of shape ``(n, ncls, lmax + 1)``, e.g. from
+        :func:`build_training_set`.
+    zb : ndarray
+        Redshift boundaries of the shells used for the training spectra.
+    bounds : array_like, optional
+        Parameter box of shape ``(3, 2)`` inside which the emulator may be
+        evaluated. Default is None, which uses the extent of ``design``.
+    ncomponents : int, optional
+        Number of principal components kept. Default is 16.
+    tolerance : float, optional
+        Largest acceptable error of the emulated spectra, as measured by
+        :meth:`validate`. Default is 0.01.
+
+    Attributes
+    ----------
+    accuracy : float or None
+        Largest error of the auto- and cross-spectra found by
+        :meth:`validate`, or None if the emulator was not validated.
+    """
+
+    def __init__(self, design, cls_table, zb, bounds=None, ncomponents=16, tolerance=0.01):
+        self.design = np.asarray(design, dtype=float)
+        self.cls_table = np.asarray(cls_table, dtype=float)
+        self.zb = np.asarray(zb, dtype=float)
+        if bounds is None:
+            bounds = np.stack([self.design.min(axis=0), self.design.max(axis=0)], axis=-1)
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.tolerance = tolerance
+        self.accuracy = None
+
+        n, ncls, nell = self.cls_table.shape
+        self.lmax = nell - 1
+        self.shells = glass.linear_windows(self.zb)
+
+        # normalise every spectrum by its typical amplitude across the design,
+        # keeping entries that vanish throughout (e.g. the monopole) at zero
+        self.scale = np.abs(self.cls_table).mean(axis=0)
+        y = np.divide(self.cls_table, self.scale, out=np.zeros_like(self.cls_table),
+                      where=self.scale != 0).reshape(n, -1)
+
+        # principal components of the normalised spectra
+        self.mean = y.mean(axis=0)
+        _, _, vt = np.linalg.svd(y - self.mean, full_matrices=False)
+        self.components = vt[:min(ncomponents, len(vt))]
+        coefficients = (y - self.mean) @ self.components.T
+
+        self.interpolator = RBFInterpolator(self.unit(self.design), coefficients,
+                                            kernel="thin_plate_spline", degree=1)
+
+    def unit(self, params):
+        """Map parameters to the unit cube of the emulator bounds."""
+        lower, upper = self.bounds[:, 0], self.bounds[:, 1]
+        return (np.asarray(params, dtype=float) - lower) / (upper - lower)
+
+    def predict(self, params):
+        """Emulate the shell spectra at one or many parameter points.
+
+        Parameters
+        ----------
+        params : array_like
+            Parameter points of shape ``(3,)`` or ``(n, 3)`` with columns
+            ``h``, ``OmegaC`` and ``OmegaB``.
+
+        Returns
+        -------
+        ndarray
+            Spectra of shape ``(ncls, lmax + 1)`` or ``(n, ncls, lmax + 1)``.
+
+        Raises
+        ------
+        ValueError
+            If a parameter point lies outside the emulator bounds.
+        """
+        params = np.asarray(params, dtype=float)
+        x = self.unit(np.atleast_2d(params))
+        if np.any((x < 0) | (x > 1)):
+            raise ValueError("parameters outside the emulator bounds")
+
+        y = self.interpolator(x) @ self.components + self.mean
+        cls = y.reshape((len(x),) + self.scale.shape) * self.scale
+
+        return cls[0] if params.ndim == 1 else cls
+
+    def angular_power_spectrum(self, h, OmegaC, OmegaB, lmax):
+        """Drop-in replacement of :func:`glass_cannon.Cls.angular_power_spectrum`.
+
+        Parameters
+        ----------
+        h, OmegaC, OmegaB : float
+            Cosmological parameters.
+        lmax : int
+            Maximum angular multipole, at most the emulator ``lmax``.
+
+        Returns
+        -------
+        tuple
+            A pair ``(cls, shells)`` as returned by the CAMB version, for
+            the shells of the emulator.
+        """
+        if lmax > self.lmax:
+            raise ValueError(f"emulator was trained up to lmax={self.lmax}, not {lmax}")
+        cls = self.predict([h, OmegaC, OmegaB])
+        return list(cls[:, :lmax + 1]), self.shells
+
+    def validate(self, design, cls_table):
+        """Measure the emulator accuracy on a held-out design.
+
+        Parameters
+        ----------
+        design : ndarray
+            Validation parameter points of shape ``(n, 3)``.
+        cls_table : ndarray
+            CAMB spectra at ``design``, of shape ``(n, ncls, lmax + 1)``.
+
+        Returns
+        -------
+        float
+            Largest error of the emulated spectra, which is also stored in
+            ``accuracy``. The error of the spectrum of shells ``i`` and
+            ``j`` is relative to ``sqrt(C_ii C_jj)``, so it is the relative
+            error for the auto-spectra, and cross-spectra of weakly
+            correlated shells do not dominate through their small amplitude.
+        """
+        cls = self.predict(design)
+        expected = np.asarray(cls_table)
+        nshells = len(self.shells)
+        # shell pairs in GLASS ordering (0, 0), (1, 1), (1, 0), (2, 2), ...
+        pairs = [(i, j) for i in range(nshells) for j in range(i, -1, -1)][:expected.shape[1]]
+        first = [i * (i + 1) // 2 for i, _ in pairs]
+        second = [j * (j + 1) // 2 for _, j in pairs]
+        # skip the monopole, which CAMB leaves at zero
+        norm = np.sqrt(np.abs(expected[:, first, 1:] * expected[:, second, 1:]))
+        error = np.abs(cls[:, :len(pairs), 1:] - expected[:, :len(pairs), 1:]) / norm
+        self.accuracy = float(error.max())
+        return self.accuracy
+
+    def check(self):
+        """Raise ValueError unless the validated accuracy is within tolerance."""
+        if self.accuracy is None:
+            raise ValueError("emulator has not been validated")
+        if self.accuracy > self.tolerance:
+            raise ValueError(f"emulator accuracy {self.accuracy:.3g} exceeds "
+                             f"tolerance {self.tolerance:.3g}")
+
+    def check_zb(self, zb):
+        """Raise ValueError if shell boundaries differ from those of the emulator.
+
+        Parameters
+        ----------
+        zb : ndarray or None
+            Redshift boundaries requested by the caller. None always passes.
+        """
+        if zb is not None and (np.shape(zb) != np.shape(self.zb)
+                               or not np.allclose(zb, self.zb)):
+            raise ValueError("zb differs from the shells of the emulator; "
+                             "omit zb or use emulator.zb")
+
+    def save(self, path):
+        """Serialise the emulator to a ``.npz`` file."""
+        np.savez(path, design=self.design, cls_table=self.cls_table, zb=self.zb,
+                 bounds=self.bounds, ncomponents=len(self.components),
+                 tolerance=self.tolerance,
+                 accuracy=np.nan if self.accuracy is None else self.accuracy)
+
+    @classmethod
+    def load(cls, path):
+        """Load an emulator written by :meth:`save`."""
+        with np.load(path) as data:
+            emulator = cls(data["design"], data["cls_table"], data["zb"],
+                           bounds=data["bounds"], ncomponents=int(data["ncomponents"]),
+                           tolerance=float(data["tolerance"]))
+            accuracy = float(data["accuracy"])
+        emulator.accuracy = None if np.isnan(accuracy) else accuracy
+        return emulator
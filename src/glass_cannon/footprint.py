@@ -0,0 +1,138 @@
+"""Partial-sky survey footprints with compact pixel storage.
+
+A :class:`Footprint` is the sorted set of HEALPix pixels (RING ordering)
+observed by a survey. Maps restricted to a footprint are stored compactly
+as the values of these pixels only, with shape ``(..., footprint.size)``
+instead of ``(..., 12 * nside**2)``, which reduces memory and disk use by
+the observed sky fraction. Pixelwise stages such as the tracer conversion,
+noise and foreground cleaning work on the compact values unchanged. Stages
+that need the whole sphere, the spectrum estimation, the HI observation and
+the catalogue sampling, take the footprint and expand the compact values
+one map at a time.
+"""
+
+import numpy as np
+import healpy as hp
+
+
+class Footprint:
+    """Set of observed HEALPix pixels.
+
+    Parameters
+    ----------
+    nside : int
+        HEALPix resolution.
+    pixels : array_like of int
+        Observed pixels in RING ordering. Duplicates are removed and the
+        pixels sorted.
+    """
+
+    def __init__(self, nside, pixels):
+        self.nside = int(nside)
+        self.pixels = np.unique(np.asarray(pixels, dtype=np.int64))
+        if self.pixels.size and (self.pixels[0] < 0 or self.pixels[-1] >= self.npix):
+            raise ValueError(f"pixels outside the range of nside={self.nside}")
+
+    @classmethod
+    def from_mask(cls, mask):
+        """Footprint of the non-zero pixels of a full-sky mask."""
+        mask = np.asarray(mask)
+        return cls(hp.npix2nside(mask.size), np.flatnonzero(mask))
+
+    @classmethod
+    def disc(cls, nside, lon, lat, radius):
+        """Circular footprint.
+
+        Parameters
+        ----------
+        nside : int
+            HEALPix resolution.
+        lon, lat : float
+            Centre of the disc in degrees.
+        radius : float
+            Radius of the disc in degrees.
+
+        Returns
+        -------
+        Footprint
+            Pixels whose centres lie in the disc.
+        """
+        vec = hp.ang2vec(lon, lat, lonlat=True)
+        return cls(nside, hp.query_disc(nside, vec, np.radians(radius)))
+
+    @property
+    def npix(self):
+        """Number of pixels of the full sky."""
+        return hp.nside2npix(self.nside)
+
+    @property
+    def size(self):
+        """Number of pixels in the footprint."""
+        return len(self.pixels)
+
+    @property
+    def fsky(self):
+        """Observed fraction of the sky."""
+        return self.size / self.npix
+
+    def mask(self):
+        """Full-sky boolean mask of the footprint."""
+        mask = np.zeros(self.npix, dtype=bool)
+        mask[self.pixels] = True
+        return mask
+
+    def compress(self, maps):
+        """Values of full-sky maps in the footprint.
+
+        Parameters
+        ----------
+        maps : ndarray
+            Maps of shape ``(..., npix)``.
+
+        Returns
+        -------
+        ndarray
+            Compact values of shape ``(..., size)``.
+        """
+        maps = np.asarray(maps)
+        if maps.shape[-1] != self.npix:
+            raise ValueError(f"maps have {maps.shape[-1]} pixels, expected {self.npix}")
+        return maps[..., self.pixels]
+
+    def expand(self, values, fill=0.0, out=None):
+        """Full-sky maps from compact values.
+
+        Parameters
+        ----------
+        values : ndarray
+            Compact values of shape ``(..., size)``.
+        fill : float, optional
+            Value of the pixels outside the footprint, e.g. ``hp.UNSEEN``.
+            Default is 0.
+        out : ndarray, optional
+            Output of shape ``(..., npix)``, e.g. a buffer reused across
+            calls. Default is None, which allocates it.
+
+        Returns
+        -------
+        ndarray
+            Maps of shape ``(..., npix)``.
+        """
+        values = np.asarray(values)
+        if values.shape[-1] != self.size:
+            raise ValueError(f"values have {values.shape[-1]} pixels, expected {self.size}")
+        if out is None:
+            out = np.empty(values.shape[:-1] + (self.npix,), dtype=values.dtype)
+        out[...] = fill
+        out[..., self.pixels] = values
+        return out
+
+    def __eq__(self, other):
+        return (isinstance(other, Footprint) and self.nside == other.nside
+                and np.array_equal(self.pixels, other.pixels))
+
+    def __hash__(self):
+        return hash((self.nside, self.pixels.tobytes()))
+
+    def __repr__(self):
+        return f"Footprint(nside={self.nside}, size={self.size}, fsky={self.fsky:.3f})"
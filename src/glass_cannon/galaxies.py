@@ -4,9 +4,45 @@ This module contains helpers to partition a redshift distribution function
 across GLASS radial windows and related galaxy utilities.
 """
 
+import numpy as np
 import glass
 
 
+def galaxy_bias(z):
+     """Linear galaxy bias model.
+
+     Parameters
+     ----------
+     z : float or ndarray
+         Redshift value(s).
+
+     Returns
+     -------
+     float or ndarray
+         Galaxy bias at ``z`` defined as ``0.7 * (1 + z)``.
+     """
+     return 0.7 * (1 + z)
+
+
+def galaxy_coefficients(z):
+    """Affine coefficients mapping matter to galaxy overdensity.
+
+    The galaxy overdensity ``galaxy_bias(z) * delta_m`` is written as
+    ``offset + scale * delta_m`` with zero offset.
+
+    Parameters
+    ----------
+    z : float or ndarray
+        Redshift value(s).
+
+    Returns
+    -------
+    tuple
+        The pair ``(offset, scale)`` evaluated at ``z``.
+    """
+    return np.zeros_like(z), galaxy_bias(z)
+
+
 # create 10 redshift shells between z=0 and z=1
 
 def add_galaxies(z,dndz, shells):
@@ -7,50 +7,203 @@ provided (commented-out) to render a volumetric view.
 """
 
 import glass
-import matplotlib.pyplot as plt
-from matplotlib.colors import LogNorm
 import numpy as np
-import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-from glass_cannon.cosmo_setup import make_cosmology_class
+from glass_cannon.cosmo_setup import get_cosmology
 from glass_cannon.Cls import angular_power_spectrum
 import glass_cannon.matter as ma 
-from glass_cannon.galaxies import add_galaxies
-from glass_cannon.HI_tracer import b_HI, T_HI_bar, convert_DM_to_HI
+from glass_cannon.galaxies import add_galaxies, galaxy_bias, galaxy_coefficients
+from glass_cannon.HI_tracer import b_HI, T_HI_bar, HI_coefficients, convert_DM_to_HI
+from glass_cannon.tracers import tracer_coefficients, fill_tracer_shell, fill_tracer_maps
+from glass_cannon.instrument import Profiler, stage
+from glass_cannon.seeding import simulation_seed
 
-def galaxy_bias(z):
-     """Linear galaxy bias model.
+# affine tracer models available to the fused tracer kernel
+TRACERS = {
+    "galaxy": galaxy_coefficients,
+    "HI": HI_coefficients,
+}
 
-     Parameters
-     ----------
-     z : float or ndarray
-         Redshift value(s).
 
-     Returns
-     -------
-     float or ndarray
-         Galaxy bias at ``z`` defined as ``0.7 * (1 + z)``.
-     """
-     return 0.7 * (1 + z)
+def convert_DM_to_galaxy_overdensity(shells, matter, dtype=np.float64, out=None):
+    """Map matter overdensity shells to galaxy overdensity fields.
 
+    Parameters
+    ----------
+    shells : Sequence
+        Sequence of GLASS radial window shells. Each must provide a
+        ``zeff`` attribute giving the effective redshift of the shell.
+    matter : Iterable of ndarray
+        Matter overdensity fields corresponding one-to-one to ``shells``.
+    dtype : data-type, optional
+        Data type of the output fields. Default is ``np.float64``.
+    out : ndarray, optional
+        Preallocated output of shape ``(nshells, npix)``. Default is None.
 
-def convert_DM_to_galaxy_overdensity(shells, matter):
+    Returns
+    -------
+    ndarray
+        Galaxy overdensity fields ``galaxy_bias(z) * delta_m`` of shape
+        ``(nshells, npix)``, one row per input shell.
+        Earlier versions returned a list of arrays, which the rows index
+        and iterate like.
+
+    Raises
+    ------
+    ValueError
+        If ``matter`` has more fields than there are ``shells``.
     """
+    offset, scale = tracer_coefficients(shells, [galaxy_coefficients])
+    if out is not None:
+        out = out[np.newaxis]
+    return fill_tracer_maps(matter, offset, scale, out=out, dtype=dtype)[0]
+
+
+def convert_DM_to_tracers(shells, matter, tracers=("galaxy", "HI"), dtype=np.float64, out=None,
+                          footprint=None):
+    """Map matter overdensity shells to several tracers in one pass.
+
+    Parameters
+    ----------
+    shells : Sequence
+        Sequence of GLASS radial window shells. Each must provide a
+        ``zeff`` attribute giving the effective redshift of the shell.
+    matter : Iterable of ndarray
+        Matter overdensity fields corresponding one-to-one to ``shells``.
+        Each is visited exactly once, so this may be a lazy generator.
+    tracers : Sequence of str, optional
+        Names of the tracers in ``TRACERS``. Default is
+        ``("galaxy", "HI")``.
+    dtype : data-type, optional
+        Data type of the output fields. Default is ``np.float64``.
+    out : ndarray, optional
+        Preallocated output of shape ``(ntracers, nshells, npix)``.
+        Default is None.
+    footprint : glass_cannon.footprint.Footprint, optional
+        If given, only the pixels of the footprint are kept, and ``npix``
+        is the size of the footprint. Default is None.
 
+    Returns
+    -------
+    ndarray
+        Tracer fields of shape ``(ntracers, nshells, npix)``.
     """
-    galaxy_overdensities = []
-    for shell, delta_m in zip(shells, matter):
-        z = shell.zeff
-        #need mean not boundary
-        
-        # Apply bias to overdensity
-        delta_g = galaxy_bias(z) * delta_m
+    offset, scale = tracer_coefficients(shells, [TRACERS[name] for name in tracers])
+    if footprint is not None:
+        matter = map(footprint.compress, matter)
+    return fill_tracer_maps(matter, offset, scale, out=out, dtype=dtype)
+
+
+def stream_tracers(shells, matter, dtype=np.float64, footprint=None):
+    """Derive all tracer fields from each matter shell in a single pass.
+
+    Each matter field is consumed exactly once, so ``matter`` can be the
+    lazy generator returned by :func:`glass_cannon.matter.run_generate` and
+    only the current shell's maps are kept alive.
+
+    Parameters
+    ----------
+    shells : Sequence
+        Sequence of GLASS radial window shells with a ``zeff`` attribute.
+    matter : Iterable of ndarray
+        Matter overdensity fields corresponding one-to-one to ``shells``.
+    dtype : data-type, optional
+        Data type of the tracer fields. Default is ``np.float64``.
+    footprint : glass_cannon.footprint.Footprint, optional
+        If given, only the pixels of the footprint are kept. Default is
+        None.
+
+    Yields
+    ------
+    tuple
+        ``(shell, delta_g, T_HI)`` with the shell, its galaxy overdensity
+        field and its HI brightness temperature field.
+    """
+    offset, scale = tracer_coefficients(shells, [galaxy_coefficients, HI_coefficients])
+    if footprint is not None:
+        matter = map(footprint.compress, matter)
+    for i, (shell, delta_m) in enumerate(zip(shells, matter)):
+        delta_g, T_HI = fill_tracer_shell(delta_m, offset[:, i], scale[:, i],
+                                          np.empty((2, delta_m.shape[-1]), dtype=dtype))
+        yield shell, delta_g, T_HI
+
+
+def _matter_shells(h, OmegaB, OmegaC, length, seed, cls_cache, zb, gls_cache, emulator,
+                   profiler=None, nside=None, lmax=None, footprint=None):
+        """Set up the shells and the lazy matter field generator."""
+        nside, lmax = ma.resolution(length, nside, lmax)
+        if footprint is not None and footprint.nside != nside:
+            raise ValueError(f"footprint has nside={footprint.nside}, simulation has nside={nside}")
+        # a fresh default stream per call, so that calls do not depend on each other
+        rng = np.random.default_rng(42 if seed is None else seed)
+
+        if emulator is not None:
+            # emulated spectra on the emulator's shells, without running CAMB
+            emulator.check_zb(zb)
+            emulator.check()
+            with stage(profiler, "angular_power_spectrum") as info:
+                cls, shells = emulator.angular_power_spectrum(h, OmegaC, OmegaB, lmax)
+                info["output"] = cls
+        else:
+            # shared, memoised background, distance grid and windows
+            setup = get_cosmology(h=h, Oc=OmegaC, Ob=OmegaB)
+
+            with stage(profiler, "cosmology"):
+                pars = setup.pars
+                shells = None
+                if zb is None:
+                    # shells of 200 Mpc in comoving distance spacing
+                    zb, shells = setup.zb, setup.shells
+
+            with stage(profiler, "angular_power_spectrum") as info:
+                cls, shells = angular_power_spectrum(pars,lmax,zb, cache=cls_cache,
+                                                     profiler=profiler, shells=shells)
+                info["output"] = cls
+
+        fields = ma.run_ln_fields(shells)
+
+        cls = ma.run_discretized_cls(cls, nside, lmax, profiler=profiler)
         
-        galaxy_overdensities.append(delta_g)
+        # compute Gaussian spectra for lognormal fields from discretised spectra
+        gls = ma.run_solve_gauss_spectra(fields, cls, cache=gls_cache, profiler=profiler)
+
+        # generator for lognormal matter fields
+        matter = ma.run_generate(fields, gls, nside, rng)
+
+        return shells, matter
+
+
+def simulate_shells(h, OmegaB, OmegaC, length = 128, seed = None,
+                    cls_cache=None, zb=None, gls_cache=None, emulator=None, profiler=None,
+                    nside=None, lmax=None, dtype=np.float64, footprint=None):
+        """Stream the simulation pipeline shell by shell.
 
-    return galaxy_overdensities
+        Same as :func:`simulator`, but the tracer fields are yielded as
+        soon as each matter shell is generated, so that peak memory is a
+        few shells' worth of maps however many shells there are.
 
-def simulator(h, OmegaB, OmegaC, length = 128, seed = np.random.default_rng(seed=42), PLOT=False):
+        Parameters
+        ----------
+        h, OmegaB, OmegaC, length, seed, cls_cache, zb, gls_cache, emulator, profiler, nside, lmax, dtype, footprint
+            See :func:`simulator`.
+
+        Yields
+        ------
+        tuple
+            ``(shell, delta_g, T_HI)`` for each redshift shell, see
+            :func:`stream_tracers`.
+        """
+        shells, matter = _matter_shells(h, OmegaB, OmegaC, length, seed, cls_cache, zb, gls_cache,
+                                        emulator, profiler, nside, lmax, footprint)
+
+        yield from stream_tracers(shells, matter, dtype, footprint)
+
+
+def simulator(h, OmegaB, OmegaC, length = 128, seed = None, PLOT=False,
+              cls_cache=None, zb=None, sink=None, gls_cache=None, emulator=None,
+              profiler=None, nside=None, lmax=None, dtype=np.float64, footprint=None):
         """Run the GLASS-based simulation pipeline.
 
         This constructs a cosmology, builds redshift shells, computes angular
@@ -66,53 +219,272 @@ def simulator(h, OmegaB, OmegaC, length = 128, seed = np.random.default_rng(seed
         OmegaC : float
             Cold dark matter density parameter.
         length : int, optional
-            Resolution parameter (e.g., HEALPix nside or similar) used by
-            GLASS when discretising spectra and generating fields. Default is
-            128.
-        seed : numpy.random.Generator, optional
-            Random number generator used for reproducible sampling. Default is
-            ``np.random.default_rng(seed=42)``.
+            Resolution used as both HEALPix ``nside`` and ``lmax`` when
+            these are not given. Default is 128.
+        seed : numpy.random.Generator or int or numpy.random.SeedSequence, optional
+            Random number generator, or seed of a new one, used for the
+            matter fields. Use :func:`glass_cannon.seeding.simulation_rng`
+            for the stream of a simulation in a campaign. Default is None,
+            which uses a new ``np.random.default_rng(seed=42)`` in every
+            call.
         PLOT : bool, optional
             If True, execute the plotting code path (currently commented-out)
             to visualise a pseudo-3D galaxy distribution. Default is False.
+        cls_cache : glass_cannon.cache.DiskCache, optional
+            On-disk cache of angular matter power spectra, see
+            :func:`glass_cannon.Cls.make_cls_cache`. Default is None.
+        zb : ndarray, optional
+            Redshift boundaries of the shells. Default is None, which uses
+            shells of 200 Mpc in comoving distance for this cosmology.
+        sink : callable, optional
+            If given, called as ``sink(i, shell, delta_g, T_HI)`` for each
+            shell as soon as it is generated, and nothing is kept in
+            memory. Default is None.
+        gls_cache : glass_cannon.matter.GaussSpectraCache, optional
+            Memoisation of the Gaussian spectra solve, reused across
+            realisations at the same cosmology. Default is None.
+        emulator : glass_cannon.emulator.ClsEmulator, optional
+            Validated emulator used instead of CAMB for the angular matter
+            power spectra. The shells are then those of the emulator, and
+            a ``zb`` that differs from ``emulator.zb`` raises a
+            :class:`ValueError`. Default is None.
+        profiler : glass_cannon.instrument.Profiler, optional
+            Collector of per-stage wall time, CPU time, peak memory and
+            output size. Matter fields are generated lazily while the
+            tracers are derived, so both are measured together in the
+            ``generate_tracers`` stage. Default is None.
+        nside : int or "auto", optional
+            HEALPix resolution of the maps. With ``"auto"``, the smallest
+            resolution adequate for ``lmax`` is used, which is much cheaper
+            for low-multipole analyses. Default is None, which uses
+            ``length``. See :func:`glass_cannon.matter.resolution`.
+        lmax : int, optional
+            Maximum multipole of the angular power spectra and the
+            correlated fields, e.g. the largest multipole of the data
+            vector. Default is None, which uses ``length``.
+        dtype : data-type, optional
+            Data type of the tracer fields, e.g. ``np.float32`` to halve
+            their memory. Spectra and matter fields are always computed in
+            double precision and only the tracer fields are stored in
+            ``dtype``. Default is ``np.float64``.
+        footprint : glass_cannon.footprint.Footprint, optional
+            Survey footprint at the resolution ``nside``. If given, only its
+            pixels are kept, as compact arrays with ``npix`` the size of
+            the footprint. Default is None.
 
         Returns
         -------
-        list of ndarray
-            A list of galaxy overdensity fields, one per redshift shell.
+        tuple of ndarray or None
+            Galaxy overdensity fields and HI brightness temperature fields,
+            each of shape ``(nshells, npix)`` with one row per redshift
+            shell, or None if a ``sink`` is given.
         """
-        cosmo, pars = make_cosmology_class(h=h, Oc=OmegaC, Ob=OmegaB)
-        
-        # shells of 200 Mpc in comoving distance spacing
-        zb = glass.distance_grid(cosmo, 0.0, 1.0, dx=200.0)
-
-        cls, shells = angular_power_spectrum(pars,length,zb)
-
-        fields = ma.run_ln_fields(shells)
+        shells, matter = _matter_shells(h, OmegaB, OmegaC, length, seed, cls_cache, zb, gls_cache,
+                                        emulator, profiler, nside, lmax, footprint)
 
-        cls = ma.run_discretized_cls(cls, length, length)
-        
-        # compute Gaussian spectra for lognormal fields from discretised spectra
-        gls = ma.run_solve_gauss_spectra(fields, cls)
+        if sink is not None:
+            with stage(profiler, "generate_tracers"):
+                streamed = stream_tracers(shells, matter, dtype, footprint)
+                for i, (shell, delta_g, T_HI) in enumerate(streamed):
+                    sink(i, shell, delta_g, T_HI)
+            return None
 
-        # generator for lognormal matter fields
-        matter = ma.run_generate(fields, gls, length, seed)
-
-        galaxy_overdensities = convert_DM_to_galaxy_overdensity(shells, matter)
-        hi_temperature_fields = convert_DM_to_HI(shells, matter)
+        # all tracers in one pass over the matter shells
+        with stage(profiler, "generate_tracers") as info:
+            tracers = convert_DM_to_tracers(shells, matter, dtype=dtype, footprint=footprint)
+            info["output"] = tracers
+        galaxy_overdensities, hi_temperature_fields = tracers
  
         #if PLOT==True:
 
         return galaxy_overdensities, hi_temperature_fields
 
 
+def simulate_rows(rows, params, seeds, kwargs, memory=None):
+    """Run :func:`simulator` for a chunk of parameter rows.
+
+    This is the unit of work of :func:`simulate_batch` and of
+    :func:`glass_cannon.store.run_campaign`. It is module-level so that it
+    can be sent to worker processes.
+
+    Parameters
+    ----------
+    rows : Sequence of int
+        Indices of the rows, returned with their outputs.
+    params : ndarray
+        Parameters of the rows, of shape ``(len(rows), 3)`` with columns
+        ``h``, ``OmegaC`` and ``OmegaB``.
+    seeds : Sequence
+        Seed of the field stream of every row, e.g. from
+        :func:`glass_cannon.seeding.simulation_seed`.
+    kwargs : dict
+        Options of :func:`simulator` shared by all rows.
+    memory : bool, optional
+        If not None, profile the chunk with a
+        :class:`~glass_cannon.instrument.Profiler` that traces memory if
+        True. Default is None.
+
+    Returns
+    -------
+    tuple
+        The list of ``(row, galaxy, HI)`` outputs and the profiler of the
+        chunk, or None.
+    """
+    profiler = None if memory is None else Profiler(memory=memory)
+    results = []
+    for row, (h, OmegaC, OmegaB), seed in zip(rows, params, seeds):
+        rng = np.random.default_rng(seed)
+        galaxy, hi = simulator(h=h, OmegaB=OmegaB, OmegaC=OmegaC, seed=rng,
+                               profiler=profiler, **kwargs)
+        results.append((row, galaxy, hi))
+    return results, profiler
+
+
+def simulate_batch(params, length=128, seed=42, workers=None, chunksize=1,
+                   zb=None, outdir=None, cls_cache=None, gls_cache=None, emulator=None,
+                   profiler=None, nside=None, lmax=None, indices=None, dtype=np.float64,
+                   footprint=None):
+    """Run the simulation pipeline over a table of cosmological parameters.
+
+    Rows are distributed in chunks over a pool of worker processes. Each row
+    uses the field stream of its index from ``seed``, see
+    :mod:`glass_cannon.seeding`, so the result of a row does not depend on
+    the number of workers, the chunking or the other rows.
 
+    The maps are noiseless. Noise for row ``i`` is drawn from its
+    ``"noise"`` stream, e.g. with
+    :func:`glass_cannon.noisy.add_simulation_noise`.
+
+    Parameters
+    ----------
+    params : ndarray
+        Array of shape ``(n, 3)`` with columns ``h``, ``OmegaC`` and
+        ``OmegaB``, with at least one row.
+    length : int, optional
+        Resolution parameter passed to :func:`simulator`. Default is 128.
+    seed : int or numpy.random.SeedSequence, optional
+        Seed of the campaign from which one independent stream per row is
+        derived. Default is 42.
+    workers : int, optional
+        Number of worker processes. Default is None, which uses
+        ``os.cpu_count()``. With ``workers=1`` the rows are simulated in the
+        calling process.
+    chunksize : int, optional
+        Number of rows sent to a worker at a time. Default is 1.
+    zb : ndarray, optional
+        Redshift boundaries of the shells, shared by all rows so that the
+        outputs can be stacked. Default is None, which uses the shells of
+        ``emulator`` if given, and otherwise shells of 200 Mpc in comoving
+        distance for the cosmology of the first row. Must match
+        ``emulator.zb`` when both are given.
+    outdir : str or os.PathLike, optional
+        If given, the outputs are written to ``params.npy``, ``galaxy.npy``
+        and ``HI.npy`` in this directory and the returned arrays are
+        memory maps of these files. Default is None.
+    cls_cache : glass_cannon.cache.DiskCache, optional
+        On-disk cache of angular matter power spectra. Default is None.
+    gls_cache : glass_cannon.matter.GaussSpectraCache, optional
+        Memoisation of the Gaussian spectra solve. Each worker process uses
+        its own copy, so give it an on-disk ``directory`` to share
+        solutions between workers. Default is None.
+    emulator : glass_cannon.emulator.ClsEmulator, optional
+        Validated emulator used instead of CAMB, see :func:`simulator`.
+        Default is None.
+    profiler : glass_cannon.instrument.Profiler, optional
+        Collector of per-stage statistics. Every chunk is profiled in its
+        worker and the statistics are merged into ``profiler``. Default is
+        None.
+    nside, lmax : int, optional
+        Map resolution and maximum multipole passed to :func:`simulator`.
+        Default is None.
+    indices : array_like of int, optional
+        Indices of the rows in the campaign, which select their random
+        streams. Use them to simulate a shard of a larger campaign. Default
+        is None, which uses ``0, ..., n - 1``.
+    dtype : data-type, optional
+        Data type of the tracer fields, also used for the files in
+        ``outdir``. Default is ``np.float64``.
+    footprint : glass_cannon.footprint.Footprint, optional
+        Survey footprint; only its pixels are kept, see :func:`simulator`.
+        Default is None.
+
+    Returns
+    -------
+    tuple of ndarray
+        Galaxy overdensity and HI brightness temperature fields, each of
+        shape ``(n, nshells, npix)``.
+    """
+    params = np.asarray(params, dtype=float)
+    if params.ndim != 2 or params.shape[1] != 3:
+        raise ValueError("params must have shape (n, 3) with columns h, OmegaC, OmegaB")
+    n = len(params)
+    if n == 0:
+        raise ValueError("params must have at least one row")
 
+    if emulator is not None:
+        emulator.check_zb(zb)
+        zb = emulator.zb
+    elif zb is None:
+        h, OmegaC, OmegaB = params[0]
+        zb = get_cosmology(h=h, Oc=OmegaC, Ob=OmegaB).zb
 
+    if indices is None:
+        indices = range(n)
+    if len(indices) != n:
+        raise ValueError("indices must have one entry per row of params")
+    seeds = [simulation_seed(seed, index, "fields") for index in indices]
 
+    kwargs = {"length": length, "zb": zb, "cls_cache": cls_cache, "gls_cache": gls_cache,
+              "emulator": emulator, "nside": nside, "lmax": lmax, "dtype": dtype,
+              "footprint": footprint}
+    memory = None if profiler is None else profiler.memory
+    chunks = [
+        (range(start, min(start + chunksize, n)), params[start:start + chunksize],
+         seeds[start:start + chunksize], kwargs, memory)
+        for start in range(0, n, chunksize)
+    ]
 
+    if workers is None:
+        workers = os.cpu_count()
 
+    if workers == 1:
+        results = map(lambda chunk: simulate_rows(*chunk), chunks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(simulate_rows, *zip(*chunks))
 
+    galaxy = hi = None
+    failed = True
+    try:
+        for chunk, chunk_profiler in results:
+            if profiler is not None:
+                profiler.merge(chunk_profiler)
+            for row, galaxy_row, hi_row in chunk:
+                if galaxy is None:
+                    shape = (n,) + galaxy_row.shape
+                    if outdir is None:
+                        galaxy = np.empty(shape, dtype=galaxy_row.dtype)
+                        hi = np.empty(shape, dtype=hi_row.dtype)
+                    else:
+                        os.makedirs(outdir, exist_ok=True)
+                        np.save(os.path.join(outdir, "params.npy"), params)
+                        galaxy = np.lib.format.open_memmap(
+                            os.path.join(outdir, "galaxy.npy"), mode="w+",
+                            dtype=galaxy_row.dtype, shape=shape)
+                        hi = np.lib.format.open_memmap(
+                            os.path.join(outdir, "HI.npy"), mode="w+",
+                            dtype=hi_row.dtype, shape=shape)
+                galaxy[row] = galaxy_row
+                hi[row] = hi_row
+        failed = False
+    finally:
+        if executor is not None:
+            # after an error or an interrupt, drop the chunks not yet started
+            executor.shutdown(cancel_futures=failed)
 
-       
+    if outdir is not None:
+        galaxy.flush()
+        hi.flush()
 
+    return galaxy, hi
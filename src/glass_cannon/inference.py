@@ -0,0 +1,207 @@
+"""Gaussian likelihood and vectorised posterior sampling.
+
+The likelihood factorises the data covariance once and evaluates the theory
+vectors of a whole batch of parameter points in a single call, so ensemble
+samplers can propose many points per Python call. Samplers are driven in
+their vectorised modes: ``emcee`` with ``vectorize=True`` and ``nautilus``
+with ``vectorized=True``. Batches can further be split over a process pool.
+
+``emcee`` and ``nautilus`` are only imported by the functions that run them.
+"""
+
+import os
+
+import numpy as np
+from scipy.linalg import cho_factor, solve_triangular
+
+
+class GaussianLikelihood:
+    """Gaussian likelihood of a data vector with a uniform prior.
+
+    Parameters
+    ----------
+    data : ndarray
+        Observed data vector of shape ``(ndata,)``, e.g. compressed spectra.
+    cov : ndarray
+        Data covariance of shape ``(ndata, ndata)``.
+    theory : callable
+        Vectorised model, called with parameters of shape ``(n, nparams)``
+        and returning theory vectors of shape ``(n, ndata)``.
+    bounds : array_like
+        Prior box of shape ``(nparams, 2)`` with the lower and upper bound
+        of every parameter.
+    """
+
+    def __init__(self, data, cov, theory, bounds):
+        self.data = np.asarray(data, dtype=float)
+        self.theory = theory
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.ndim = len(self.bounds)
+
+        # factorise once: chi2 = |L^-1 r|^2 and log det C = 2 sum log diag L
+        self.factor, _ = cho_factor(np.asarray(cov, dtype=float), lower=True)
+        self.norm = -0.5 * (2 * np.sum(np.log(np.diag(self.factor)))
+                            + len(self.data) * np.log(2 * np.pi))
+
+    def log_likelihood(self, params):
+        """Log-likelihood of one or many parameter points.
+
+        Parameters
+        ----------
+        params : array_like
+            Parameters of shape ``(nparams,)`` or ``(n, nparams)``.
+
+        Returns
+        -------
+        float or ndarray
+            Log-likelihood of every point.
+        """
+        params = np.asarray(params, dtype=float)
+        batch = np.atleast_2d(params)
+        residual = np.asarray(self.theory(batch), dtype=float) - self.data
+        whitened = solve_triangular(self.factor, residual.T, lower=True, check_finite=False)
+        logl = self.norm - 0.5 * np.sum(whitened**2, axis=0)
+        return logl[0] if params.ndim == 1 else logl
+
+    def log_prior(self, params):
+        """Uniform log-prior, zero inside the bounds and -inf outside."""
+        params = np.asarray(params, dtype=float)
+        inside = np.all((params >= self.bounds[:, 0]) & (params <= self.bounds[:, 1]), axis=-1)
+        return np.where(inside, 0.0, -np.inf)
+
+    def log_probability(self, params):
+        """Unnormalised log-posterior of one or many parameter points.
+
+        The theory is only evaluated for the points inside the prior box.
+        """
+        params = np.asarray(params, dtype=float)
+        batch = np.atleast_2d(params)
+        logp = np.atleast_1d(self.log_prior(batch)).astype(float)
+        inside = np.isfinite(logp)
+        if np.any(inside):
+            logp[inside] += self.log_likelihood(batch[inside])
+        return logp[0] if params.ndim == 1 else logp
+
+    def prior_transform(self, unit):
+        """Map points of the unit cube to the prior box."""
+        lower, upper = self.bounds[:, 0], self.bounds[:, 1]
+        return lower + np.asarray(unit) * (upper - lower)
+
+
+class _Pooled:
+    """Vectorised function whose batches are split over a pool."""
+
+    def __init__(self, function, pool, nchunks):
+        self.function = function
+        self.pool = pool
+        self.nchunks = nchunks
+
+    def __call__(self, params):
+        if len(params) == 0:
+            return self.function(params)
+        chunks = np.array_split(params, min(self.nchunks, len(params)))
+        return np.concatenate(list(self.pool.map(self.function, chunks)))
+
+
+def pooled(function, pool, nchunks=None):
+    """Split the batches of a vectorised function over a pool of workers.
+
+    Parameters
+    ----------
+    function : callable
+        Vectorised function of parameters of shape ``(n, nparams)``, e.g.
+        :meth:`GaussianLikelihood.log_probability`. It must be picklable
+        for process pools.
+    pool : object
+        Pool with a ``map`` method, such as
+        :class:`concurrent.futures.ProcessPoolExecutor` or
+        :class:`multiprocessing.pool.Pool`.
+    nchunks : int, optional
+        Number of chunks per batch, e.g. the number of workers of the
+        pool. Default is None, which uses ``os.cpu_count()``.
+
+    Returns
+    -------
+    callable
+        Vectorised function evaluating the chunks of each batch in the
+        pool.
+    """
+    if nchunks is None:
+        nchunks = os.cpu_count() or 1
+    return _Pooled(function, pool, nchunks)
+
+
+def run_emcee(likelihood, initial, nsteps, pool=None, seed=None, progress=False, **kwargs):
+    """Sample the posterior with the ``emcee`` ensemble sampler.
+
+    All walkers are evaluated in one vectorised call per step.
+
+    Parameters
+    ----------
+    likelihood : GaussianLikelihood
+        Likelihood and prior of the problem.
+    initial : ndarray
+        Initial walker positions of shape ``(nwalkers, nparams)``.
+    nsteps : int
+        Number of steps.
+    pool : object, optional
+        Pool over which the walkers of each step are split, see
+        :func:`pooled`. Default is None.
+    seed : int, optional
+        Seed of the sampler random state. Default is None.
+    progress : bool, optional
+        Show a progress bar. Default is False.
+    **kwargs
+        Options of ``emcee.EnsembleSampler``, e.g. ``moves``.
+
+    Returns
+    -------
+    emcee.EnsembleSampler
+        Sampler after the run, see ``get_chain``.
+    """
+    import emcee
+
+    initial = np.asarray(initial, dtype=float)
+    nwalkers, ndim = initial.shape
+    log_prob = likelihood.log_probability
+    if pool is not None:
+        log_prob = pooled(log_prob, pool)
+
+    sampler = emcee.EnsembleSampler(nwalkers, ndim, log_prob, vectorize=True, **kwargs)
+    if seed is not None:
+        sampler.random_state = np.random.RandomState(seed).get_state()
+    sampler.run_mcmc(initial, nsteps, progress=progress)
+    return sampler
+
+
+def run_nautilus(likelihood, n_live=2000, pool=None, seed=None, verbose=False, **kwargs):
+    """Sample the posterior with the ``nautilus`` nested sampler.
+
+    Parameters
+    ----------
+    likelihood : GaussianLikelihood
+        Likelihood and prior of the problem.
+    n_live : int, optional
+        Number of live points. Default is 2000.
+    pool : int or object, optional
+        Number of processes or pool over which nautilus splits each batch
+        of likelihood evaluations. Default is None.
+    seed : int, optional
+        Seed of the sampler. Default is None.
+    verbose : bool, optional
+        Report progress. Default is False.
+    **kwargs
+        Options of ``nautilus.Sampler.run``.
+
+    Returns
+    -------
+    nautilus.Sampler
+        Sampler after the run, see ``posterior`` and ``log_z``.
+    """
+    import nautilus
+
+    sampler = nautilus.Sampler(likelihood.prior_transform, likelihood.log_likelihood,
+                               n_dim=likelihood.ndim, n_live=n_live, vectorized=True,
+                               pass_dict=False, pool=pool, seed=seed)
+    sampler.run(verbose=verbose, **kwargs)
+    return sampler
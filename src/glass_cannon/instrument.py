@@ -0,0 +1,182 @@
+"""Instrumentation of the simulation pipeline stages.
+
+A :class:`Profiler` passed to :func:`glass_cannon.glass_pipeline.simulator`
+receives the wall time, CPU time, peak allocated memory and output array
+size of every pipeline stage. Statistics are aggregated per stage, so one
+profiler can be shared across thousands of runs and summarised at the end.
+When no profiler is given, the stages run under a no-op context and the
+overhead is a single function call per stage.
+"""
+
+import contextlib
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def nbytes(obj):
+    """Total size in bytes of the arrays in a (nested) result.
+
+    Parameters
+    ----------
+    obj : object
+        Array, or list or tuple of arrays, possibly nested. Other objects
+        count as zero bytes.
+
+    Returns
+    -------
+    int
+        Sum of the ``nbytes`` of all arrays found.
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(item) for item in obj)
+    return 0
+
+
+class Profiler:
+    """Collector of per-stage statistics.
+
+    Parameters
+    ----------
+    memory : bool, optional
+        If True, trace the peak allocated memory of every stage with
+        :mod:`tracemalloc`. This slows down allocation-heavy stages, and
+        only sees allocations made through Python, not those of compiled
+        libraries such as CAMB or HEALPix. Default is False.
+
+    Attributes
+    ----------
+    stats : dict
+        For every stage name, the number of ``calls``, the total, minimum
+        and maximum ``wall`` time, the total ``cpu`` time, the largest
+        ``peak_bytes`` and the largest output ``nbytes``. The peak of a
+        stage is the largest memory allocated above the traced memory at
+        its start, including the peaks of the stages nested in it.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stats = {}
+        # traced memory at the start and peak so far of every open stage
+        self._open = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure a pipeline stage.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+
+        Yields
+        ------
+        dict
+            Record of the stage. Setting its ``"output"`` item to the stage
+            result adds the size of the result to the statistics.
+        """
+        info = {}
+        started = False
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started = True
+            current, peak = tracemalloc.get_traced_memory()
+            # fold the peak of the enclosing stage so far in before resetting it
+            if self._open:
+                self._open[-1][1] = max(self._open[-1][1], peak)
+            self._open.append([current, current])
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield info
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak_bytes = 0
+            if self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                baseline, previous = self._open.pop()
+                peak = max(peak, previous)
+                peak_bytes = peak - baseline
+                if self._open:
+                    self._open[-1][1] = max(self._open[-1][1], peak)
+                if started:
+                    tracemalloc.stop()
+                else:
+                    tracemalloc.reset_peak()
+            self.record(name, wall, cpu, peak_bytes, nbytes(info.get("output")))
+
+    def record(self, name, wall, cpu, peak_bytes=0, output_bytes=0):
+        """Add one measurement of a stage to the statistics."""
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = {
+                "calls": 0, "wall": 0.0, "wall_min": float("inf"), "wall_max": 0.0,
+                "cpu": 0.0, "peak_bytes": 0, "nbytes": 0,
+            }
+        stats["calls"] += 1
+        stats["wall"] += wall
+        stats["wall_min"] = min(stats["wall_min"], wall)
+        stats["wall_max"] = max(stats["wall_max"], wall)
+        stats["cpu"] += cpu
+        stats["peak_bytes"] = max(stats["peak_bytes"], peak_bytes)
+        stats["nbytes"] = max(stats["nbytes"], output_bytes)
+
+    def merge(self, other):
+        """Add the statistics of another profiler, e.g. from a worker."""
+        for name, theirs in other.stats.items():
+            ours = self.stats.get(name)
+            if ours is None:
+                self.stats[name] = dict(theirs)
+                continue
+            ours["calls"] += theirs["calls"]
+            ours["wall"] += theirs["wall"]
+            ours["wall_min"] = min(ours["wall_min"], theirs["wall_min"])
+            ours["wall_max"] = max(ours["wall_max"], theirs["wall_max"])
+            ours["cpu"] += theirs["cpu"]
+            ours["peak_bytes"] = max(ours["peak_bytes"], theirs["peak_bytes"])
+            ours["nbytes"] = max(ours["nbytes"], theirs["nbytes"])
+        return self
+
+    def summary(self):
+        """Summarise the statistics.
+
+        Returns
+        -------
+        dict
+            For every stage, the statistics of ``stats`` plus the mean
+            wall time per call, ordered by total wall time.
+        """
+        summary = {}
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1]["wall"]):
+            summary[name] = dict(stats, wall_mean=stats["wall"] / stats["calls"])
+        return summary
+
+    def dump(self, path):
+        """Write the summary to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def stage(profiler, name):
+    """Context for a pipeline stage that is a no-op without a profiler.
+
+    Parameters
+    ----------
+    profiler : Profiler or None
+        Collector of the statistics, or None to disable instrumentation.
+    name : str
+        Name of the stage.
+
+    Returns
+    -------
+    context manager
+        Context yielding the stage record, see :meth:`Profiler.stage`.
+    """
+    if profiler is None:
+        return contextlib.nullcontext({})
+    return profiler.stage(name)
@@ -0,0 +1,380 @@
+"""Out-of-core loading of simulation training sets.
+
+Training a neural estimator on a large simulation campaign does not require
+the whole campaign in memory. This module reads parameters and data vectors
+from memory-mapped ``.npy`` files, such as the chunks of a
+:class:`glass_cannon.store.SimulationStore`, in shuffled mini-batches. Every
+batch can be augmented with noise from :func:`glass_cannon.noisy.add_noise`
+and projected onto compression vectors from
+:func:`glass_cannon.compression.do_CCA` on the fly, and batches are prepared
+in a background thread while the trainer consumes the previous one.
+
+PyTorch and ``sbi`` are only imported by the functions that need them.
+"""
+
+import queue
+import threading
+
+import numpy as np
+
+from glass_cannon.noisy import add_noise, add_simulation_noise
+
+
+class MemmapDataset:
+    """Pairs of parameters and data vectors backed by memory maps.
+
+    The dataset is a concatenation of sources, e.g. one per store chunk or
+    file, that are only read when a batch is taken.
+
+    Parameters
+    ----------
+    theta : list of ndarray
+        Parameter arrays of shape ``(n_k, nparams)``.
+    x : list of ndarray
+        Data arrays of shape ``(n_k, ...)`` with the same number of rows as
+        the matching parameter arrays. Data vectors are flattened.
+    dtype : data-type, optional
+        Type of the returned batches. Default is ``np.float32``, as used by
+        PyTorch.
+    indices : array_like of int, optional
+        Index of every row in its simulation campaign, which selects its
+        noise stream, see :meth:`batches`. Default is None, which uses
+        ``0, ..., n - 1``.
+    """
+
+    def __init__(self, theta, x, dtype=np.float32, indices=None):
+        if len(theta) != len(x):
+            raise ValueError("theta and x must have the same number of sources")
+        for t, d in zip(theta, x):
+            if len(t) != len(d):
+                raise ValueError("theta and x sources must have the same number of rows")
+        self.theta = list(theta)
+        self.x = list(x)
+        self.dtype = dtype
+        self.offsets = np.cumsum([0] + [len(t) for t in self.theta])
+        self.nparams = self.theta[0].shape[1] if self.theta else 0
+        self.nfeatures = int(np.prod(self.x[0].shape[1:])) if self.x else 0
+        if indices is None:
+            indices = np.arange(self.offsets[-1])
+        self.indices = np.asarray(indices, dtype=np.int64)
+        if len(self.indices) != self.offsets[-1]:
+            raise ValueError("indices must have one entry per row")
+
+    @classmethod
+    def from_store(cls, store, name="spectra", dtype=np.float32):
+        """Dataset of the committed chunks of a simulation store.
+
+        Parameters
+        ----------
+        store : glass_cannon.store.SimulationStore
+            Store holding the simulations.
+        name : str, optional
+            Output used as data vector. Default is ``"spectra"``.
+        dtype : data-type, optional
+            Type of the returned batches. Default is ``np.float32``.
+
+        Returns
+        -------
+        MemmapDataset
+            Dataset of the parameter rows and outputs of every chunk, with
+            the store rows as campaign indices.
+        """
+        theta, x, indices = [], [], []
+        for rows, array in store.iter_chunks(name, mmap=True):
+            theta.append(store.params[rows.start:rows.stop])
+            x.append(array)
+            indices.extend(rows)
+        return cls(theta, x, dtype=dtype, indices=indices)
+
+    @classmethod
+    def from_files(cls, theta, x, dtype=np.float32):
+        """Dataset of ``.npy`` files, opened as memory maps.
+
+        Parameters
+        ----------
+        theta, x : str or list of str
+            Paths of the parameter and data files, e.g. the ``params.npy``
+            and ``HI.npy`` files of
+            :func:`glass_cannon.glass_pipeline.simulate_batch`.
+        dtype : data-type, optional
+            Type of the returned batches. Default is ``np.float32``.
+
+        Returns
+        -------
+        MemmapDataset
+            Dataset of the files.
+        """
+        if isinstance(theta, str):
+            theta, x = [theta], [x]
+        return cls([np.load(path, mmap_mode="r") for path in theta],
+                   [np.load(path, mmap_mode="r") for path in x], dtype=dtype)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def take(self, index):
+        """Read the rows at the given indices.
+
+        Parameters
+        ----------
+        index : array_like of int
+            Row indices into the dataset. Sorted indices read the sources
+            sequentially.
+
+        Returns
+        -------
+        tuple of ndarray
+            Parameters of shape ``(n, nparams)`` and flattened data of shape
+            ``(n, nfeatures)``.
+        """
+        index = np.asarray(index, dtype=np.intp)
+        theta = np.empty((len(index), self.nparams), dtype=self.dtype)
+        x = np.empty((len(index), self.nfeatures), dtype=self.dtype)
+
+        source = np.searchsorted(self.offsets, index, side="right") - 1
+        for k in np.unique(source):
+            where = np.flatnonzero(source == k)
+            rows = index[where] - self.offsets[k]
+            theta[where] = self.theta[k][rows]
+            x[where] = self.x[k][rows].reshape(len(rows), -1)
+        return theta, x
+
+    def batches(self, batch_size=256, shuffle=True, rng=None, drop_last=False,
+                noise_cov=None, noise_seed=None, evecs=None):
+        """Iterate once over the dataset in mini-batches.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            Number of rows per batch. Default is 256.
+        shuffle : bool, optional
+            Visit the rows in random order. Default is True.
+        rng : int or numpy.random.Generator, optional
+            Seed or generator for the shuffling and the noise. Passing the
+            same generator to successive epochs gives a new order each time.
+            Default is None.
+        drop_last : bool, optional
+            Drop the last batch if it is short. Default is False.
+        noise_cov : ndarray, optional
+            If given, add Gaussian noise of this covariance to every data
+            vector, see :func:`glass_cannon.noisy.add_noise`. Default is
+            None.
+        noise_seed : int or numpy.random.SeedSequence, optional
+            Seed of the campaign. If given, the noise of every row is drawn
+            from the noise stream of its campaign index, see
+            :func:`glass_cannon.noisy.add_simulation_noise`, so that a row
+            gets the same noise in every epoch and for any batching. Default
+            is None, which draws new noise from ``rng`` in every epoch, as
+            an augmentation.
+        evecs : ndarray, optional
+            If given, project the (noisy) data vectors onto these vectors of
+            shape ``(nfeatures, ncomponents)``, e.g. from
+            :func:`glass_cannon.compression.do_CCA`. Default is None.
+
+        Yields
+        ------
+        tuple of ndarray
+            Parameters and data vectors of one batch.
+        """
+        rng = np.random.default_rng(rng)
+        n = len(self)
+        order = rng.permutation(n) if shuffle else np.arange(n)
+        stop = n - n % batch_size if drop_last else n
+        for start in range(0, stop, batch_size):
+            # sorting within the batch keeps reads sequential in each source
+            index = np.sort(order[start:start + batch_size])
+            theta, x = self.take(index)
+            if noise_cov is not None and noise_seed is not None:
+                x = add_simulation_noise(x, noise_cov, noise_seed, self.indices[index])
+                x = x.astype(self.dtype, copy=False)
+            elif noise_cov is not None:
+                x = add_noise(x, noise_cov, rng).astype(self.dtype, copy=False)
+            if evecs is not None:
+                x = (x @ evecs).astype(self.dtype, copy=False)
+            yield theta, x
+
+
+def prefetch(iterable, depth=2):
+    """Produce the items of an iterable in a background thread.
+
+    NumPy releases the GIL while reading memory maps and doing arithmetic,
+    so the next batches are prepared while the caller trains on the current
+    one.
+
+    Parameters
+    ----------
+    iterable : iterable
+        Source of the items, e.g. :meth:`MemmapDataset.batches`.
+    depth : int, optional
+        Maximum number of items prepared ahead. Default is 2.
+
+    Yields
+    ------
+    object
+        The items of ``iterable``, in order. Exceptions raised by the source
+        are re-raised in the caller.
+    """
+    items = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as exc:
+            put((end, exc))
+            return
+        put((end, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, exc = items.get()
+            if item is end:
+                if exc is not None:
+                    raise exc
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def torch_dataset(dataset, batch_size=256, depth=2, **kwargs):
+    """Wrap a dataset as a PyTorch iterable dataset of batches.
+
+    Every iteration is one epoch of prefetched, shuffled batches. Use it
+    with ``torch.utils.data.DataLoader(..., batch_size=None)``.
+
+    Parameters
+    ----------
+    dataset : MemmapDataset
+        Source of the batches.
+    batch_size : int, optional
+        Number of rows per batch. Default is 256.
+    depth : int, optional
+        Number of batches prepared ahead. Default is 2.
+    **kwargs
+        Options of :meth:`MemmapDataset.batches`.
+
+    Returns
+    -------
+    torch.utils.data.IterableDataset
+        Dataset yielding pairs of ``theta`` and ``x`` tensors.
+    """
+    import torch
+
+    rng = np.random.default_rng(kwargs.pop("rng", None))
+
+    class _Batches(torch.utils.data.IterableDataset):
+        def __iter__(self):
+            for theta, x in prefetch(dataset.batches(batch_size, rng=rng, **kwargs), depth):
+                yield torch.from_numpy(theta), torch.from_numpy(x)
+
+    return _Batches()
+
+
+def build_estimator(dataset, model="maf", nsamples=10_000, rng=None, noise_cov=None,
+                    noise_seed=None, evecs=None, **kwargs):
+    """Build an ``sbi`` neural posterior estimator for a dataset.
+
+    The estimator standardises its inputs with statistics of a random
+    subset of the dataset, so the full training set is never loaded. The
+    subset is processed as the training batches, so pass the same
+    ``noise_cov``, ``noise_seed`` and ``evecs`` as to
+    :func:`train_estimator`.
+
+    Parameters
+    ----------
+    dataset : MemmapDataset
+        Training set.
+    model : str, optional
+        Density estimator, see ``sbi.neural_nets.posterior_nn``. Default is
+        ``"maf"``.
+    nsamples : int, optional
+        Number of rows used for the standardisation. Default is 10000.
+    rng : int or numpy.random.Generator, optional
+        Seed or generator of the subset and its noise. Default is None.
+    noise_cov, noise_seed, evecs : ndarray, optional
+        Noise and compression of the data vectors, see
+        :meth:`MemmapDataset.batches`. Default is None.
+    **kwargs
+        Options of ``sbi.neural_nets.posterior_nn``.
+
+    Returns
+    -------
+    sbi.neural_nets.estimators.ConditionalDensityEstimator
+        Untrained estimator of the parameters given the data.
+    """
+    import torch
+    from sbi.neural_nets import posterior_nn
+
+    rng = np.random.default_rng(rng)
+    index = np.sort(rng.choice(len(dataset), min(nsamples, len(dataset)), replace=False))
+    theta, x = dataset.take(index)
+    subset = MemmapDataset([theta], [x], dtype=dataset.dtype, indices=dataset.indices[index])
+    theta, x = next(subset.batches(len(subset), shuffle=False, rng=rng, noise_cov=noise_cov,
+                                   noise_seed=noise_seed, evecs=evecs))
+    return posterior_nn(model=model, **kwargs)(torch.from_numpy(theta), torch.from_numpy(x))
+
+
+def train_estimator(estimator, dataset, epochs=20, batch_size=256, learning_rate=5e-4,
+                    depth=2, **kwargs):
+    """Train an ``sbi`` density estimator from an out-of-core dataset.
+
+    Parameters
+    ----------
+    estimator : sbi.neural_nets.estimators.ConditionalDensityEstimator
+        Estimator to train, e.g. from :func:`build_estimator`.
+    dataset : MemmapDataset
+        Training set.
+    epochs : int, optional
+        Number of passes over the dataset. Default is 20.
+    batch_size : int, optional
+        Number of rows per batch. Default is 256.
+    learning_rate : float, optional
+        Learning rate of the Adam optimiser. Default is 5e-4.
+    depth : int, optional
+        Number of batches prepared ahead. Default is 2.
+    **kwargs
+        Options of :meth:`MemmapDataset.batches`, e.g. ``noise_cov`` and
+        ``evecs``, as passed to :func:`build_estimator`.
+
+    Returns
+    -------
+    list of float
+        Mean training loss of every epoch. The trained estimator can be
+        wrapped in ``sbi.inference.DirectPosterior`` for sampling.
+    """
+    import torch
+
+    loader = torch.utils.data.DataLoader(
+        torch_dataset(dataset, batch_size, depth, **kwargs), batch_size=None)
+    optimizer = torch.optim.Adam(estimator.parameters(), lr=learning_rate)
+
+    losses = []
+    estimator.train()
+    for _ in range(epochs):
+        total, count = 0.0, 0
+        for theta, x in loader:
+            optimizer.zero_grad()
+            loss = estimator.loss(theta, condition=x).mean()
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(theta)
+            count += len(theta)
+        losses.append(total / count)
+    estimator.eval()
+    return losses
@@ -2,12 +2,20 @@
 
 This module wraps common GLASS calls to build lognormal fields, discretise
 angular power spectra, solve for Gaussian spectra, and generate correlated
-matter shells.
+matter shells. Solutions for Gaussian spectra can be memoised so that many
+realisations at the same cosmology share a single solve.
 """
 
+import time
+
+import numpy as np
 import glass
-import camb
 
+from glass_cannon.cache import DiskCache, MemoryCache, hash_key
+from glass_cannon.instrument import stage
+
+# number of neighbouring shells whose matter fields are correlated
+NCORR = 3
 
 def run_ln_fields(shells):
     """Create lognormal field generator for the given shells.
@@ -28,7 +36,62 @@ def run_ln_fields(shells):
     return fields
 
 
-def run_discretized_cls(prev_cls, nside, lmax):
+def minimal_nside(lmax, ratio=2):
+    """Smallest HEALPix resolution adequate for a maximum multipole.
+
+    HEALPix maps can represent multipoles up to ``3 * nside - 1``, but the
+    harmonic transform of a map is only accurate up to about ``2 * nside``.
+
+    Parameters
+    ----------
+    lmax : int
+        Maximum angular multipole of the analysis.
+    ratio : float, optional
+        Largest allowed ``lmax / nside``. Default is 2.
+
+    Returns
+    -------
+    int
+        Smallest power of two ``nside`` with ``ratio * nside >= lmax``.
+    """
+    nside = 1
+    while ratio * nside < lmax:
+        nside *= 2
+    return nside
+
+
+def resolution(length=128, nside=None, lmax=None):
+    """Resolve the HEALPix resolution and maximum multipole of a simulation.
+
+    Parameters
+    ----------
+    length : int, optional
+        Legacy resolution used for both ``nside`` and ``lmax`` when they
+        are not given. Default is 128.
+    nside : int or "auto", optional
+        HEALPix resolution of the maps. With ``"auto"``, the smallest
+        resolution adequate for ``lmax`` is used, see
+        :func:`minimal_nside`. Default is None, which uses ``length``.
+    lmax : int, optional
+        Maximum multipole of the angular power spectra and the correlated
+        fields. Default is None, which uses ``length``, or ``nside`` if
+        only that is given.
+
+    Returns
+    -------
+    tuple of int
+        The resolved ``(nside, lmax)``.
+    """
+    if nside is None:
+        nside = length
+    if lmax is None:
+        lmax = length if nside == "auto" else nside
+    if nside == "auto":
+        nside = minimal_nside(lmax)
+    return int(nside), int(lmax)
+
+
+def run_discretized_cls(prev_cls, nside, lmax, profiler=None):
     """Apply discretisation to a set of angular power spectra.
 
     The discretisation includes the HEALPix pixel window, a maximum angular
@@ -42,6 +105,9 @@ def run_discretized_cls(prev_cls, nside, lmax):
         Resolution parameter used for the HEALPix pixel window function.
     lmax : int
         Maximum multipole used for the discretisation.
+    profiler : glass_cannon.instrument.Profiler, optional
+        Collector of the ``run_discretized_cls`` stage statistics. Default
+        is None.
 
     Returns
     -------
@@ -52,13 +118,87 @@ def run_discretized_cls(prev_cls, nside, lmax):
     # apply discretisation to the full set of spectra:
     # - HEALPix pixel window function (`nside=nside`)
     # - maximum angular mode number (`lmax=lmax`)
-    # - number of correlated shells (`ncorr=3`)
-    cls = glass.discretized_cls(prev_cls, nside=nside, lmax=lmax, ncorr=3)
+    # - number of correlated shells (`ncorr=NCORR`)
+    with stage(profiler, "run_discretized_cls") as info:
+        cls = glass.discretized_cls(prev_cls, nside=nside, lmax=lmax, ncorr=NCORR)
+        info["output"] = cls
 
     return cls
 
 
-def run_solve_gauss_spectra(fields, cls):
+class GaussSpectraCache:
+    """Memoisation of Gaussian spectra solutions.
+
+    Solutions are kept in an in-memory LRU cache and, optionally, in an
+    on-disk cache shared between processes and sessions. Both are keyed by a
+    hash of the discretised spectra and the field descriptors.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Number of solutions kept in memory. Default is 16.
+    directory : str or os.PathLike, optional
+        Directory of the on-disk store. Default is None (memory only).
+    max_bytes : int, optional
+        Size cap of the on-disk store in bytes. Default is 1 GiB.
+
+    Attributes
+    ----------
+    hits : int
+        Number of solves avoided.
+    misses : int
+        Number of solves performed.
+    time_saved : float
+        Total time in seconds that the avoided solves originally took.
+    time_spent : float
+        Total time in seconds spent in the solves performed.
+    """
+
+    def __init__(self, maxsize=16, directory=None, max_bytes=2**30):
+        self.memory = MemoryCache(maxsize=maxsize)
+        self.disk = None if directory is None else DiskCache(directory, max_bytes=max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+        self.time_spent = 0.0
+
+    def load(self, key):
+        """Return a stored ``(gls, solve_time)`` pair, or None."""
+        entry = self.memory.load(key)
+        if entry is None and self.disk is not None:
+            arrays = self.disk.load(key)
+            if arrays is not None:
+                ngls = len(arrays) - 1
+                entry = [arrays[f"gl_{i}"] for i in range(ngls)], float(arrays["solve_time"])
+                self.memory.save(key, entry)
+        return entry
+
+    def save(self, key, gls, solve_time):
+        """Store a solution and the time it took."""
+        self.memory.save(key, (gls, solve_time))
+        if self.disk is not None:
+            arrays = {f"gl_{i}": np.asarray(gl) for i, gl in enumerate(gls)}
+            arrays["solve_time"] = np.array(solve_time)
+            self.disk.save(key, arrays)
+
+    def info(self):
+        """Summarise the counters.
+
+        Returns
+        -------
+        dict
+            Number of ``hits`` and ``misses`` and the ``time_saved`` and
+            ``time_spent`` in seconds.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "time_saved": self.time_saved,
+            "time_spent": self.time_spent,
+        }
+
+
+def run_solve_gauss_spectra(fields, cls, cache=None, profiler=None):
     """Solve Gaussian spectra for lognormal fields.
 
     Parameters
@@ -67,6 +207,13 @@ def run_solve_gauss_spectra(fields, cls):
         Lognormal fields descriptor returned by ``glass.lognormal_fields``.
     cls : object
         Discretised spectra from ``run_discretized_cls``.
+    cache : GaussSpectraCache, optional
+        If given, a previous solution for the same ``fields`` and ``cls`` is
+        reused instead of solving again. Default is None.
+    profiler : glass_cannon.instrument.Profiler, optional
+        Collector of the ``run_solve_gauss_spectra`` stage statistics, and
+        of the ``solve_gaussian_spectra`` stage of the solves performed.
+        Default is None.
 
     Returns
     -------
@@ -74,7 +221,28 @@ def run_solve_gauss_spectra(fields, cls):
         Gaussian spectra compatible with GLASS lognormal field generation.
     """
 
-    gls = glass.solve_gaussian_spectra(fields, cls)
+    with stage(profiler, "run_solve_gauss_spectra") as info:
+        if cache is not None:
+            key = hash_key("solve_gaussian_spectra", [repr(field) for field in fields],
+                           [np.asarray(cl) for cl in cls])
+            entry = cache.load(key)
+            if entry is not None:
+                gls, solve_time = entry
+                cache.hits += 1
+                cache.time_saved += solve_time
+                info["output"] = gls
+                return gls
+
+        start = time.perf_counter()
+        with stage(profiler, "solve_gaussian_spectra"):
+            gls = glass.solve_gaussian_spectra(fields, cls)
+        solve_time = time.perf_counter() - start
+        info["output"] = gls
+
+        if cache is not None:
+            cache.misses += 1
+            cache.time_spent += solve_time
+            cache.save(key, gls, solve_time)
 
     return gls
 
@@ -99,7 +267,7 @@ def run_generate(fields, gls, nside, rng):
         Generator yielding matter overdensity fields per shell.
     """
 
-    matter = glass.generate(fields, gls, nside, ncorr=3, rng=rng)
+    matter = glass.generate(fields, gls, nside, ncorr=NCORR, rng=rng)
 
     return matter
 
@@ -1,44 +1,175 @@
 import numpy as np
 
-def init_cov(ndim):
+from glass_cannon.cache import MemoryCache, hash_key
+from glass_cannon.seeding import simulation_rng
+
+# factors of recently used covariance matrices
+_FACTOR_CACHE = MemoryCache(maxsize=32)
+
+
+def _generator(rng):
+    """Return the global ``np.random`` state for None, else a Generator."""
+    if rng is None or rng is np.random:
+        return np.random
+    return np.random.default_rng(rng)
+
+
+def init_cov(ndim, rng=None):
     """Initialise random non-diagonal covariance matrix.
 
     Args:
 
         ndim: Dimension of Gaussian.
+        rng: numpy.random.Generator, or seed of a new one, used to draw
+            the diagonal. Defaults to the global ``np.random`` state.
 
     Returns:
 
         cov: Covariance matrix of shape (ndim,ndim).
 
     """
+    rng = _generator(rng)
 
-    cov = np.zeros((ndim, ndim))
-    diag_cov = np.ones(ndim) + np.random.randn(ndim) * 0.1
-    np.fill_diagonal(cov, diag_cov)
+    diag_cov = np.ones(ndim) + rng.standard_normal(ndim) * 0.1
+    cov = np.diag(diag_cov)
+
+    # alternating-sign band above and below the diagonal
     off_diag_size = 0.5
-    for i in range(ndim - 1):
-        cov[i, i + 1] = (
-            (-1) ** i * off_diag_size * np.sqrt(cov[i, i] * cov[i + 1, i + 1])
-        )
-        cov[i + 1, i] = cov[i, i + 1]
+    i = np.arange(ndim - 1)
+    band = (-1.0) ** i * off_diag_size * np.sqrt(diag_cov[:-1] * diag_cov[1:])
+    cov[i, i + 1] = band
+    cov[i + 1, i] = band
 
     return cov
 
-def add_noise(sim_data):
+
+def noise_factor(cov, cache=True):
+    """Factorise a covariance matrix as ``cov = L @ L.T``.
+
+    A Cholesky decomposition is used where possible. For covariance matrices
+    that are not numerically positive definite, the factor is built from an
+    eigendecomposition with negative eigenvalues clipped to zero.
+
+    Args:
+        cov (numpy array): covariance matrix of shape (ndim, ndim)
+        cache (bool, optional): reuse the factor of a previous call with the
+            same covariance. Defaults to True.
+
+    Returns:
+        L (numpy array): factor of shape (ndim, ndim). A cached factor is
+            shared between callers and returned read-only.
+    """
+    cov = np.asarray(cov, dtype=float)
+
+    if cache:
+        key = hash_key(cov)
+        L = _FACTOR_CACHE.load(key)
+        if L is not None:
+            return L
+
+    try:
+        L = np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        evals, evecs = np.linalg.eigh(cov)
+        L = evecs * np.sqrt(np.clip(evals, 0.0, None))
+
+    if cache:
+        # shared by every later caller, so it must not be modified in place
+        L.flags.writeable = False
+        _FACTOR_CACHE.save(key, L)
+
+    return L
+
+
+def add_noise(sim_data, cov=None, rng=None):
     """Add Gaussian noise to simulated data
 
+    The covariance is factorised once and the noise for all spectra is drawn
+    in a single batched product, for any number of leading axes. Single
+    precision data get the noise added in single precision.
+
     Args:
-        sim_data (numpy array): simulated data you want to add noise to (3x3x129)
+        sim_data (numpy array): simulated data you want to add noise to (...x129),
+            with the last axis the dimension of the covariance
+        cov (numpy array, optional): noise covariance of shape (ndim, ndim).
+            Defaults to a random covariance from ``init_cov``.
+        rng (numpy.random.Generator, optional): random number generator,
+            or seed of a new one, e.g. the noise stream of a simulation from
+            ``glass_cannon.seeding.simulation_rng``. Defaults to the global
+            ``np.random`` state.
     """
-    cov = init_cov(sim_data.shape[2])
-    noisy_sim_data = np.empty_like(sim_data)
-    
-    for ii in range(sim_data.shape[0]):
-        for jj in range(sim_data.shape[1]):
-            noisy_sim_data[ii,jj] = np.random.multivariate_normal(sim_data[ii, jj], cov)
-            
+    rng = _generator(rng)
+    if cov is None:
+        cov = init_cov(sim_data.shape[-1], rng)
+
+    L = noise_factor(cov)
+
+    # draws are double precision in both modes so that a seed gives the same
+    # noise up to rounding; the product and sum follow the data precision
+    dtype = np.result_type(np.asarray(sim_data).dtype, np.float32)
+    draws = rng.standard_normal(np.shape(sim_data)).astype(dtype, copy=False)
+    noise = draws @ L.T.astype(dtype, copy=False)
+    noisy_sim_data = np.add(sim_data, noise, out=noise)
+
     return noisy_sim_data
 
 
-    
\ No newline at end of file
+def add_simulation_noise(sim_data, cov, seed, indices):
+    """Add Gaussian noise to simulations from their own noise streams
+
+    The noise of every simulation is drawn from the noise stream of its
+    index in the campaign, see ``glass_cannon.seeding``, so a simulation
+    always gets the same noise, whichever other simulations share the batch
+    and on whichever worker it is processed.
+
+    Args:
+        sim_data (numpy array): simulated data of shape (n, ..., ndim), one
+            simulation per row
+        cov (numpy array): noise covariance of shape (ndim, ndim)
+        seed (int or numpy.random.SeedSequence): seed of the campaign
+        indices (array_like of int): index of every row in the campaign
+
+    Returns:
+        noisy_sim_data (numpy array): data with noise, in the precision of
+            ``sim_data``
+    """
+    sim_data = np.asarray(sim_data)
+    if len(indices) != len(sim_data):
+        raise ValueError("indices must have one entry per row of sim_data")
+    noisy_sim_data = np.empty(sim_data.shape, dtype=np.result_type(sim_data.dtype, np.float32))
+    for k, index in enumerate(indices):
+        noisy_sim_data[k] = add_noise(sim_data[k], cov, simulation_rng(seed, index, "noise"))
+    return noisy_sim_data
+
+
+def add_pixel_noise(maps, sigma, rng=None, footprint=None):
+    """Add uncorrelated Gaussian noise to the pixels of maps
+
+    The noise is drawn for the given pixels only, so that maps restricted to
+    a survey footprint are noised in their compact form.
+
+    Args:
+        maps (numpy array): maps of shape (..., npix), full-sky or the
+            compact values of a footprint
+        sigma (float or numpy array): noise standard deviation, broadcast
+            against the maps, e.g. one value per shell of shape (nshells, 1)
+            or a full-sky depth map if ``footprint`` is given
+        rng (numpy.random.Generator, optional): random number generator,
+            or seed of a new one. Defaults to the global ``np.random`` state.
+        footprint (glass_cannon.footprint.Footprint, optional): footprint of
+            compact maps, used to restrict a full-sky ``sigma`` map to the
+            footprint pixels. Defaults to None.
+
+    Returns:
+        noisy_maps (numpy array): maps with noise, in the precision of ``maps``
+    """
+    rng = _generator(rng)
+    maps = np.asarray(maps)
+    sigma = np.asarray(sigma)
+    if footprint is not None and sigma.ndim and sigma.shape[-1] == footprint.npix:
+        sigma = footprint.compress(sigma)
+
+    dtype = np.result_type(maps.dtype, np.float32)
+    noise = rng.standard_normal(maps.shape).astype(dtype, copy=False)
+    noise *= sigma.astype(dtype, copy=False)
+    return np.add(maps, noise, out=noise)
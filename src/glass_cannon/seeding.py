@@ -0,0 +1,65 @@
+"""Reproducible random streams for simulation campaigns.
+
+Every simulation of a campaign is identified by the campaign seed and its
+index. From these, independent streams for the matter field generation,
+the noise and the foregrounds are derived with :class:`numpy.random.SeedSequence` spawn
+keys, so the streams of a simulation do not depend on which other
+simulations were run, in which order, or on which worker. Any subset of a
+campaign can therefore be regenerated bit-identically.
+
+The stream of kind ``k`` of simulation ``i`` is the same as
+``SeedSequence(seed).spawn(i + 1)[i].spawn(len(STREAMS))[k]``.
+"""
+
+import numpy as np
+
+# kinds of random streams of a simulation, in spawn order
+STREAMS = ("fields", "noise", "foregrounds")
+
+
+def simulation_seed(seed, index, stream="fields"):
+    """Seed sequence of one random stream of a simulation.
+
+    Parameters
+    ----------
+    seed : int or numpy.random.SeedSequence
+        Seed of the campaign. An integer is used as the entropy of a root
+        sequence.
+    index : int
+        Index of the simulation in the campaign.
+    stream : str, optional
+        Kind of stream, one of ``STREAMS``. Default is ``"fields"``.
+
+    Returns
+    -------
+    numpy.random.SeedSequence
+        Sequence of the stream, independent of all other streams of the
+        campaign.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    if stream not in STREAMS:
+        raise ValueError(f"unknown stream {stream!r}, expected one of {STREAMS}")
+    spawn_key = tuple(seed.spawn_key) + (int(index), STREAMS.index(stream))
+    return np.random.SeedSequence(seed.entropy, spawn_key=spawn_key,
+                                  pool_size=seed.pool_size)
+
+
+def simulation_rng(seed, index, stream="fields"):
+    """Random number generator of one stream of a simulation.
+
+    Parameters
+    ----------
+    seed : int or numpy.random.SeedSequence
+        Seed of the campaign.
+    index : int
+        Index of the simulation in the campaign.
+    stream : str, optional
+        Kind of stream, one of ``STREAMS``. Default is ``"fields"``.
+
+    Returns
+    -------
+    numpy.random.Generator
+        Generator of the stream, see :func:`simulation_seed`.
+    """
+    return np.random.default_rng(simulation_seed(seed, index, stream))
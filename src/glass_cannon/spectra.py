@@ -0,0 +1,242 @@
+"""Map-based estimation of auto and cross angular power spectra.
+
+This module measures the angular power spectra of the simulated tracer
+shells. Spherical harmonic coefficients are computed once per shell and
+tracer, and all shell-pair spectra for all tracer pairs are then formed from
+these coefficients without further transforms.
+
+The spectra are stacked along one axis, ordered by :func:`spectrum_pairs`:
+a block of shell pairs for every tracer pair. Auto-tracer blocks hold the
+shell pairs ``i <= j`` only, since the spectrum of shells ``(j, i)`` is the
+same. Cross-tracer blocks hold all ``nshells**2`` shell pairs, since tracer
+``a`` in shell ``i`` with tracer ``b`` in shell ``j`` differs from tracer
+``a`` in shell ``j`` with tracer ``b`` in shell ``i``.
+"""
+
+import numpy as np
+import healpy as hp
+
+
+def tracer_pairs(ntracers):
+    """Ordering of tracer pairs in the estimated spectra.
+
+    Auto-spectra of every tracer come first, followed by the cross-spectra
+    ``(a, b)`` with ``a < b``. For the tracers ``("galaxy", "HI")`` this
+    gives galaxy x galaxy, HI x HI and galaxy x HI.
+
+    Parameters
+    ----------
+    ntracers : int
+        Number of tracers.
+
+    Returns
+    -------
+    list of tuple
+        Pairs ``(a, b)`` of tracer indices.
+    """
+    autos = [(a, a) for a in range(ntracers)]
+    crosses = [(a, b) for a in range(ntracers) for b in range(a + 1, ntracers)]
+    return autos + crosses
+
+
+def shell_pairs(nshells, cross=False):
+    """Ordering of shell pairs in a block of the estimated spectra.
+
+    Parameters
+    ----------
+    nshells : int
+        Number of shells.
+    cross : bool, optional
+        If True, the pairs of a cross-tracer block, otherwise of an
+        auto-tracer block. Default is False.
+
+    Returns
+    -------
+    tuple of ndarray
+        Indices ``(i, j)`` of the shell pairs, ordered row by row: the
+        ``nshells * (nshells + 1) / 2`` pairs with ``i <= j`` for an
+        auto-tracer block, or all ``nshells**2`` pairs for a cross-tracer
+        block.
+    """
+    if cross:
+        return tuple(np.indices((nshells, nshells)).reshape(2, -1))
+    return np.triu_indices(nshells)
+
+
+def spectrum_pairs(ntracers, nshells):
+    """Ordering of all spectra in the estimated spectra.
+
+    Parameters
+    ----------
+    ntracers : int
+        Number of tracers.
+    nshells : int
+        Number of shells.
+
+    Returns
+    -------
+    tuple of ndarray
+        Tracer indices ``(a, b)`` and shell indices ``(i, j)`` of every
+        spectrum: the blocks of :func:`shell_pairs` for every pair of
+        :func:`tracer_pairs`, one after the other.
+
+    Examples
+    --------
+    Select the HI auto-spectra of every shell from spectra of the tracers
+    ``("galaxy", "HI")``:
+
+    >>> a, b, i, j = spectrum_pairs(2, 3)
+    >>> np.flatnonzero((a == 1) & (b == 1) & (i == j))
+    array([ 6,  9, 11])
+    """
+    blocks = []
+    for a, b in tracer_pairs(ntracers):
+        i, j = shell_pairs(nshells, cross=a != b)
+        blocks.append([np.full_like(i, a), np.full_like(i, b), i, j])
+    return tuple(np.concatenate(blocks, axis=1))
+
+
+def tracer_alms(maps, lmax, footprint=None):
+    """Spherical harmonic coefficients of tracer maps.
+
+    Parameters
+    ----------
+    maps : ndarray
+        HEALPix maps of shape ``(..., npix)``, e.g. ``(ntracers, nshells,
+        npix)``.
+    lmax : int
+        Maximum angular multipole.
+    footprint : glass_cannon.footprint.Footprint, optional
+        If given, ``maps`` hold the compact values of the footprint pixels.
+        They are expanded one map at a time into a full-sky buffer that is
+        zero outside the footprint. Default is None.
+
+    Returns
+    -------
+    ndarray
+        Complex coefficients in HEALPix ordering, of shape ``(..., nalm)``.
+    """
+    maps = np.asarray(maps)
+    flat = maps.reshape(-1, maps.shape[-1])
+    if footprint is None:
+        alms = hp.map2alm(flat, lmax=lmax, pol=False)
+    else:
+        full = np.zeros(footprint.npix)
+        alms = np.stack([
+            hp.map2alm(footprint.expand(values, out=full), lmax=lmax, pol=False)
+            for values in flat
+        ])
+    return np.reshape(alms, maps.shape[:-1] + (-1,))
+
+
+def cross_spectra(alms, lmax, dtype=np.float64):
+    """Auto and cross angular power spectra from harmonic coefficients.
+
+    Parameters
+    ----------
+    alms : ndarray
+        Coefficients of shape ``(ntracers, nshells, nalm)`` from
+        :func:`tracer_alms`.
+    lmax : int
+        Maximum angular multipole of ``alms``.
+    dtype : data-type, optional
+        Data type of the output. The sums are accumulated in the precision
+        of ``alms``. Default is ``np.float64``.
+
+    Returns
+    -------
+    ndarray
+        Spectra of shape ``(nspectra, lmax + 1)``, ordered as
+        :func:`spectrum_pairs`. The spectrum of ``(a, b, i, j)`` is that of
+        tracer ``a`` in shell ``i`` with tracer ``b`` in shell ``j``.
+    """
+    ntracers, nshells, _ = alms.shape
+
+    # reorder coefficients by ell so that spectra are sums over contiguous runs
+    ell, m = hp.Alm.getlm(lmax)
+    order = np.argsort(ell, kind="stable")
+    starts = np.searchsorted(ell[order], np.arange(lmax + 1))
+    weights = np.where(m[order] == 0, 1.0, 2.0)
+    norm = 1.0 / (2 * np.arange(lmax + 1) + 1)
+
+    alms = alms[..., order]
+    re, im = alms.real, alms.imag
+
+    nspectra = len(spectrum_pairs(ntracers, nshells)[0])
+    cls = np.empty((nspectra, lmax + 1), dtype=dtype)
+    k = 0
+    for a, b in tracer_pairs(ntracers):
+        for i in range(nshells):
+            # all pairs (i, j) of the row at once, j >= i for auto-tracer
+            # blocks and every j for cross-tracer blocks: Re(a_lm b_lm^*)
+            first = i if a == b else 0
+            prod = re[a, i] * re[b, first:] + im[a, i] * im[b, first:]
+            prod *= weights
+            cls[k:k + nshells - first] = np.add.reduceat(prod, starts, axis=-1) * norm
+            k += nshells - first
+
+    return cls
+
+
+def estimate_spectra(maps, lmax, dtype=None):
+    """Estimate all auto and cross spectra of a set of full-sky tracer maps.
+
+    Parameters
+    ----------
+    maps : ndarray
+        Tracer maps of shape ``(ntracers, nshells, npix)``, such as the
+        output of :func:`glass_cannon.glass_pipeline.convert_DM_to_tracers`.
+    lmax : int
+        Maximum angular multipole.
+    dtype : data-type, optional
+        Data type of the spectra. The transforms are computed in double
+        precision. Default is None, which uses the floating point type of
+        ``maps``, so that single precision maps give single precision
+        spectra.
+
+    Returns
+    -------
+    ndarray
+        Spectra of shape ``(nspectra, lmax + 1)``, ordered as
+        :func:`spectrum_pairs`, see :func:`cross_spectra`. For maps on a
+        survey footprint, see :func:`pseudo_spectra`.
+    """
+    if dtype is None:
+        dtype = np.result_type(np.asarray(maps).dtype, np.float32)
+    return cross_spectra(tracer_alms(maps, lmax), lmax, dtype)
+
+
+def pseudo_spectra(maps, lmax, footprint, dtype=None):
+    """Sky-fraction rescaled pseudo-spectra of tracer maps on a footprint.
+
+    The maps are zero outside the footprint and their spectra are divided
+    by the observed sky fraction. This is not a MASTER estimate: the
+    coupling of multipoles by the mask is not deconvolved, so the spectra
+    are smoothed and correlated over a range of multipoles set by the size
+    of the footprint, and biased on scales comparable to it. Compare them
+    with spectra computed in the same way, e.g. from simulations on the
+    same footprint, rather than with full-sky theory.
+
+    Parameters
+    ----------
+    maps : ndarray
+        Compact values of the footprint pixels, of shape ``(ntracers,
+        nshells, footprint.size)``.
+    lmax : int
+        Maximum angular multipole.
+    footprint : glass_cannon.footprint.Footprint
+        Survey footprint of the maps.
+    dtype : data-type, optional
+        Data type of the spectra, see :func:`estimate_spectra`.
+
+    Returns
+    -------
+    ndarray
+        Pseudo-spectra of shape ``(nspectra, lmax + 1)``, ordered as
+        :func:`spectrum_pairs`.
+    """
+    if dtype is None:
+        dtype = np.result_type(np.asarray(maps).dtype, np.float32)
+    cls = cross_spectra(tracer_alms(maps, lmax, footprint), lmax, dtype)
+    cls /= footprint.fsky
+    return cls
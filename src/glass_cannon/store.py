@@ -0,0 +1,463 @@
+"""Resumable, chunked on-disk store of simulation campaigns.
+
+A store is a directory holding the parameter table of a campaign and the
+simulation outputs in fixed-size chunks of rows::
+
+    store/
+        meta.json            chunk size and campaign settings
+        params.npy           parameter table of shape (n, 3)
+        footprint.npy        pixels of the survey footprint, if any
+        chunks/00000000/     one directory per completed chunk, holding
+            galaxy.npy       one .npy file per output, with the chunk rows
+            HI.npy           along the first axis
+            ...
+
+Every chunk is written to a temporary directory that is renamed into place
+only once complete, so a crashed campaign leaves no partial chunks and can
+be resumed by simulating the missing chunks only. Temporary directories
+left behind by crashed writers are removed when the store is reopened or a
+campaign is resumed. Chunks are independent
+files, which lets a pool of processes write concurrently, and they can be
+opened as memory maps.
+"""
+
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from glass_cannon.cosmo_setup import get_cosmology
+from glass_cannon.footprint import Footprint
+from glass_cannon.glass_pipeline import simulate_rows, simulator
+from glass_cannon.noisy import add_simulation_noise
+from glass_cannon.seeding import simulation_seed
+from glass_cannon.spectra import estimate_spectra, pseudo_spectra
+
+# options of the simulator that every run of a campaign must share
+CAMPAIGN_OPTIONS = ("zb", "length", "nside", "lmax", "dtype")
+
+
+class SimulationStore:
+    """Directory store of simulation outputs in chunks of rows.
+
+    Use :meth:`create` to start a new store and :meth:`open` to reopen an
+    existing one.
+
+    Parameters
+    ----------
+    path : str or os.PathLike
+        Directory of the store.
+
+    Attributes
+    ----------
+    footprint : glass_cannon.footprint.Footprint or None
+        Survey footprint of the campaign. The maps of a store with a
+        footprint hold the compact values of its pixels.
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        with open(os.path.join(self.path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.chunk_size = self.meta["chunk_size"]
+        self.params = np.load(os.path.join(self.path, "params.npy"), mmap_mode="r")
+        self.footprint = None
+        if "footprint_nside" in self.meta:
+            pixels = np.load(os.path.join(self.path, "footprint.npy"))
+            self.footprint = Footprint(self.meta["footprint_nside"], pixels)
+
+    @classmethod
+    def create(cls, path, params, chunk_size=64, footprint=None, **meta):
+        """Create a new store for a parameter table.
+
+        Parameters
+        ----------
+        path : str or os.PathLike
+            Directory of the store. It must not contain a store already.
+        params : ndarray
+            Parameter table of shape ``(n, 3)`` with columns ``h``,
+            ``OmegaC`` and ``OmegaB``.
+        chunk_size : int, optional
+            Number of rows per chunk. Default is 64.
+        footprint : glass_cannon.footprint.Footprint, optional
+            Survey footprint of the campaign. Only its pixels are simulated
+            and stored, see :func:`run_campaign`. Default is None.
+        **meta
+            Additional JSON-serialisable settings of the campaign.
+
+        Returns
+        -------
+        SimulationStore
+            The new store.
+        """
+        path = os.fspath(path)
+        if os.path.exists(os.path.join(path, "meta.json")):
+            raise FileExistsError(f"store already exists: {path}")
+        os.makedirs(os.path.join(path, "chunks"), exist_ok=True)
+        _save_atomic(os.path.join(path, "params.npy"), np.asarray(params, dtype=float))
+        if footprint is not None:
+            _save_atomic(os.path.join(path, "footprint.npy"), footprint.pixels)
+            meta = dict(meta, footprint_nside=footprint.nside)
+        _dump_atomic(os.path.join(path, "meta.json"), dict(meta, chunk_size=chunk_size))
+        return cls(path)
+
+    @classmethod
+    def open(cls, path):
+        """Open an existing store, removing stale temporary chunks."""
+        store = cls(path)
+        store.remove_stale()
+        return store
+
+    def update_meta(self, **meta):
+        """Add settings to ``meta.json``, replacing the file atomically.
+
+        Parameters
+        ----------
+        **meta
+            JSON-serialisable settings of the campaign.
+        """
+        meta = dict(self.meta, **meta)
+        _dump_atomic(os.path.join(self.path, "meta.json"), meta)
+        self.meta = meta
+
+    def remove_stale(self, max_age=3600.0):
+        """Remove temporary chunk directories left by crashed writers.
+
+        A chunk is written to its temporary directory within seconds, so
+        directories that have not changed for ``max_age`` belong to writers
+        that died. Younger ones may belong to live writers and are kept.
+
+        Parameters
+        ----------
+        max_age : float, optional
+            Age in seconds after which a temporary directory is stale.
+            Default is one hour.
+
+        Returns
+        -------
+        list of str
+            Names of the removed directories.
+        """
+        chunks = os.path.join(self.path, "chunks")
+        now = time.time()
+        removed = []
+        for name in os.listdir(chunks):
+            if not name.startswith(".tmp-"):
+                continue
+            path = os.path.join(chunks, name)
+            try:
+                if now - os.path.getmtime(path) < max_age:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+        return removed
+
+    @property
+    def nrows(self):
+        """Number of rows in the parameter table."""
+        return len(self.params)
+
+    @property
+    def nchunks(self):
+        """Number of chunks needed to cover the parameter table."""
+        return -(-self.nrows // self.chunk_size)
+
+    def chunk_rows(self, k):
+        """Rows covered by chunk ``k``."""
+        return range(k * self.chunk_size, min((k + 1) * self.chunk_size, self.nrows))
+
+    def chunk_path(self, k):
+        """Directory of chunk ``k``."""
+        return os.path.join(self.path, "chunks", f"{k:08d}")
+
+    def completed_chunks(self):
+        """Sorted list of the chunks that have been committed."""
+        chunks = []
+        for name in os.listdir(os.path.join(self.path, "chunks")):
+            if name.isdigit():
+                chunks.append(int(name))
+        return sorted(chunks)
+
+    def missing_chunks(self):
+        """Sorted list of the chunks that remain to be simulated."""
+        done = set(self.completed_chunks())
+        return [k for k in range(self.nchunks) if k not in done]
+
+    def append(self, params):
+        """Append rows to the parameter table.
+
+        Only one process may append at a time. Rows can only be appended
+        while the last chunk is full or not yet committed, so that the
+        committed chunks keep their rows.
+
+        Parameters
+        ----------
+        params : ndarray
+            Rows of shape ``(m, 3)`` to append.
+        """
+        old = np.asarray(self.params)
+        short = self.nchunks * self.chunk_size - self.nrows
+        if short and self.nchunks - 1 in self.completed_chunks():
+            raise ValueError("the last chunk is complete but short; "
+                             "create a new store to extend this campaign")
+        table = np.concatenate([old, np.asarray(params, dtype=float)])
+        _save_atomic(os.path.join(self.path, "params.npy"), table)
+        self.params = np.load(os.path.join(self.path, "params.npy"), mmap_mode="r")
+
+    def write_chunk(self, k, arrays):
+        """Commit the outputs of a chunk atomically.
+
+        Parameters
+        ----------
+        k : int
+            Index of the chunk.
+        arrays : dict of ndarray
+            Outputs of the chunk, each with one entry per row of the chunk
+            along the first axis.
+
+        Returns
+        -------
+        bool
+            True if the chunk was committed, False if another writer had
+            committed it first.
+        """
+        nrows = len(self.chunk_rows(k))
+        for name, array in arrays.items():
+            if len(array) != nrows:
+                raise ValueError(f"{name} has {len(array)} rows, chunk {k} has {nrows}")
+
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.join(self.path, "chunks"))
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, f"{name}.npy"), array)
+            os.rename(tmp, self.chunk_path(k))
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if os.path.isdir(self.chunk_path(k)):
+                return False
+            raise
+        return True
+
+    def read_chunk(self, k, name, mmap=True):
+        """Read one output of a committed chunk.
+
+        Parameters
+        ----------
+        k : int
+            Index of the chunk.
+        name : str
+            Name of the output.
+        mmap : bool, optional
+            Return a read-only memory map instead of loading the data.
+            Default is True.
+
+        Returns
+        -------
+        ndarray
+            Output of shape ``(nrows, ...)`` for the rows of the chunk.
+        """
+        return np.load(os.path.join(self.chunk_path(k), f"{name}.npy"),
+                       mmap_mode="r" if mmap else None)
+
+    def iter_chunks(self, name, mmap=True):
+        """Iterate over ``(rows, array)`` for every committed chunk."""
+        for k in self.completed_chunks():
+            yield self.chunk_rows(k), self.read_chunk(k, name, mmap=mmap)
+
+    def load(self, name):
+        """Load one output of all committed chunks.
+
+        Returns
+        -------
+        tuple of ndarray
+            The row indices and the concatenated output.
+        """
+        rows, arrays = [], []
+        for chunk_rows, array in self.iter_chunks(name, mmap=False):
+            rows.extend(chunk_rows)
+            arrays.append(array)
+        if not arrays:
+            return np.array([], dtype=int), None
+        return np.array(rows), np.concatenate(arrays)
+
+
+def _save_atomic(path, array):
+    """Write an array to ``path`` through a temporary file."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _dump_atomic(path, meta):
+    """Write settings as JSON to ``path`` through a temporary file."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _campaign_settings(seed, maps, spectra_lmax, kwargs):
+    """JSON description of the settings that every run of a campaign shares."""
+    defaults = inspect.signature(simulator).parameters
+    options = {name: kwargs.get(name, defaults[name].default) for name in CAMPAIGN_OPTIONS}
+    for name in ("length", "nside", "lmax"):
+        if isinstance(options[name], (int, np.integer)):
+            options[name] = int(options[name])
+    options["zb"] = np.asarray(options["zb"], dtype=float).tolist()
+    options["dtype"] = np.dtype(options["dtype"]).name
+    if spectra_lmax is not None:
+        spectra_lmax = int(spectra_lmax)
+    return dict(options, seed=int(seed), maps=bool(maps), spectra_lmax=spectra_lmax)
+
+
+def _run_chunk(path, k, seed, maps, spectra_lmax, noise_cov, kwargs):
+    """Simulate and commit one chunk of a store.
+
+    Module-level so that it can be sent to worker processes.
+    """
+    store = SimulationStore(path)
+    rows = store.chunk_rows(k)
+    params = np.asarray(store.params[rows.start:rows.stop])
+    # the stream of a row depends only on the campaign seed and row index
+    seeds = [simulation_seed(seed, row, "fields") for row in rows]
+    if store.footprint is not None:
+        kwargs = dict(kwargs, footprint=store.footprint)
+
+    results, _ = simulate_rows(rows, params, seeds, kwargs)
+
+    arrays = {}
+    if maps:
+        arrays["galaxy"] = np.stack([galaxy for _, galaxy, _ in results])
+        arrays["HI"] = np.stack([hi for _, _, hi in results])
+    if spectra_lmax is not None:
+        if store.footprint is None:
+            spectra = [estimate_spectra(np.stack([galaxy, hi]), spectra_lmax)
+                       for _, galaxy, hi in results]
+        else:
+            spectra = [pseudo_spectra(np.stack([galaxy, hi]), spectra_lmax, store.footprint)
+                       for _, galaxy, hi in results]
+        arrays["spectra"] = np.stack(spectra)
+        if noise_cov is not None:
+            arrays["noisy_spectra"] = add_simulation_noise(arrays["spectra"], noise_cov,
+                                                           seed, rows)
+    return k, store.write_chunk(k, arrays)
+
+
+def run_campaign(store, seed=42, workers=None, maps=True, spectra_lmax=None, noise_cov=None,
+                 pseudo=False, **kwargs):
+    """Simulate every missing chunk of a store.
+
+    Completed chunks are skipped, so an interrupted campaign is resumed by
+    calling this function again. Row ``i`` always uses the field stream of
+    index ``i`` from ``seed``, see :mod:`glass_cannon.seeding`, as in
+    :func:`glass_cannon.glass_pipeline.simulate_batch`, so the outputs do
+    not depend on the chunking, the number of workers or interruptions.
+
+    Parameters
+    ----------
+    store : SimulationStore
+        Store to fill.
+    seed : int, optional
+        Entropy of the campaign random streams. Default is 42.
+    workers : int, optional
+        Number of worker processes, each writing whole chunks. Default is
+        None, which uses ``os.cpu_count()``. With ``workers=1`` the chunks
+        are simulated in the calling process.
+    maps : bool, optional
+        Store the ``galaxy`` and ``HI`` maps. Default is True.
+    spectra_lmax : int, optional
+        If given, also store the auto and cross ``spectra`` of the maps up
+        to this multipole, of shape ``(nspectra, spectra_lmax + 1)`` per row
+        and ordered as :func:`glass_cannon.spectra.spectrum_pairs`, see
+        :func:`glass_cannon.spectra.estimate_spectra`. Default is None.
+    noise_cov : ndarray, optional
+        If given, also store the ``noisy_spectra`` with Gaussian noise of
+        this covariance over the multipoles. The noise of row ``i`` is drawn
+        from its noise stream, see
+        :func:`glass_cannon.noisy.add_simulation_noise`. Requires
+        ``spectra_lmax``. Default is None.
+    pseudo : bool, optional
+        Accept sky-fraction rescaled pseudo-spectra, which are not
+        deconvolved for the mask, as the ``spectra`` of a store with a
+        footprint, see :func:`glass_cannon.spectra.pseudo_spectra`. Without
+        it, ``spectra_lmax`` raises a :class:`ValueError` for such a store.
+        Default is False.
+    **kwargs
+        Options passed to :func:`glass_cannon.glass_pipeline.simulator`,
+        such as ``length``, ``zb`` or ``dtype``. All rows share one ``zb``
+        so that their maps have the same shells. If not given, it is that
+        of the ``emulator``, or shells of 200 Mpc in comoving distance for
+        the cosmology of the first row, as in
+        :func:`glass_cannon.glass_pipeline.simulate_batch`. The spectra are
+        stored in the precision of the maps.
+
+    Returns
+    -------
+    list of int
+        The chunks committed by this call.
+
+    Raises
+    ------
+    ValueError
+        If ``seed``, ``maps``, ``spectra_lmax`` or any of
+        ``CAMPAIGN_OPTIONS`` differ from the first run of the store. These
+        settings, including the shared ``zb``, are saved under
+        ``"campaign"`` in ``meta.json`` by the first run, so that a resumed
+        campaign cannot silently mix simulations of different settings.
+    """
+    if noise_cov is not None and spectra_lmax is None:
+        raise ValueError("noise_cov requires spectra_lmax")
+    if spectra_lmax is not None and store.footprint is not None and not pseudo:
+        raise ValueError("the spectra of a store with a footprint are pseudo-spectra "
+                         "that are not deconvolved for the mask; pass pseudo=True "
+                         "to store them")
+
+    stored = store.meta.get("campaign")
+    if kwargs.get("zb") is None:
+        if kwargs.get("emulator") is not None:
+            zb = kwargs["emulator"].zb
+        elif stored is not None:
+            zb = np.array(stored["zb"])
+        else:
+            h, OmegaC, OmegaB = store.params[0]
+            zb = get_cosmology(h=h, Oc=OmegaC, Ob=OmegaB).zb
+        kwargs = dict(kwargs, zb=zb)
+
+    settings = _campaign_settings(seed, maps, spectra_lmax, kwargs)
+    if stored is None:
+        store.update_meta(campaign=settings)
+    elif stored != settings:
+        differences = ", ".join(f"{name}={settings[name]!r} (was {stored.get(name)!r})"
+                                for name in settings if settings[name] != stored.get(name))
+        raise ValueError(f"settings differ from the first run of the campaign: {differences}")
+
+    store.remove_stale()
+    missing = store.missing_chunks()
+    tasks = [(store.path, k, seed, maps, spectra_lmax, noise_cov, kwargs) for k in missing]
+
+    if workers is None:
+        workers = os.cpu_count()
+
+    if workers == 1:
+        results = [_run_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_chunk, *zip(*tasks))) if tasks else []
+
+    return [k for k, committed in results if committed]
@@ -0,0 +1,185 @@
+"""Expected tracer spectra from the shell matter spectra.
+
+Every tracer is an affine function ``offset(z) + scale(z) * delta_m`` of the
+matter overdensity, see :mod:`glass_cannon.tracers`, so the expected angular
+power spectrum of tracers ``a`` and ``b`` in shells ``i`` and ``j`` is
+``scale_a(z_i) * scale_b(z_j) * C_ij``, plus the monopole of the offsets.
+As in the simulator, the matter spectra of shells more than
+:data:`glass_cannon.matter.NCORR` apart are taken to vanish.
+This module evaluates these spectra for all tracer and shell pairs, and for
+many parameter points, with array operations instead of generating maps. The
+output has the layout of :func:`glass_cannon.spectra.estimate_spectra`, so
+it can be compared with the spectra measured on simulated maps.
+"""
+
+import numpy as np
+
+from glass_cannon.cosmo_setup import get_cosmology
+from glass_cannon.Cls import angular_power_spectrum
+from glass_cannon.glass_pipeline import TRACERS
+from glass_cannon.matter import NCORR
+from glass_cannon.spectra import spectrum_pairs
+from glass_cannon.tracers import tracer_coefficients
+
+
+def glass_index(i, j):
+    """Index of the spectrum of shells ``i`` and ``j`` in GLASS ordering.
+
+    GLASS orders the spectra of ``n`` shells as ``(0, 0), (1, 1), (1, 0),
+    (2, 2), (2, 1), (2, 0), ...``.
+
+    Parameters
+    ----------
+    i, j : int or ndarray
+        Shell indices, in any order.
+
+    Returns
+    -------
+    int or ndarray
+        Index of the spectrum in the GLASS list.
+    """
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    return j * (j + 1) // 2 + (j - i)
+
+
+def tracer_spectra(cls, offset, scale, pixwin=None, ncorr=None):
+    """Auto and cross tracer spectra from shell matter spectra.
+
+    Parameters
+    ----------
+    cls : array_like
+        Matter spectra in GLASS ordering, of shape ``(..., ncls, lmax + 1)``
+        for any number of leading parameter axes.
+    offset, scale : ndarray
+        Tracer coefficients of shape ``(..., ntracers, nshells)``, see
+        :func:`glass_cannon.tracers.tracer_coefficients`.
+    pixwin : ndarray, optional
+        HEALPix pixel window of the maps, of shape ``(lmax + 1,)``. The
+        spectra are multiplied by its square. Default is None.
+    ncorr : int, optional
+        Number of neighbouring shells with correlated matter fields; the
+        matter spectra of shells further apart are set to zero. Default is
+        None, which keeps all shell pairs.
+
+    Returns
+    -------
+    ndarray
+        Spectra of shape ``(..., nspectra, lmax + 1)``, ordered as
+        :func:`glass_cannon.spectra.spectrum_pairs`.
+    """
+    cls = np.asarray(cls, dtype=float)
+    offset = np.asarray(offset, dtype=float)
+    scale = np.asarray(scale, dtype=float)
+    ntracers, nshells = scale.shape[-2:]
+
+    a, b, i, j = spectrum_pairs(ntracers, nshells)
+
+    # coefficients of shape (..., nspectra)
+    coefficient = scale[..., a, i] * scale[..., b, j]
+    if ncorr is not None:
+        coefficient = np.where(np.abs(i - j) > ncorr, 0.0, coefficient)
+    spectra = coefficient[..., np.newaxis] * cls[..., glass_index(i, j), :]
+
+    # constant offsets only contribute to the monopole, a_00 = sqrt(4 pi) offset
+    spectra[..., 0] += 4 * np.pi * offset[..., a, i] * offset[..., b, j]
+
+    if pixwin is not None:
+        spectra *= np.asarray(pixwin)[:spectra.shape[-1]]**2
+
+    return spectra
+
+
+def theory_spectra(cls, shells, tracers=("galaxy", "HI"), nside=None, ncorr=NCORR):
+    """Expected tracer spectra of the simulated maps for a set of shells.
+
+    Parameters
+    ----------
+    cls : array_like
+        Matter spectra of ``shells`` in GLASS ordering, of shape
+        ``(..., ncls, lmax + 1)``, e.g. from
+        :func:`glass_cannon.Cls.angular_power_spectrum` or
+        :meth:`glass_cannon.emulator.ClsEmulator.predict`.
+    shells : Sequence
+        GLASS radial window shells with a ``zeff`` attribute.
+    tracers : Sequence of str, optional
+        Names of the tracers in :data:`glass_cannon.glass_pipeline.TRACERS`.
+        Default is ``("galaxy", "HI")``.
+    nside : int, optional
+        HEALPix resolution of the maps, whose pixel window is applied to
+        the spectra as in the simulated maps. Default is None, which
+        applies no pixel window.
+    ncorr : int or None, optional
+        Number of neighbouring shells with correlated matter fields, see
+        :func:`tracer_spectra`. Default is
+        :data:`glass_cannon.matter.NCORR`, as in the simulator.
+
+    Returns
+    -------
+    ndarray
+        Spectra of shape ``(..., nspectra, lmax + 1)``.
+    """
+    offset, scale = tracer_coefficients(shells, [TRACERS[name] for name in tracers])
+    pixwin = None
+    if nside is not None:
+        import healpy as hp
+
+        pixwin = hp.pixwin(nside, lmax=np.shape(cls)[-1] - 1)
+    return tracer_spectra(cls, offset, scale, pixwin, ncorr)
+
+
+def predict_spectra(params, lmax, zb=None, emulator=None, cls_cache=None,
+                    tracers=("galaxy", "HI"), nside=None):
+    """Expected tracer spectra at many parameter points.
+
+    With an emulator, the matter spectra of all points are predicted in one
+    call and the tracer spectra formed in one array operation. Otherwise
+    the matter spectra are computed with CAMB point by point.
+
+    Parameters
+    ----------
+    params : array_like
+        Parameter points of shape ``(n, 3)`` with columns ``h``,
+        ``OmegaC`` and ``OmegaB``.
+    lmax : int
+        Maximum angular multipole.
+    zb : ndarray, optional
+        Redshift boundaries of the shells, shared by all points. Default is
+        None, which uses shells of 200 Mpc in comoving distance for the
+        first point. With an emulator, it must match ``emulator.zb``.
+    emulator : glass_cannon.emulator.ClsEmulator, optional
+        Validated emulator of the matter spectra, trained up to at least
+        ``lmax``. Default is None.
+    cls_cache : glass_cannon.cache.DiskCache, optional
+        On-disk cache of the CAMB matter spectra. Default is None.
+    tracers : Sequence of str, optional
+        Names of the tracers. Default is ``("galaxy", "HI")``.
+    nside : int, optional
+        HEALPix resolution of the simulated maps, see
+        :func:`theory_spectra`. Default is None.
+
+    Returns
+    -------
+    ndarray
+        Spectra of shape ``(n, nspectra, lmax + 1)``.
+    """
+    params = np.atleast_2d(np.asarray(params, dtype=float))
+
+    if emulator is not None:
+        emulator.check_zb(zb)
+        emulator.check()
+        if lmax > emulator.lmax:
+            raise ValueError(f"emulator was trained up to lmax={emulator.lmax}, not {lmax}")
+        cls = emulator.predict(params)[..., :lmax + 1]
+        shells = emulator.shells
+    else:
+        if zb is None:
+            h, OmegaC, OmegaB = params[0]
+            zb = get_cosmology(h=h, Oc=OmegaC, Ob=OmegaB).zb
+        cls = []
+        for h, OmegaC, OmegaB in params:
+            pars = get_cosmology(h=h, Oc=OmegaC, Ob=OmegaB).pars
+            point_cls, shells = angular_power_spectrum(pars, lmax, zb, cache=cls_cache)
+            cls.append(np.stack(point_cls))
+        cls = np.stack(cls)
+
+    return theory_spectra(cls, shells, tracers, nside)
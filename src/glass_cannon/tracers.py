@@ -0,0 +1,126 @@
+"""Fused kernel to derive tracer fields from matter overdensity shells.
+
+Every tracer in the package is an affine function of the matter overdensity,
+``tracer = offset(z) + scale(z) * delta_m``: the galaxy overdensity has no
+offset and a scale given by the galaxy bias, while the HI brightness
+temperature has offset ``T_HI_bar(z)`` and scale ``T_HI_bar(z) * b_HI(z)``.
+This module evaluates the per-shell coefficients once and writes all tracers
+for each matter shell into preallocated buffers in place, without the
+temporaries of evaluating the formulas map by map.
+"""
+
+import numpy as np
+
+
+def tracer_coefficients(shells, models):
+    """Evaluate per-shell tracer coefficients.
+
+    Parameters
+    ----------
+    shells : Sequence
+        Sequence of GLASS radial window shells. Each must provide a
+        ``zeff`` attribute giving the effective redshift of the shell.
+    models : Sequence of callable
+        One function per tracer, taking an array of redshifts and returning
+        the pair ``(offset, scale)`` of arrays at these redshifts.
+
+    Returns
+    -------
+    tuple of ndarray
+        Arrays ``offset`` and ``scale`` of shape ``(ntracers, nshells)``.
+    """
+    z = np.array([shell.zeff for shell in shells], dtype=float)
+    offset = np.empty((len(models), len(z)))
+    scale = np.empty((len(models), len(z)))
+    for k, model in enumerate(models):
+        offset[k], scale[k] = model(z)
+    return offset, scale
+
+
+def allocate_tracer_maps(ntracers, nshells, npix, dtype=np.float64):
+    """Allocate a contiguous output buffer for tracer maps.
+
+    Parameters
+    ----------
+    ntracers, nshells, npix : int
+        Number of tracers, shells and pixels.
+    dtype : data-type, optional
+        Data type of the maps, e.g. ``np.float32`` to halve memory.
+        Default is ``np.float64``.
+
+    Returns
+    -------
+    ndarray
+        Uninitialised array of shape ``(ntracers, nshells, npix)``.
+    """
+    return np.empty((ntracers, nshells, npix), dtype=dtype)
+
+
+def fill_tracer_shell(delta_m, offset, scale, out):
+    """Write all tracer maps of one shell in place.
+
+    Parameters
+    ----------
+    delta_m : ndarray
+        Matter overdensity map of the shell.
+    offset, scale : ndarray
+        Coefficients of the shell, one per tracer.
+    out : ndarray
+        Output of shape ``(ntracers, npix)``, overwritten in place.
+
+    Returns
+    -------
+    ndarray
+        The ``out`` array.
+    """
+    np.multiply(scale[:, np.newaxis], delta_m, out=out, casting="same_kind")
+    np.add(out, offset[:, np.newaxis], out=out, casting="same_kind")
+    return out
+
+
+def fill_tracer_maps(matter, offset, scale, out=None, dtype=np.float64):
+    """Write tracer maps for a sequence of matter shells.
+
+    Each matter field is visited exactly once, so ``matter`` may be a lazy
+    generator.
+
+    Parameters
+    ----------
+    matter : Iterable of ndarray
+        Matter overdensity fields, one per shell.
+    offset, scale : ndarray
+        Coefficients of shape ``(ntracers, nshells)`` from
+        :func:`tracer_coefficients`.
+    out : ndarray, optional
+        Preallocated output of shape ``(ntracers, nshells, npix)``, e.g.
+        from :func:`allocate_tracer_maps`. Default is None, which allocates
+        it from the size of the first matter field.
+    dtype : data-type, optional
+        Data type of the output if it is allocated. Default is
+        ``np.float64``.
+
+    Returns
+    -------
+    ndarray
+        Tracer maps of shape ``(ntracers, nshells, npix)``. If ``matter``
+        yields fewer fields than there are shells, only the shells that
+        were filled are returned.
+
+    Raises
+    ------
+    ValueError
+        If ``matter`` yields more fields than there are shells.
+    """
+    ntracers, nshells = offset.shape
+    count = 0
+    for i, delta_m in enumerate(matter):
+        if i == nshells:
+            raise ValueError(f"matter has more fields than the {nshells} shells")
+        if out is None:
+            out = allocate_tracer_maps(ntracers, nshells, delta_m.shape[-1], dtype)
+        fill_tracer_shell(delta_m, offset[:, i], scale[:, i], out[:, i])
+        count += 1
+    if out is None:
+        out = allocate_tracer_maps(ntracers, 0, 0, dtype)
+    # only the shells that were actually produced by ``matter``
+    return out[:, :count]
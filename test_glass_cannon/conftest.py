@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from glass_cannon.emulator import ClsEmulator, latin_hypercube
+
+
+def _toy_cls(params, ncls=3, lmax=32):
+    """Smooth stand-in for CAMB spectra of three shell pairs."""
+    ell = np.arange(lmax + 1)
+    h, Oc, Ob = np.atleast_2d(params).T
+    amp = (Oc + Ob)[:, None, None] * np.array([1.0, 0.5, 0.3])[None, :, None]
+    return amp * 1e-4 / (1 + ell * h[:, None, None])**1.5
+
+
+@pytest.fixture
+def bounds():
+    """Parameter bounds of the toy emulator as ``[h, OmegaC, OmegaB]``."""
+    return [[0.6, 0.8], [0.2, 0.3], [0.04, 0.06]]
+
+
+@pytest.fixture
+def toy_cls():
+    """Function giving toy spectra of shape ``(n, 3, lmax + 1)`` for parameters."""
+    return _toy_cls
+
+
+@pytest.fixture
+def toy_emulator(bounds, toy_cls):
+    """Validated emulator of the toy spectra of two shells, instead of CAMB."""
+    design = latin_hypercube(bounds, 100, seed=42)
+    emulator = ClsEmulator(design, toy_cls(design), np.array([0.0, 0.2, 0.4, 0.6]),
+                           bounds=bounds)
+    test_design = latin_hypercube(bounds, 20, seed=1)
+    emulator.validate(test_design, toy_cls(test_design))
+    return emulator
@@ -8,7 +8,7 @@ import glass
 import glass.ext.camb
 
 # import function to test
-from glass_cannon.Cls import angular_power_spectrum
+from glass_cannon.Cls import angular_power_spectrum, make_cls_cache
 
 def test_angular_power_spectrum():
 
@@ -45,3 +45,25 @@ def test_angular_power_spectrum():
 
 
 
+def test_angular_power_spectrum_cache(tmp_path):
+
+    h = 0.7
+    pars = camb.set_params(
+        H0=100 * h,
+        omch2=0.25 * h**2,
+        ombh2=0.05 * h**2,
+        NonLinear=camb.model.NonLinear_both,
+    )
+    lmax = 16
+    zb = np.array([0.0, 0.2, 0.4])
+
+    cache = make_cls_cache(tmp_path)
+
+    cls, shells = angular_power_spectrum(pars, lmax, zb, cache=cache)
+    cached_cls, cached_shells = angular_power_spectrum(pars, lmax, zb, cache=cache)
+
+    assert cache.misses == 1
+    assert cache.hits == 1
+    assert all(np.array_equal(a, b) for a, b in zip(cls, cached_cls))
+    assert all(np.array_equal(a.wa, b.wa) for a, b in zip(shells, cached_shells))
+    assert [s.zeff for s in shells] == [s.zeff for s in cached_shells]
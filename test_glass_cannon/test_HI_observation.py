@@ -0,0 +1,108 @@
+import glass
+import healpy as hp
+import numpy as np
+import pytest
+
+from glass_cannon.footprint import Footprint
+from glass_cannon.HI_observation import (
+    beam_fwhm, beam_window, foreground_cl, foreground_template, frequency, observe_HI)
+from glass_cannon.seeding import simulation_seed
+
+
+def test_beam():
+
+    nu = frequency(0.5)
+    assert np.isclose(nu, 1420.405751768 / 1.5)
+    fwhm = beam_fwhm(nu, dish_diameter=15.0)
+    assert np.isclose(fwhm, 1.22 * 299792458.0 / (nu * 1e6) / 15.0)
+
+    window = beam_window(float(fwhm), 64)
+    assert np.allclose(window, hp.gauss_beam(fwhm, lmax=64))
+    assert beam_window(float(fwhm), 64) is window
+
+def test_foreground_template():
+
+    lmax = 64
+    template = foreground_template(700.0, 2.4, lmax, seed=1)
+    assert foreground_template(700.0, 2.4, lmax, seed=1) is template
+
+    cl = hp.alm2cl(template)
+    expected = foreground_cl(700.0, 2.4, lmax)
+    assert np.allclose(cl[2:].mean() / expected[2:].mean(), 1, atol=0.2)
+
+def test_observe_HI():
+
+    nside, lmax = 16, 32
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    maps = np.random.default_rng(seed=2).normal(size=(2, 12 * nside**2))
+
+    # without beam and foregrounds the band-limited maps are unchanged
+    alms = hp.map2alm(maps, lmax=lmax, pol=False)
+    plain = observe_HI(maps, shells, lmax, dish_diameter=None, foregrounds=None)
+    assert np.allclose(plain, hp.alm2map(list(alms), nside, lmax=lmax, pol=False))
+
+    # beam and foreground coefficients per shell
+    observed = observe_HI(maps, shells, lmax, foregrounds={"fg": (1.0, 2.0, 2.5)},
+                          return_alms=True)
+    nu = frequency([shell.zeff for shell in shells])
+    template = foreground_template(1.0, 2.0, lmax, (0, 0))
+    ell, _ = hp.Alm.getlm(lmax)
+    for i in range(2):
+        beam = hp.gauss_beam(beam_fwhm(nu[i]), lmax=lmax)[ell]
+        expected = (alms[i] + (130.0 / nu[i])**2.5 * template) * beam
+        assert np.allclose(observed[i], expected)
+
+def test_observe_HI_foreground_seed():
+
+    nside, lmax = 16, 32
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4]))
+    maps = np.zeros((1, 12 * nside**2))
+    foregrounds = {"fg": (1.0, 2.0, 2.5)}
+
+    def observe(foreground_seed):
+        return observe_HI(maps, shells, lmax, dish_diameter=None, foregrounds=foregrounds,
+                          foreground_seed=foreground_seed, return_alms=True)
+
+    # the default foreground sky is shared, per-simulation streams are not
+    assert np.array_equal(observe(0), observe(0))
+    first = observe(simulation_seed(3, 0, "foregrounds"))
+    assert np.array_equal(first, observe(simulation_seed(3, 0, "foregrounds")))
+    assert not np.allclose(first, observe(simulation_seed(3, 1, "foregrounds")))
+    assert not np.allclose(first, observe(0))
+
+    # only the shared foreground sky is kept in the template cache
+    cached = foreground_template.cache_info().currsize
+    observe(simulation_seed(3, 2, "foregrounds"))
+    assert foreground_template.cache_info().currsize == cached
+
+def test_observe_HI_independent_foregrounds():
+
+    nside, lmax = 16, 64
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4]))
+    maps = np.zeros((1, 12 * nside**2))
+    foregrounds = {"a": (1.0, 2.0, 0.0), "b": (1.0, 2.0, 0.0)}
+
+    # independent components add in power, coherent ones would double it
+    observed = observe_HI(maps, shells, lmax, dish_diameter=None, foregrounds=foregrounds,
+                          return_alms=True)
+    cl = hp.alm2cl(observed[0])
+    expected = sum(foreground_cl(A, beta, lmax) for A, beta, _ in foregrounds.values())
+    assert np.isclose(np.mean(cl[2:] / expected[2:]), 1, atol=0.2)
+
+def test_observe_HI_footprint():
+
+    nside, lmax = 16, 32
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    footprint = Footprint.disc(nside, lon=0.0, lat=30.0, radius=40.0)
+    maps = np.random.default_rng(seed=4).normal(size=(2, 12 * nside**2)).astype(np.float32)
+    compact = footprint.compress(maps)
+
+    # compact maps are observed as full-sky maps that are zero outside the footprint
+    observed = observe_HI(compact, shells, lmax, footprint=footprint)
+    expected = observe_HI(maps * footprint.mask(), shells, lmax)
+    assert observed.shape == compact.shape
+    assert observed.dtype == np.float32
+    assert np.allclose(observed, footprint.compress(expected), rtol=1e-5, atol=1e-5)
+
+    with pytest.raises(ValueError):
+        observe_HI(compact, shells, lmax, nside=8, footprint=footprint)
@@ -1,5 +1,6 @@
 import numpy as np
 import glass
+import glass.ext.camb
 import camb
 
 from glass_cannon.HI_tracer import b_HI, T_HI_bar, convert_DM_to_HI
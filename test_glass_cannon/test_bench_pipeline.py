@@ -0,0 +1,62 @@
+import importlib.util
+import json
+import os
+
+import glass
+import numpy as np
+
+BENCH = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "bench_pipeline.py")
+
+
+def load_bench():
+    spec = importlib.util.spec_from_file_location("bench_pipeline", BENCH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def toy_angular_power_spectrum(pars, lmax, zb, **kwargs):
+    """Uncorrelated shells with a smooth spectrum, instead of CAMB."""
+    shells = glass.linear_windows(zb)
+    ell = np.arange(lmax + 1)
+    cls = [1e-4 / (1 + ell)**2 if i == j else np.zeros(lmax + 1)
+           for i in range(len(shells)) for j in range(i, -1, -1)]
+    return cls, shells
+
+def test_bench_pipeline(tmp_path, monkeypatch, capsys):
+
+    bench = load_bench()
+    monkeypatch.setattr(bench, "angular_power_spectrum", toy_angular_power_spectrum)
+
+    output = tmp_path / "results.json"
+    argv = ["--nside", "8", "--zmax", "0.3"]
+    assert bench.main(argv + ["--output", str(output)]) == 0
+
+    with open(output) as f:
+        recorded = json.load(f)
+    results = recorded["results"]
+    assert recorded["meta"]["cpu_count"] == os.cpu_count()
+    assert [r["stage"] for r in results] == [
+        "cosmology", "angular_power_spectrum", "run_discretized_cls",
+        "run_solve_gauss_spectra", "run_generate", "tracer_conversion", "do_CCA", "add_noise"]
+    assert bench.compare(results, results, 0.2) == []
+
+    # a much faster baseline of the same configuration flags every stage
+    for r in results:
+        r["wall"] /= 1000
+    with open(tmp_path / "baseline.json", "w") as f:
+        json.dump(recorded, f)
+    assert bench.main(argv + ["--baseline", str(tmp_path / "baseline.json")]) == 1
+
+    # a baseline from another machine is still compared, with a warning
+    recorded["meta"]["cpu"] = "other"
+    with open(tmp_path / "baseline.json", "w") as f:
+        json.dump(recorded, f)
+    assert bench.main(argv + ["--baseline", str(tmp_path / "baseline.json")]) == 1
+    assert "WARNING: baseline from another machine, cpu:" in capsys.readouterr().out
+
+def test_machine_mismatch():
+
+    bench = load_bench()
+    meta = bench.machine_info()
+    assert bench.machine_mismatch(meta, dict(meta)) == []
+    assert len(bench.machine_mismatch(meta, {})) == 3
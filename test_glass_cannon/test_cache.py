@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+
+from glass_cannon.cache import DiskCache, MemoryCache, clear_caches, hash_key
+
+
+def test_hash_key():
+
+    a = np.arange(10.0)
+
+    assert hash_key("x", 1, a) == hash_key("x", 1, a.copy())
+    assert hash_key("x", 1, a) != hash_key("x", 2, a)
+    assert hash_key("x", 1, a) != hash_key("x", 1, a.astype(np.float32))
+
+def test_disk_cache_round_trip(tmp_path):
+
+    cache = DiskCache(tmp_path)
+    arrays = {"a": np.arange(5.0), "b": np.ones((2, 3))}
+
+    assert cache.load("key") is None
+    cache.save("key", arrays)
+    loaded = cache.load("key")
+
+    assert all(np.array_equal(loaded[name], arrays[name]) for name in arrays)
+    assert cache.info()["hits"] == 1
+    assert cache.info()["misses"] == 1
+    assert cache.info()["entries"] == 1
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+
+    cache = DiskCache(tmp_path)
+    for i, key in enumerate(["old", "used", "new"]):
+        cache.save(key, {"a": np.zeros(1000)})
+        os.utime(cache.path(key), (i, i))
+
+    # touch "used" so that "old" is the least recently used entry
+    cache.load("used")
+    cache.max_bytes = 2 * os.path.getsize(cache.path("new"))
+    cache.evict()
+
+    assert not os.path.exists(cache.path("old"))
+    assert os.path.exists(cache.path("used"))
+    assert os.path.exists(cache.path("new"))
+
+def test_memory_cache_evicts_least_recently_used():
+
+    cache = MemoryCache(maxsize=2)
+    cache.save("old", 1)
+    cache.save("used", 2)
+    cache.load("used")
+    cache.save("new", 3)
+
+    assert cache.load("old") is None
+    assert cache.load("used") == 2
+    assert cache.load("new") == 3
+    assert cache.info() == {"hits": 3, "misses": 1, "entries": 2}
+
+def test_clear_caches():
+
+    from glass_cannon.cosmo_setup import get_cosmology
+    from glass_cannon.noisy import init_cov, noise_factor
+
+    setup = get_cosmology(0.7, 0.25, 0.05)
+    cov = init_cov(4, np.random.default_rng(seed=1))
+    factor = noise_factor(cov)
+
+    # nothing is answered from a cache filled before the reset
+    clear_caches()
+    assert get_cosmology(0.7, 0.25, 0.05) is not setup
+    assert noise_factor(cov) is not factor
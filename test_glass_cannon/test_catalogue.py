@@ -0,0 +1,67 @@
+import glass
+import numpy as np
+import healpy as hp
+
+from glass_cannon.catalogue import (
+    CatalogueWriter, read_catalogue, sample_catalogue, shell_densities)
+from glass_cannon.footprint import Footprint
+from glass_cannon.galaxies import add_galaxies
+
+
+def test_shell_densities():
+
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    z = np.linspace(0.0, 0.6, 61)
+    dndz = np.exp(-((z - 0.3) / 0.1)**2)
+
+    ngal = shell_densities(z, dndz, shells)
+
+    assert np.allclose(ngal, add_galaxies(z, dndz, shells))
+    assert shell_densities(z, dndz, shells) is ngal
+
+def test_sample_catalogue(tmp_path):
+
+    nside = 8
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    rng = np.random.default_rng(seed=3)
+    delta_g = [0.3 * rng.standard_normal(12 * nside**2) for _ in shells]
+    ngal = np.array([0.002, 0.001])
+
+    with CatalogueWriter(tmp_path / "cat", chunk_size=10000) as writer:
+        counts = sample_catalogue(shells, delta_g, ngal, writer, batch=3000, rng=rng)
+
+    # about ngal per arcmin2 over the full sky
+    area = 4 * np.pi * (180 * 60 / np.pi)**2
+    assert np.allclose(counts, ngal * area, rtol=0.05)
+
+    shell = np.concatenate(list(read_catalogue(tmp_path / "cat", "shell")))
+    z = np.concatenate(list(read_catalogue(tmp_path / "cat", "z")))
+    lat = np.concatenate(list(read_catalogue(tmp_path / "cat", "lat")))
+
+    assert len(shell) == len(z) == len(lat) == sum(counts)
+    assert np.all(np.diff(shell) >= 0)
+    assert np.bincount(shell).tolist() == counts
+    assert np.all((z[shell == 1] >= 0.2) & (z[shell == 1] <= 0.6))
+    assert np.all(np.abs(lat) <= 90)
+    assert all(len(chunk) <= 10000 for chunk in read_catalogue(tmp_path / "cat", "lon"))
+
+def test_sample_catalogue_footprint():
+
+    nside = 8
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    footprint = Footprint.disc(nside, lon=40.0, lat=-10.0, radius=30.0)
+    rng = np.random.default_rng(seed=5)
+    delta_g = [0.3 * rng.standard_normal(footprint.size) for _ in shells]
+    ngal = np.full(len(shells), 0.002)
+
+    columns = []
+    counts = sample_catalogue(shells, delta_g, ngal, columns.append, rng=rng, footprint=footprint)
+
+    # galaxies only in the footprint, with the density of the observed pixels
+    pixel_area = hp.nside2pixarea(nside, degrees=True) * 3600
+    expected = [n * pixel_area * np.sum(1 + d) for n, d in zip(ngal, delta_g)]
+    assert np.allclose(counts, expected, rtol=0.05)
+    lon = np.concatenate([c["lon"] for c in columns])
+    lat = np.concatenate([c["lat"] for c in columns])
+    pixels = hp.ang2pix(nside, lon, lat, lonlat=True)
+    assert np.all(footprint.mask()[pixels])
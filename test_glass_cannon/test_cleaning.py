@@ -0,0 +1,58 @@
+import numpy as np
+
+from glass_cannon.cleaning import shell_covariance, pca_clean, fastica, ica_clean
+
+
+def foreground_cube(npix=20000, seed=0):
+
+    rng = np.random.default_rng(seed)
+    nu = np.linspace(0.8, 1.2, 8)
+    # two smooth spectra with independent, non-Gaussian amplitude maps
+    sources = np.stack([rng.uniform(-1, 1, npix) * 100, rng.laplace(size=npix) * 30])
+    mixing = np.stack([nu**-2.7, nu**-2.1], axis=1)
+    signal = 0.1 * rng.standard_normal((8, npix))
+    return mixing @ sources + 5.0 + signal, signal, sources, mixing
+
+def test_shell_covariance():
+
+    cube, _, _, _ = foreground_cube(npix=1000)
+    mean, cov = shell_covariance(cube, chunk_size=77)
+
+    assert np.allclose(mean, cube.mean(axis=1))
+    assert np.allclose(cov, np.cov(cube, bias=True))
+
+    # a mean far above the fluctuations does not cancel the covariance
+    offset = cube + 1e9
+    mean, cov = shell_covariance(offset, chunk_size=77)
+    assert np.allclose(mean, offset.mean(axis=1))
+    assert np.allclose(cov, np.cov(cube, bias=True), rtol=1e-6)
+
+def test_pca_clean():
+
+    cube, signal, _, _ = foreground_cube()
+    cleaned, modes = pca_clean(cube, 2, chunk_size=3000)
+
+    assert modes.shape == (8, 2)
+    # the foregrounds are removed down to the signal level
+    assert np.std(cleaned - (signal - signal.mean(axis=1, keepdims=True))) < 0.1
+    assert np.allclose(modes.T @ cleaned, 0, atol=1e-8)
+
+    inplace = cube.copy()
+    result, _ = pca_clean(inplace, 2, chunk_size=3000, inplace=True)
+    assert result is inplace
+    assert np.allclose(inplace, cleaned)
+
+def test_fastica():
+
+    cube, _, sources, mixing = foreground_cube()
+    mean, found_mixing, unmixing = fastica(cube, 2, chunk_size=3000)
+
+    # the independent sources are recovered up to order, sign and scale
+    found = unmixing @ (cube - mean[:, np.newaxis])
+    correlation = np.abs(np.corrcoef(found, sources)[:2, 2:])
+    assert np.allclose(np.sort(correlation.max(axis=1)), 1, atol=0.01)
+
+    cleaned, _ = ica_clean(cube, 2, chunk_size=3000)
+    pca_cleaned, _ = pca_clean(cube, 2)
+    # both span the same foreground subspace
+    assert np.allclose(cleaned, pca_cleaned, atol=1e-6)
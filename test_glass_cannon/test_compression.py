@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from scipy.linalg import eigh
+
+from glass_cannon.compression import CCAAccumulator, Compressor, fit_CCA, do_CCA, finite_difference_statistics
+
+
+def simulations(n, seed):
+
+    rng = np.random.default_rng(seed)
+    params = rng.normal(size=(n, 3))
+    data = params @ rng.normal(size=(3, 8)) + 0.5 * rng.normal(size=(n, 8))
+    return params, data
+
+def test_accumulator():
+
+    params, data = simulations(1000, seed=1)
+
+    parts = [fit_CCA([(params[i:i + 70], data[i:i + 70])]) for i in range(0, 1000, 70)]
+    merged = CCAAccumulator()
+    for part in parts:
+        merged.merge(part)
+
+    assert merged.count == 1000
+    assert np.allclose(merged.covariance(), np.cov(params.T, data.T))
+
+def test_do_CCA():
+
+    params, data = simulations(2000, seed=2)
+
+    # reference: direct solution from the full covariance
+    cca_cov = np.cov(params.T, data.T)
+    cp, cd, cpd = cca_cov[:3, :3], cca_cov[3:, 3:], cca_cov[:3, 3:]
+    expected_evals, expected_evecs = eigh(cd, cd - cpd.T @ np.linalg.inv(cp) @ cpd)
+    expected_evals, expected_evecs = expected_evals[::-1][:3], expected_evecs[:, ::-1][:, :3]
+
+    evals, evecs = do_CCA(params, data, chunk_size=300)
+
+    assert evecs.shape == (8, 3)
+    assert np.allclose(evals, expected_evals)
+    # eigenvectors are defined up to sign
+    assert np.allclose(np.abs(np.sum(evecs * expected_evecs, axis=0)),
+                       np.sum(expected_evecs**2, axis=0))
+
+def test_compressor_cca():
+
+    params, data = simulations(500, seed=3)
+    accumulator = fit_CCA([(params, data)])
+    compressor = Compressor.from_CCA(accumulator, backend="numpy")
+
+    _, evecs = accumulator.solve()
+    assert np.allclose(compressor(data[:7]), data[:7] @ evecs)
+    assert compressor(data.reshape(50, 10, 8)).shape == (50, 10, 3)
+
+def test_score_compression():
+
+    rng = np.random.default_rng(seed=4)
+    response = rng.normal(size=(3, 8))
+    cov = np.diag(rng.uniform(0.5, 1.5, size=8))
+
+    def simulate(params, indices):
+        # linear model; the noise depends only on the index of the stream
+        noise = np.stack([np.random.default_rng(i).multivariate_normal(np.zeros(8), cov)
+                          for i in indices])
+        return params @ response + noise
+
+    fiducial = np.array([0.7, 0.25, 0.05])
+    mean, derivatives, sim_cov = finite_difference_statistics(simulate, fiducial, [0.01] * 3, 400)
+
+    # common random numbers make the derivatives of a linear model exact
+    assert np.allclose(derivatives, response)
+    assert np.allclose(mean, fiducial @ response, atol=0.2)
+
+    compressor = Compressor.from_score(mean, derivatives, cov, backend="numpy")
+    # MOPED vectors are orthonormal with respect to the covariance
+    assert np.allclose(compressor.vectors.T @ cov @ compressor.vectors, np.eye(3))
+    assert np.allclose(compressor(mean), 0)
+
+    # unorthonormalised score vectors span the same space
+    score = Compressor.from_score(mean, derivatives, cov, moped=False, backend="numpy")
+    projection = np.linalg.lstsq(score.vectors, compressor.vectors, rcond=None)[0]
+    assert np.allclose(score.vectors @ projection, compressor.vectors)
+
+def test_compressor_jax():
+
+    pytest.importorskip("jax")
+
+    params, data = simulations(500, seed=5)
+    accumulator = fit_CCA([(params, data)])
+    shift = data.mean(axis=0)
+    _, evecs = accumulator.solve()
+    jitted = Compressor(evecs, shift=shift, backend="jax")
+    reference = Compressor(evecs, shift=shift, backend="numpy")
+    assert jitted.backend == "jax"
+
+    # batches are padded to powers of two and the padding is dropped again
+    for n in [1, 3, 7, 100]:
+        assert np.allclose(jitted(data[:n]), reference(data[:n]), rtol=1e-4, atol=1e-4)
+    assert jitted(data[0]).shape == (3,)
+    batch = data[:3 * 5 * 7].reshape(3, 5, 7, 8)
+    compressed = jitted(batch)
+    assert compressed.shape == (3, 5, 7, 3)
+    assert np.allclose(compressed, reference(batch), rtol=1e-4, atol=1e-4)
@@ -2,6 +2,7 @@ from glass_cannon.cosmo_setup import set_cosmo
 from glass_cannon.cosmo_setup import make_bkg
 from glass_cannon.cosmo_setup import make_cosmo
 from glass_cannon.cosmo_setup import make_cosmology_class
+from glass_cannon.cosmo_setup import get_cosmology
 
 """
 testing function to set up the cosmology for Glass simulation    
@@ -45,3 +46,11 @@ def test_all(h=0.7, Oc = 0.25, Ob = 0.05):
 def test_all(h=0.7, Oc = 0.25, Ob = 0.05):
     result, extra = make_cosmology_class(h=0.7, Oc = 0.25, Ob = 0.05)
     assert result.params.omegab == 0.05
+
+def test_get_cosmology(h=0.7, Oc = 0.25, Ob = 0.05):
+    setup = get_cosmology(h=0.7, Oc = 0.25, Ob = 0.05)
+    assert get_cosmology(h=0.7, Oc = 0.25, Ob = 0.05) is setup
+    assert setup.pars.H0 == 70.0
+    assert setup.cosmo.params.omegac == 0.25
+    assert setup.background is setup.background
+    assert len(setup.shells) == len(setup.zb) - 2
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from glass_cannon.cache import DiskCache
+from glass_cannon.cosmo_setup import get_cosmology
+from glass_cannon.Cls import angular_power_spectrum
+from glass_cannon.emulator import latin_hypercube, build_training_set, ClsEmulator
+from glass_cannon.glass_pipeline import simulator, simulate_batch
+
+
+def test_latin_hypercube(bounds):
+
+    design = latin_hypercube(bounds, 50, seed=42)
+
+    assert design.shape == (50, 3)
+    assert np.all(design >= np.array(bounds)[:, 0])
+    assert np.all(design <= np.array(bounds)[:, 1])
+
+def test_emulator_predict(tmp_path, bounds, toy_cls, toy_emulator):
+
+    emulator = toy_emulator
+    test_design = latin_hypercube(bounds, 20, seed=1)
+    accuracy = emulator.accuracy
+
+    assert accuracy < emulator.tolerance
+    emulator.check()
+
+    cls, shells = emulator.angular_power_spectrum(0.7, 0.25, 0.05, 16)
+    assert len(cls) == 3 and len(shells) == 2
+    assert np.allclose(cls, toy_cls([0.7, 0.25, 0.05])[0, :, :17], rtol=emulator.tolerance)
+
+    path = tmp_path / "emulator.npz"
+    emulator.save(path)
+    loaded = ClsEmulator.load(path)
+
+    assert loaded.accuracy == accuracy
+    assert np.allclose(loaded.predict(test_design), emulator.predict(test_design))
+
+    with pytest.raises(ValueError):
+        emulator.predict([0.9, 0.25, 0.05])
+
+def test_emulator_validates_cross_spectra(bounds, toy_cls, toy_emulator):
+
+    emulator = toy_emulator
+    test_design = latin_hypercube(bounds, 20, seed=1)
+    cls_table = toy_cls(test_design)
+    assert emulator.validate(test_design, cls_table) < emulator.tolerance
+
+    # an error in the cross-spectrum of shells 1 and 0 alone is reported
+    cls_table[:, 2] *= 1.05
+    assert emulator.validate(test_design, cls_table) > emulator.tolerance
+    with pytest.raises(ValueError):
+        emulator.check()
+
+def test_build_training_set(tmp_path):
+
+    design = np.array([[0.7, 0.25, 0.05], [0.72, 0.27, 0.045]])
+    zb = np.array([0.0, 0.1, 0.2, 0.3])
+    cache = DiskCache(tmp_path / "cls")
+
+    cls_table = build_training_set(design, zb, 16, cache=cache)
+
+    assert cls_table.shape == (2, 3, 17)
+    assert cache.misses == 2
+
+    # every row is the CAMB spectrum of its design point, now from the cache
+    pars = get_cosmology(h=0.72, Oc=0.27, Ob=0.045).pars
+    cls, _ = angular_power_spectrum(pars, 16, zb, cache=cache)
+    assert cache.hits == 1
+    assert np.allclose(cls_table[1], np.stack(cls))
+    assert np.array_equal(build_training_set(design, zb, 16, cache=cache), cls_table)
+
+def test_simulator_emulator(toy_emulator):
+
+    emulator = toy_emulator
+
+    galaxy, hi = simulator(h=0.7, OmegaB=0.05, OmegaC=0.25, length=16, seed=1,
+                           emulator=emulator)
+    assert galaxy.shape == hi.shape == (len(emulator.shells), 12 * 16**2)
+
+    # the shells are those of the emulator, and a matching zb is accepted
+    other = simulator(h=0.7, OmegaB=0.05, OmegaC=0.25, length=16, seed=1,
+                      emulator=emulator, zb=emulator.zb)
+    assert np.array_equal(other[0], galaxy)
+    assert np.array_equal(other[1], hi)
+
+    # without a seed, every call starts a fresh stream from seed 42
+    first = simulator(h=0.7, OmegaB=0.05, OmegaC=0.25, length=16, emulator=emulator)
+    second = simulator(h=0.7, OmegaB=0.05, OmegaC=0.25, length=16, emulator=emulator)
+    assert np.array_equal(first[0], second[0])
+    assert np.array_equal(first[0], simulator(h=0.7, OmegaB=0.05, OmegaC=0.25, length=16,
+                                              seed=42, emulator=emulator)[0])
+
+    # a conflicting zb is an error rather than silently ignored
+    other_zb = np.array([0.0, 0.5, 1.0, 1.5, 2.0])
+    with pytest.raises(ValueError, match="zb differs"):
+        simulator(h=0.7, OmegaB=0.05, OmegaC=0.25, length=16, seed=1,
+                  emulator=emulator, zb=other_zb)
+    with pytest.raises(ValueError, match="zb differs"):
+        simulate_batch([[0.7, 0.25, 0.05]], length=16, workers=1,
+                       emulator=emulator, zb=other_zb)
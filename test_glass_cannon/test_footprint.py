@@ -0,0 +1,40 @@
+import numpy as np
+import healpy as hp
+import pytest
+
+from glass_cannon.footprint import Footprint
+
+
+def test_footprint_compress_expand():
+
+    nside = 8
+    footprint = Footprint.disc(nside, lon=30.0, lat=-20.0, radius=40.0)
+    maps = np.random.default_rng(seed=42).normal(size=(2, 3, hp.nside2npix(nside)))
+
+    assert 0.1 < footprint.fsky < 0.2
+    assert footprint == Footprint.from_mask(footprint.mask())
+    assert len({footprint, Footprint.from_mask(footprint.mask())}) == 1
+
+    values = footprint.compress(maps)
+    assert values.shape == (2, 3, footprint.size)
+
+    expanded = footprint.expand(values)
+    mask = footprint.mask()
+    assert np.array_equal(expanded[..., mask], maps[..., mask])
+    assert np.all(expanded[..., ~mask] == 0)
+
+    unseen = footprint.expand(values[0, 0], fill=hp.UNSEEN)
+    assert np.all(unseen[~mask] == hp.UNSEEN)
+
+
+def test_footprint_validation():
+
+    footprint = Footprint(1, [5, 2, 2])
+    assert np.array_equal(footprint.pixels, [2, 5])
+
+    with pytest.raises(ValueError):
+        Footprint(1, [12])
+    with pytest.raises(ValueError):
+        footprint.compress(np.zeros(48))
+    with pytest.raises(ValueError):
+        footprint.expand(np.zeros(3))
@@ -1,5 +1,9 @@
+import os
+import time
+
 import matplotlib.pyplot as plt
 import numpy as np
+import pytest
 from matplotlib.colors import LogNorm
 
 # use the CAMB cosmology that generated the matter power spectra
@@ -10,8 +14,12 @@ from cosmology.compat.camb import Cosmology
 import glass
 import glass.ext.camb
 
-from glass_cannon.glass_pipeline import simulator, galaxy_bias, convert_DM_to_galaxy_overdensity
+import glass_cannon.glass_pipeline
+from glass_cannon.glass_pipeline import simulator, simulate_batch, stream_tracers, galaxy_bias, convert_DM_to_galaxy_overdensity
 from glass_cannon.HI_tracer import b_HI, T_HI_bar, convert_DM_to_HI
+from glass_cannon.cache import DiskCache
+from glass_cannon.footprint import Footprint
+from glass_cannon.seeding import simulation_rng
 
 
 def test_galaxy_bias():
@@ -157,4 +165,124 @@ def test_simulator():
     for expected, sim in zip(expected_hi_temperature_fields, sim_hi_fields):
         assert np.allclose(expected, sim, rtol=1e-6, atol=1e-8)
 
+def test_simulate_batch():
+
+    params = np.array([[0.7, 0.25, 0.05], [0.68, 0.27, 0.049]])
+    zb = np.array([0.0, 0.2, 0.4, 0.6])
+    length = 16
+
+    galaxy, hi = simulate_batch(params, length=length, seed=1, workers=1, zb=zb)
+
+    assert galaxy.shape == hi.shape == (2, 2, 12 * length**2)
+
+    # each row is reproducible from its own field stream
+    rng = simulation_rng(1, 1, "fields")
+    expected_galaxy, expected_hi = simulator(h=0.68, OmegaC=0.27, OmegaB=0.049,
+                                             length=length, seed=rng, zb=zb)
+
+    assert np.allclose(galaxy[1], expected_galaxy, rtol=1e-6, atol=1e-8)
+    assert np.allclose(hi[1], expected_hi, rtol=1e-6, atol=1e-8)
+
+def test_simulate_batch_workers(tmp_path):
+
+    params = np.array([[0.7, 0.25, 0.05], [0.68, 0.27, 0.049], [0.72, 0.23, 0.051]])
+    zb = np.array([0.0, 0.2, 0.4, 0.6])
+    cache = DiskCache(tmp_path / "cls")
+
+    serial = simulate_batch(params, length=16, seed=1, workers=1, zb=zb, cls_cache=cache)
+
+    # rows do not depend on the number of workers or the chunking
+    parallel = simulate_batch(params, length=16, seed=1, workers=2, chunksize=2, zb=zb,
+                              cls_cache=cache)
+    assert np.array_equal(parallel[0], serial[0])
+    assert np.array_equal(parallel[1], serial[1])
+
+def test_simulate_batch_outdir(tmp_path):
+
+    params = np.array([[0.7, 0.25, 0.05], [0.68, 0.27, 0.049]])
+    zb = np.array([0.0, 0.2, 0.4, 0.6])
+    cache = DiskCache(tmp_path / "cls")
+
+    galaxy, hi = simulate_batch(params, length=16, seed=1, workers=1, zb=zb, cls_cache=cache)
+    stored = simulate_batch(params, length=16, seed=1, workers=1, zb=zb, cls_cache=cache,
+                            outdir=tmp_path)
+
+    # the returned memory maps are backed by the files
+    assert isinstance(stored[0], np.memmap)
+    assert np.array_equal(np.load(tmp_path / "params.npy"), params)
+    assert np.array_equal(np.load(tmp_path / "galaxy.npy"), galaxy)
+    assert np.array_equal(np.load(tmp_path / "HI.npy"), hi)
+
+def slow_rows(rows, params, seeds, kwargs, memory=None):
+    """Stand-in for simulate_rows that marks every chunk it runs."""
+    time.sleep(0.2)
+    open(os.path.join(os.environ["SLOW_ROWS_DIR"], f"row{rows.start}"), "w").close()
+    return [], None
+
+class InterruptingProfiler:
+    """Profiler whose merge is interrupted, as by Ctrl-C while collecting rows."""
+    memory = False
+
+    def merge(self, other):
+        raise KeyboardInterrupt
+
+def test_simulate_batch_interrupt(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(glass_cannon.glass_pipeline, "simulate_rows", slow_rows)
+    monkeypatch.setenv("SLOW_ROWS_DIR", str(tmp_path))
+    params = np.tile([0.7, 0.25, 0.05], (40, 1))
+
+    with pytest.raises(KeyboardInterrupt):
+        simulate_batch(params, workers=2, zb=np.array([0.0, 0.2, 0.4]),
+                       profiler=InterruptingProfiler())
+
+    # the chunks that had not started when the batch was interrupted are not run
+    assert len(os.listdir(tmp_path)) < 10
+
+def test_simulate_batch_empty(tmp_path):
+
+    with pytest.raises(ValueError, match="at least one row"):
+        simulate_batch(np.empty((0, 3)), workers=1)
+    with pytest.raises(ValueError, match="at least one row"):
+        simulate_batch(np.empty((0, 3)), workers=1, outdir=tmp_path)
+
+def test_stream_tracers():
+
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    rng = np.random.default_rng(seed=42)
+    matter = [rng.normal(size=12) for _ in shells]
+
+    streamed = list(stream_tracers(shells, iter(matter)))
+
+    expected_galaxy = convert_DM_to_galaxy_overdensity(shells, matter)
+    expected_hi = convert_DM_to_HI(shells, matter)
+
+    assert len(streamed) == len(shells)
+    for (shell, delta_g, T_HI), g, t in zip(streamed, expected_galaxy, expected_hi):
+        assert np.allclose(delta_g, g, rtol=1e-6, atol=1e-8)
+        assert np.allclose(T_HI, t, rtol=1e-6, atol=1e-8)
+
+def test_stream_tracers_float32():
+
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    rng = np.random.default_rng(seed=42)
+    matter = [rng.normal(size=12) for _ in shells]
+
+    for (_, delta_g, T_HI), (_, g, t) in zip(stream_tracers(shells, iter(matter), np.float32),
+                                             stream_tracers(shells, iter(matter))):
+        assert delta_g.dtype == T_HI.dtype == np.float32
+        assert np.allclose(delta_g, g, rtol=1e-6)
+        assert np.allclose(T_HI, t, rtol=1e-6)
+
+def test_stream_tracers_footprint():
+
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    footprint = Footprint(1, [0, 3, 7])
+    rng = np.random.default_rng(seed=42)
+    matter = [rng.normal(size=12) for _ in shells]
 
+    for (_, delta_g, T_HI), (_, g, t) in zip(stream_tracers(shells, iter(matter), footprint=footprint),
+                                             stream_tracers(shells, iter(matter))):
+        assert delta_g.shape == T_HI.shape == (footprint.size,)
+        assert np.array_equal(delta_g, g[footprint.pixels])
+        assert np.array_equal(T_HI, t[footprint.pixels])
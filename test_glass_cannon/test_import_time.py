@@ -0,0 +1,27 @@
+"""Check that importing the pipeline does not pull in heavy optional dependencies."""
+
+import subprocess
+import sys
+
+# modules that must only be loaded when the functionality needing them is used
+HEAVY_MODULES = ["camb", "glass.ext.camb", "cosmology.compat.camb", "pytest", "jax", "sbi", "torch"]
+
+
+def imported_modules(statement):
+    """Return the modules imported by a statement, from ``python -X importtime``."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, check=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+def test_pipeline_import_is_lazy():
+
+    modules = imported_modules("import glass_cannon.glass_pipeline")
+
+    assert "glass_cannon.glass_pipeline" in modules
+    for name in HEAVY_MODULES:
+        assert name not in modules, f"{name} imported by glass_cannon.glass_pipeline"
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from scipy.stats import multivariate_normal
+
+from glass_cannon.inference import GaussianLikelihood, pooled, run_emcee, run_nautilus
+
+
+def linear_problem():
+
+    rng = np.random.default_rng(seed=5)
+    response = rng.normal(size=(3, 6))
+    cov = np.diag(rng.uniform(0.5, 1.5, size=6)) + 0.1
+    truth = np.array([0.7, 0.25, 0.05])
+    data = truth @ response
+    bounds = [[0.5, 0.9], [0.1, 0.4], [0.0, 0.1]]
+    return GaussianLikelihood(data, cov, lambda params: params @ response, bounds), response, cov
+
+def test_gaussian_likelihood():
+
+    likelihood, response, cov = linear_problem()
+    params = np.array([[0.6, 0.2, 0.04], [0.8, 0.3, 0.06], [1.0, 0.3, 0.06]])
+
+    expected = [multivariate_normal(p @ response, cov).logpdf(likelihood.data) for p in params]
+    assert np.allclose(likelihood.log_likelihood(params), expected)
+    assert np.isclose(likelihood.log_likelihood(params[0]), expected[0])
+
+    logp = likelihood.log_probability(params)
+    assert np.allclose(logp[:2], expected[:2])
+    assert logp[2] == -np.inf
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert np.allclose(pooled(likelihood.log_probability, pool)(params), logp)
+        assert pooled(likelihood.log_probability, pool)(params[:0]).shape == (0,)
+
+def test_run_emcee():
+
+    pytest.importorskip("emcee")
+    likelihood, _, _ = linear_problem()
+    initial = likelihood.prior_transform(np.random.default_rng(seed=6).uniform(size=(16, 3)))
+
+    sampler = run_emcee(likelihood, initial, 50, seed=7)
+
+    assert sampler.get_chain().shape == (50, 16, 3)
+
+def test_run_nautilus():
+
+    pytest.importorskip("nautilus")
+    likelihood, _, _ = linear_problem()
+
+    sampler = run_nautilus(likelihood, n_live=200, seed=7)
+    points, log_w, log_l = sampler.posterior()
+
+    assert points.shape[1] == 3
+    assert np.all(np.isfinite(log_l))
+    assert np.isfinite(sampler.log_z)
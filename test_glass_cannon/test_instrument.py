@@ -0,0 +1,56 @@
+import numpy as np
+
+from glass_cannon.instrument import Profiler, nbytes, stage
+
+
+def test_nbytes():
+
+    assert nbytes([np.zeros(10), (np.zeros(5), None)]) == 120
+    assert nbytes(None) == 0
+
+def test_profiler_stage():
+
+    profiler = Profiler(memory=True)
+    for _ in range(3):
+        with stage(profiler, "alloc") as info:
+            info["output"] = np.ones(1000)
+
+    stats = profiler.summary()["alloc"]
+
+    assert stats["calls"] == 3
+    assert stats["nbytes"] == 8000
+    assert stats["peak_bytes"] >= 8000
+    assert stats["wall_min"] <= stats["wall_mean"] <= stats["wall_max"]
+
+def test_profiler_merge():
+
+    a, b = Profiler(), Profiler()
+    a.record("stage", 1.0, 0.5)
+    b.record("stage", 3.0, 1.5)
+    b.record("other", 2.0, 2.0)
+
+    a.merge(b)
+
+    assert a.stats["stage"]["calls"] == 2
+    assert a.stats["stage"]["wall"] == 4.0
+    assert a.stats["stage"]["wall_max"] == 3.0
+    assert a.stats["other"]["calls"] == 1
+
+def test_stage_without_profiler():
+
+    with stage(None, "noop") as info:
+        info["output"] = np.ones(10)
+
+def test_profiler_nested_stages():
+
+    profiler = Profiler(memory=True)
+    with stage(profiler, "outer"):
+        first = np.ones(100_000)
+        del first
+        with stage(profiler, "inner"):
+            second = np.ones(10_000)
+        del second
+
+    # the inner stage does not reset the peak of the outer stage
+    assert profiler.stats["outer"]["peak_bytes"] >= 800_000
+    assert 80_000 <= profiler.stats["inner"]["peak_bytes"] < 800_000
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from glass_cannon.loader import MemmapDataset, build_estimator, prefetch, train_estimator
+from glass_cannon.noisy import add_noise, add_simulation_noise
+from glass_cannon.store import SimulationStore
+
+
+def test_memmap_dataset(tmp_path):
+
+    params = np.arange(30.0).reshape(10, 3)
+    store = SimulationStore.create(tmp_path / "store", params, chunk_size=4)
+    for k in range(store.nchunks):
+        rows = np.array(store.chunk_rows(k))
+        store.write_chunk(k, {"spectra": np.broadcast_to(rows[:, None, None], (len(rows), 2, 3))})
+
+    dataset = MemmapDataset.from_store(store)
+    assert len(dataset) == 10
+    assert dataset.nfeatures == 6
+
+    batches = list(dataset.batches(batch_size=4, rng=42))
+    assert [len(theta) for theta, _ in batches] == [4, 4, 2]
+
+    # every row is visited once, and parameters stay paired with their data
+    theta = np.concatenate([theta for theta, _ in batches])
+    x = np.concatenate([x for _, x in batches])
+    assert theta.dtype == np.float32
+    assert sorted(theta[:, 0]) == list(params[:, 0])
+    assert np.all(x == theta[:, :1] / 3)
+
+    evecs = np.ones((6, 2))
+    cov = 1e-6 * np.eye(6)
+    for theta, x in dataset.batches(batch_size=4, rng=1, drop_last=True,
+                                    noise_cov=cov, evecs=evecs):
+        assert x.shape == (4, 2)
+        np.testing.assert_allclose(x[:, 0], 2 * theta[:, 0], atol=1e-2)
+
+
+def test_memmap_dataset_noise_streams():
+
+    params = np.arange(18.0).reshape(6, 3)
+    dataset = MemmapDataset([params], [np.zeros((6, 4))], dtype=np.float64,
+                            indices=np.arange(10, 16))
+    cov = np.eye(4)
+
+    def noise(**kwargs):
+        batches = list(dataset.batches(noise_cov=cov, noise_seed=7, **kwargs))
+        theta = np.concatenate([theta for theta, _ in batches])
+        x = np.concatenate([x for _, x in batches])
+        return x[np.argsort(theta[:, 0])]
+
+    # the noise of a row depends on its campaign index only
+    expected = add_simulation_noise(np.zeros((6, 4)), cov, 7, range(10, 16))
+    assert np.allclose(noise(batch_size=4, rng=1), expected)
+    assert np.allclose(noise(batch_size=5, rng=2), expected)
+    assert not np.allclose(noise(batch_size=4, rng=1), add_noise(np.zeros((6, 4)), cov, 1))
+
+
+def test_prefetch():
+
+    assert list(prefetch(iter(range(10)), depth=2)) == list(range(10))
+
+    def failing():
+        yield 1
+        raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError):
+        list(prefetch(failing()))
+
+    # stopping early does not hang the producer
+    for item in prefetch(iter(range(100)), depth=1):
+        break
+
+
+def test_train_estimator():
+
+    pytest.importorskip("sbi")
+
+    rng = np.random.default_rng(seed=3)
+    theta = rng.uniform(size=(64, 2))
+    x = np.concatenate([theta, theta**2, rng.normal(size=(64, 2))], axis=1)
+    dataset = MemmapDataset([theta], [x])
+
+    # the estimator is sized and standardised on compressed, noisy rows
+    options = {"noise_cov": 1e-4 * np.eye(6), "noise_seed": 5, "evecs": np.eye(6)[:, :3]}
+    estimator = build_estimator(dataset, model="mdn", nsamples=32, rng=1, **options)
+    losses = train_estimator(estimator, dataset, epochs=2, batch_size=16, **options)
+    assert len(losses) == 2
+    assert np.all(np.isfinite(losses))
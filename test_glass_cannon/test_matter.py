@@ -3,7 +3,8 @@ import glass.ext.camb
 import numpy as np
 import camb
 
-from glass_cannon.matter import run_ln_fields, run_discretized_cls, run_solve_gauss_spectra, run_generate
+from glass_cannon.instrument import Profiler
+from glass_cannon.matter import run_ln_fields, run_discretized_cls, run_solve_gauss_spectra, run_generate, GaussSpectraCache, minimal_nside, resolution
 
 
 def test_run_ln_fields():
@@ -110,4 +111,59 @@ def test_run_generate():
 
     assert all(np.allclose(a, b, rtol=1e-6, atol=1e-8) for a, b in zip(expected_matter, matter))
 
+def test_run_solve_gauss_spectra_cache(tmp_path):
 
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    fields = glass.lognormal_fields(shells)
+
+    ell = np.arange(33)
+    cl = 1e-4 / (1 + ell)**2
+    cls = [cl, cl, 0.5 * cl]
+
+    expected_gls = glass.solve_gaussian_spectra(fields, cls)
+
+    cache = GaussSpectraCache(directory=tmp_path)
+    gls = run_solve_gauss_spectra(fields, cls, cache=cache)
+    cached_gls = run_solve_gauss_spectra(fields, [c.copy() for c in cls], cache=cache)
+
+    assert cache.misses == 1
+    assert cache.hits == 1
+    assert cache.time_saved > 0
+    assert all(np.allclose(a, b, rtol=1e-6, atol=1e-8) for a, b in zip(expected_gls, cached_gls))
+
+    # a fresh cache finds the solution on disk
+    disk_cache = GaussSpectraCache(directory=tmp_path)
+    disk_gls = run_solve_gauss_spectra(fields, cls, cache=disk_cache)
+
+    assert disk_cache.hits == 1
+    assert all(np.allclose(a, b, rtol=1e-6, atol=1e-8) for a, b in zip(gls, disk_gls))
+
+def test_resolution():
+
+    assert minimal_nside(1) == 1
+    assert minimal_nside(64) == 32
+    assert minimal_nside(65) == 64
+    assert minimal_nside(100, ratio=3) == 64
+
+    # legacy behaviour: one length for both
+    assert resolution(128) == (128, 128)
+    assert resolution(128, nside=64) == (64, 64)
+    assert resolution(128, lmax=32) == (128, 32)
+    assert resolution(128, nside="auto", lmax=48) == (32, 48)
+    assert resolution(128, nside="auto") == (64, 128)
+
+def test_matter_helpers_profiler():
+
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4]))
+    fields = run_ln_fields(shells)
+    ell = np.arange(33)
+    n = len(fields)
+    prev_cls = [1e-4 / (1 + ell)**2 for _ in range(n * (n + 1) // 2)]
+
+    profiler = Profiler()
+    cls = run_discretized_cls(prev_cls, 16, 32, profiler=profiler)
+    run_solve_gauss_spectra(fields, cls, cache=GaussSpectraCache(), profiler=profiler)
+
+    assert profiler.stats["run_discretized_cls"]["calls"] == 1
+    assert profiler.stats["run_solve_gauss_spectra"]["nbytes"] > 0
+    assert profiler.stats["solve_gaussian_spectra"]["calls"] == 1
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from glass_cannon.footprint import Footprint
+from glass_cannon.noisy import (init_cov, noise_factor, add_noise, add_pixel_noise,
+                                add_simulation_noise)
+from glass_cannon.seeding import simulation_rng
+
+
+def test_init_cov():
+
+    rng = np.random.default_rng(seed=42)
+    cov = init_cov(5, rng)
+
+    diag = np.diag(cov)
+    expected = np.diag(diag)
+    for i in range(4):
+        expected[i, i + 1] = expected[i + 1, i] = (-1) ** i * 0.5 * np.sqrt(diag[i] * diag[i + 1])
+
+    assert np.allclose(cov, expected)
+    assert np.allclose(diag, 1 + np.random.default_rng(seed=42).standard_normal(5) * 0.1)
+
+def test_noise_factor():
+
+    cov = init_cov(6, np.random.default_rng(seed=1))
+    L = noise_factor(cov)
+
+    assert np.allclose(L @ L.T, cov)
+    assert noise_factor(cov.copy()) is L
+
+    # the cached factor is shared, so it cannot be modified in place
+    with pytest.raises(ValueError):
+        L[0, 0] = 0.0
+    assert noise_factor(cov, cache=False).flags.writeable
+
+def test_noise_factor_singular():
+
+    v = np.array([1.0, 2.0, 3.0])
+    cov = np.outer(v, v)
+    L = noise_factor(cov, cache=False)
+
+    assert np.allclose(L @ L.T, cov)
+
+def test_add_noise():
+
+    cov = init_cov(4, np.random.default_rng(seed=1))
+    sim_data = np.zeros((20000, 3, 4))
+
+    noisy = add_noise(sim_data, cov=cov, rng=np.random.default_rng(seed=2))
+
+    assert noisy.shape == sim_data.shape
+    assert np.allclose(np.cov(noisy.reshape(-1, 4).T), cov, atol=0.02)
+
+def test_add_noise_float32():
+
+    cov = init_cov(4, np.random.default_rng(seed=1))
+    sim_data = np.ones((100, 4))
+
+    noisy64 = add_noise(sim_data, cov=cov, rng=3)
+    noisy32 = add_noise(sim_data.astype(np.float32), cov=cov, rng=3)
+
+    assert noisy32.dtype == np.float32
+    assert np.allclose(noisy32, noisy64, rtol=1e-5, atol=1e-6)
+
+def test_add_pixel_noise_footprint():
+
+    footprint = Footprint.disc(32, lon=0.0, lat=45.0, radius=30.0)
+    sigma = np.full(footprint.npix, 2.0)
+    maps = np.zeros((3, footprint.size), dtype=np.float32)
+
+    noisy = add_pixel_noise(maps, sigma, rng=1, footprint=footprint)
+
+    assert noisy.shape == maps.shape
+    assert noisy.dtype == np.float32
+    assert np.isclose(np.std(noisy), 2.0, rtol=0.1)
+
+def test_add_simulation_noise():
+
+    cov = init_cov(5, np.random.default_rng(seed=1))
+    sim_data = np.zeros((4, 2, 5))
+
+    noisy = add_simulation_noise(sim_data, cov, seed=3, indices=[7, 8, 9, 10])
+
+    # every row uses the noise stream of its own index
+    assert np.allclose(noisy[2], add_noise(sim_data[2], cov, simulation_rng(3, 9, "noise")))
+    assert np.allclose(add_simulation_noise(sim_data[2:3], cov, seed=3, indices=[9]), noisy[2:3])
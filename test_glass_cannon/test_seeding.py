@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from glass_cannon.seeding import simulation_seed, simulation_rng
+
+
+def test_simulation_seed():
+
+    # streams match spawning from the campaign seed
+    expected = np.random.SeedSequence(7).spawn(4)[3].spawn(2)
+    assert np.array_equal(simulation_seed(7, 3, "fields").generate_state(4),
+                          expected[0].generate_state(4))
+    assert np.array_equal(simulation_seed(7, 3, "noise").generate_state(4),
+                          expected[1].generate_state(4))
+
+    # nested campaigns derive from their own sequence
+    shard = np.random.SeedSequence(7).spawn(2)[1]
+    assert np.array_equal(simulation_seed(shard, 0).generate_state(4),
+                          shard.spawn(1)[0].spawn(1)[0].generate_state(4))
+
+    with pytest.raises(ValueError):
+        simulation_seed(7, 0, "beam")
+
+def test_simulation_rng():
+
+    # independent of the order in which streams are drawn
+    first = simulation_rng(1, 5).standard_normal(3)
+    simulation_rng(1, 4).standard_normal(3)
+    assert np.array_equal(simulation_rng(1, 5).standard_normal(3), first)
+
+    assert not np.array_equal(simulation_rng(1, 5, "noise").standard_normal(3), first)
+    assert not np.array_equal(simulation_rng(2, 5).standard_normal(3), first)
@@ -0,0 +1,78 @@
+import numpy as np
+import healpy as hp
+
+from glass_cannon.footprint import Footprint
+from glass_cannon.spectra import tracer_pairs, shell_pairs, spectrum_pairs, estimate_spectra, pseudo_spectra
+
+
+def test_tracer_pairs():
+
+    assert tracer_pairs(2) == [(0, 0), (1, 1), (0, 1)]
+
+def test_spectrum_pairs():
+
+    assert np.array_equal(shell_pairs(2), [[0, 0, 1], [0, 1, 1]])
+    assert np.array_equal(shell_pairs(2, cross=True), [[0, 0, 1, 1], [0, 1, 0, 1]])
+
+    # auto-tracer blocks of 6 shell pairs, the cross-tracer block of 9
+    a, b, i, j = spectrum_pairs(2, 3)
+    assert len(a) == 6 + 6 + 9
+    assert np.array_equal(a, [0] * 6 + [1] * 6 + [0] * 9)
+    assert np.array_equal(b, [0] * 6 + [1] * 15)
+    assert np.all(i[:12] <= j[:12])
+    assert set(zip(i[12:], j[12:])) == {(i, j) for i in range(3) for j in range(3)}
+
+def test_estimate_spectra():
+
+    nside = 16
+    lmax = 2 * nside
+    rng = np.random.default_rng(seed=42)
+    maps = rng.normal(size=(2, 3, hp.nside2npix(nside)))
+
+    cls = estimate_spectra(maps, lmax)
+
+    assert cls.shape == (6 + 6 + 9, lmax + 1)
+
+    for k, (a, b, i, j) in enumerate(zip(*spectrum_pairs(2, 3))):
+        alm_a = hp.map2alm(maps[a, i], lmax=lmax)
+        alm_b = hp.map2alm(maps[b, j], lmax=lmax)
+        expected = hp.alm2cl(alm_a, alm_b)
+        assert np.allclose(cls[k], expected, rtol=1e-6, atol=1e-12)
+
+    # galaxy in shell 0 with HI in shell 2 differs from galaxy in 2 with HI in 0
+    a, b, i, j = spectrum_pairs(2, 3)
+    lower = np.flatnonzero((a == 0) & (b == 1) & (i == 0) & (j == 2))[0]
+    upper = np.flatnonzero((a == 0) & (b == 1) & (i == 2) & (j == 0))[0]
+    expected = hp.alm2cl(hp.map2alm(maps[0, 0], lmax=lmax), hp.map2alm(maps[1, 2], lmax=lmax))
+    assert np.allclose(cls[lower], expected, rtol=1e-6, atol=1e-12)
+    assert not np.allclose(cls[lower], cls[upper])
+
+def test_estimate_spectra_float32():
+
+    nside = 16
+    maps = np.random.default_rng(seed=1).normal(size=(2, 2, hp.nside2npix(nside)))
+
+    cls64 = estimate_spectra(maps, 2 * nside)
+    cls32 = estimate_spectra(maps.astype(np.float32), 2 * nside)
+
+    assert cls64.dtype == np.float64
+    assert cls32.dtype == np.float32
+    assert np.allclose(cls32, cls64, rtol=1e-4, atol=1e-7)
+
+def test_pseudo_spectra():
+
+    nside = 16
+    lmax = 2 * nside
+    footprint = Footprint.disc(nside, lon=0.0, lat=0.0, radius=60.0)
+    maps = np.random.default_rng(seed=3).normal(size=(2, 2, hp.nside2npix(nside)))
+
+    cls = pseudo_spectra(footprint.compress(maps), lmax, footprint)
+
+    masked = maps * footprint.mask()
+    expected = estimate_spectra(masked, lmax) / footprint.fsky
+    assert np.allclose(cls, expected, rtol=1e-6, atol=1e-12)
+
+    # the sky fraction correction recovers the white noise level on average
+    a, b, i, j = spectrum_pairs(2, 2)
+    white = 4 * np.pi / hp.nside2npix(nside)
+    assert np.allclose(np.mean(cls[(a == b) & (i == j), 2:]), white, rtol=0.05)
@@ -0,0 +1,144 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import glass_cannon.store
+from glass_cannon.emulator import latin_hypercube
+from glass_cannon.footprint import Footprint
+from glass_cannon.glass_pipeline import simulate_batch
+from glass_cannon.store import SimulationStore, run_campaign
+
+def test_store_chunks(tmp_path):
+
+    params = np.random.default_rng(seed=42).uniform(size=(10, 3))
+    store = SimulationStore.create(tmp_path / "store", params, chunk_size=4)
+
+    assert store.nchunks == 3
+    assert list(store.chunk_rows(2)) == [8, 9]
+    assert store.missing_chunks() == [0, 1, 2]
+
+    assert store.write_chunk(1, {"spectra": np.ones((4, 5))})
+    # a second writer of the same chunk does not overwrite it
+    assert not store.write_chunk(1, {"spectra": np.zeros((4, 5))})
+
+    reopened = SimulationStore.open(tmp_path / "store")
+
+    assert reopened.missing_chunks() == [0, 2]
+    assert np.array_equal(reopened.params, params)
+
+    chunk = reopened.read_chunk(1, "spectra")
+    assert isinstance(chunk, np.memmap)
+    assert np.all(chunk == 1)
+
+    rows, spectra = reopened.load("spectra")
+    assert list(rows) == [4, 5, 6, 7]
+    assert spectra.shape == (4, 5)
+
+
+def test_store_rejects_partial_chunks(tmp_path):
+
+    store = SimulationStore.create(tmp_path / "store", np.zeros((10, 3)), chunk_size=4)
+
+    with pytest.raises(ValueError):
+        store.write_chunk(2, {"spectra": np.ones((4, 5))})
+    with pytest.raises(FileExistsError):
+        SimulationStore.create(tmp_path / "store", np.zeros((10, 3)))
+
+
+def test_store_create_interrupted(tmp_path, monkeypatch):
+
+    def crash(meta, f, **kwargs):
+        f.write("{")
+        raise KeyboardInterrupt
+
+    # a crash while writing the settings leaves no store behind
+    monkeypatch.setattr(glass_cannon.store.json, "dump", crash)
+    with pytest.raises(KeyboardInterrupt):
+        SimulationStore.create(tmp_path / "store", np.zeros((4, 3)))
+    monkeypatch.undo()
+    assert not os.path.exists(tmp_path / "store" / "meta.json")
+
+    store = SimulationStore.create(tmp_path / "store", np.zeros((4, 3)), chunk_size=2)
+    assert SimulationStore.open(tmp_path / "store").meta == store.meta
+
+def test_store_append(tmp_path):
+
+    store = SimulationStore.create(tmp_path / "store", np.zeros((6, 3)), chunk_size=4)
+    store.append(np.ones((3, 3)))
+
+    assert store.nrows == 9
+    assert store.missing_chunks() == [0, 1, 2]
+    assert np.all(SimulationStore.open(tmp_path / "store").params[6:] == 1)
+
+def test_store_footprint(tmp_path):
+
+    footprint = Footprint.disc(8, lon=0.0, lat=-30.0, radius=20.0)
+    SimulationStore.create(tmp_path / "store", np.zeros((4, 3)), footprint=footprint)
+
+    assert SimulationStore.open(tmp_path / "store").footprint == footprint
+    assert SimulationStore.create(tmp_path / "other", np.zeros((4, 3))).footprint is None
+
+    # pseudo-spectra on the footprint are only stored on request
+    with pytest.raises(ValueError, match="pseudo=True"):
+        run_campaign(SimulationStore.open(tmp_path / "store"), workers=1, spectra_lmax=8)
+
+def test_store_removes_stale_chunks(tmp_path):
+
+    store = SimulationStore.create(tmp_path / "store", np.zeros((4, 3)), chunk_size=2)
+    stale = tmp_path / "store" / "chunks" / ".tmp-crashed"
+    live = tmp_path / "store" / "chunks" / ".tmp-writing"
+    stale.mkdir()
+    live.mkdir()
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+
+    SimulationStore.open(tmp_path / "store")
+
+    assert not stale.exists()
+    assert live.exists()
+    assert store.missing_chunks() == [0, 1]
+
+def test_run_campaign(tmp_path, monkeypatch, toy_emulator, bounds):
+
+    emulator = toy_emulator
+    params = latin_hypercube(bounds, 5, seed=3)
+    options = dict(length=16, emulator=emulator, spectra_lmax=8)
+
+    # a campaign interrupted after its first chunk
+    store = SimulationStore.create(tmp_path / "serial", params, chunk_size=2)
+    run_chunk = glass_cannon.store._run_chunk
+
+    def interrupted(path, k, *args):
+        if k == 1:
+            raise RuntimeError("interrupted")
+        return run_chunk(path, k, *args)
+
+    monkeypatch.setattr(glass_cannon.store, "_run_chunk", interrupted)
+    with pytest.raises(RuntimeError, match="interrupted"):
+        run_campaign(store, seed=5, workers=1, **options)
+    monkeypatch.undo()
+    assert store.completed_chunks() == [0]
+
+    # is resumed from the missing chunks, with the settings of the first run
+    store = SimulationStore.open(tmp_path / "serial")
+    assert store.meta["campaign"]["zb"] == emulator.zb.tolist()
+    assert store.meta["campaign"]["seed"] == 5
+    assert run_campaign(store, seed=5, workers=1, **options) == [1, 2]
+
+    # the outputs do not depend on the number of workers
+    parallel = SimulationStore.create(tmp_path / "parallel", params, chunk_size=2)
+    assert run_campaign(parallel, seed=5, workers=2, **options) == [0, 1, 2]
+    for name in ("galaxy", "HI", "spectra"):
+        assert np.array_equal(store.load(name)[1], parallel.load(name)[1])
+
+    # and the rows are those of simulate_batch
+    galaxy, hi = simulate_batch(params, length=16, seed=5, workers=1, emulator=emulator)
+    assert np.array_equal(store.load("galaxy")[1], galaxy)
+    assert np.array_equal(store.load("HI")[1], hi)
+
+    # resuming with other settings is an error
+    with pytest.raises(ValueError, match="length=32"):
+        run_campaign(store, seed=5, workers=1, **dict(options, length=32))
+    with pytest.raises(ValueError, match="seed=6"):
+        run_campaign(store, seed=6, workers=1, **options)
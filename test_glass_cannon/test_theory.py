@@ -0,0 +1,94 @@
+import glass
+import healpy as hp
+import numpy as np
+import pytest
+
+from glass_cannon.glass_pipeline import convert_DM_to_tracers
+from glass_cannon.spectra import estimate_spectra, spectrum_pairs
+from glass_cannon.theory import glass_index, predict_spectra, tracer_spectra, theory_spectra
+
+
+def test_glass_index():
+
+    order = [(i, j) for i in range(4) for j in range(i, -1, -1)]
+    for k, (i, j) in enumerate(order):
+        assert glass_index(i, j) == glass_index(j, i) == k
+
+def test_tracer_spectra():
+
+    rng = np.random.default_rng(seed=8)
+    cls = rng.uniform(size=(5, 3, 4))
+    offset = rng.uniform(size=(5, 2, 2))
+    scale = rng.uniform(size=(5, 2, 2))
+
+    spectra = tracer_spectra(cls, offset, scale)
+
+    assert spectra.shape == (5, 3 + 3 + 4, 4)
+    # galaxy in shell 0 with HI in shell 1, and in the opposite shells, of
+    # the third point
+    a, b, i, j = spectrum_pairs(2, 2)
+    for shell_g, shell_hi in [(0, 1), (1, 0)]:
+        k = np.flatnonzero((a == 0) & (b == 1) & (i == shell_g) & (j == shell_hi))[0]
+        expected = scale[2, 0, shell_g] * scale[2, 1, shell_hi] * cls[2, 2]
+        expected[0] += 4 * np.pi * offset[2, 0, shell_g] * offset[2, 1, shell_hi]
+        assert np.allclose(spectra[2, k], expected)
+
+def test_tracer_spectra_ncorr():
+
+    nshells = 5
+    cls = np.ones((nshells * (nshells + 1) // 2, 4))
+    offset = np.zeros((2, nshells))
+    scale = np.ones((2, nshells))
+    _, _, i, j = spectrum_pairs(2, nshells)
+
+    # shells further apart than ncorr are uncorrelated, as in the simulator
+    truncated = tracer_spectra(cls, offset, scale, ncorr=3)
+    assert np.all(truncated[np.abs(i - j) > 3] == 0)
+    assert np.all(truncated[np.abs(i - j) <= 3] == 1)
+    assert np.all(tracer_spectra(cls, offset, scale) == 1)
+
+def test_theory_spectra_matches_maps():
+
+    nside, lmax = 32, 48
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+
+    ell = np.arange(lmax + 1)
+    cl0 = 1e-3 / (1 + ell)
+    cls = [cl0, 2 * cl0, 0.8 * cl0]
+    cls[0][0] = cls[1][0] = cls[2][0] = 0.0
+
+    # correlated Gaussian matter maps (healpy ordering: 00, 11, 01)
+    np.random.seed(9)
+    alms = hp.synalm([cls[0], cls[1], cls[2]], lmax=lmax, new=True)
+    matter = [hp.alm2map(alm, nside, lmax=lmax, pol=False) for alm in alms]
+
+    maps = convert_DM_to_tracers(shells, matter)
+    measured = estimate_spectra(maps, lmax)
+    expected = theory_spectra(cls, shells)
+
+    assert measured.shape == expected.shape
+    ratio = measured[..., 2:].mean(axis=-1) / expected[..., 2:].mean(axis=-1)
+    assert np.allclose(ratio, 1, atol=0.1)
+    # the HI mean temperature gives the monopole of the HI spectra
+    a, b, _, _ = spectrum_pairs(2, len(shells))
+    hi = (a == 1) & (b == 1)
+    assert np.allclose(measured[hi, 0], expected[hi, 0], rtol=1e-3)
+
+def test_predict_spectra_emulator(toy_emulator):
+
+    params = np.array([[0.7, 0.25, 0.05], [0.65, 0.22, 0.045], [0.75, 0.28, 0.055]])
+
+    # all points from one emulator call, on the emulator's shells
+    spectra = predict_spectra(params, 16, emulator=toy_emulator)
+    a, _, _, _ = spectrum_pairs(2, len(toy_emulator.shells))
+    assert spectra.shape == (3, len(a), 17)
+    expected = theory_spectra(toy_emulator.predict(params)[..., :17], toy_emulator.shells)
+    assert np.allclose(spectra, expected)
+    assert np.array_equal(predict_spectra(params, 16, zb=toy_emulator.zb,
+                                          emulator=toy_emulator), spectra)
+
+    # a conflicting zb or an lmax beyond the training set is an error
+    with pytest.raises(ValueError, match="zb differs"):
+        predict_spectra(params, 16, zb=np.array([0.0, 0.5, 1.0]), emulator=toy_emulator)
+    with pytest.raises(ValueError, match="lmax"):
+        predict_spectra(params, toy_emulator.lmax + 1, emulator=toy_emulator)
@@ -0,0 +1,62 @@
+import numpy as np
+import glass
+import pytest
+
+from glass_cannon.tracers import tracer_coefficients, allocate_tracer_maps, fill_tracer_maps
+from glass_cannon.HI_tracer import b_HI, T_HI_bar, HI_coefficients, convert_DM_to_HI
+from glass_cannon.galaxies import galaxy_bias, galaxy_coefficients
+
+
+def test_tracer_coefficients():
+
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6, 0.8]))
+    z = np.array([shell.zeff for shell in shells])
+
+    offset, scale = tracer_coefficients(shells, [galaxy_coefficients, HI_coefficients])
+
+    assert offset.shape == scale.shape == (2, 3)
+    assert np.allclose(offset[0], 0.0)
+    assert np.allclose(scale[0], galaxy_bias(z))
+    assert np.allclose(offset[1], T_HI_bar(z))
+    assert np.allclose(scale[1], T_HI_bar(z) * b_HI(z))
+
+def test_fill_tracer_maps():
+
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6, 0.8]))
+    rng = np.random.default_rng(seed=42)
+    matter = [rng.normal(size=48) for _ in shells]
+
+    offset, scale = tracer_coefficients(shells, [galaxy_coefficients, HI_coefficients])
+    out = allocate_tracer_maps(2, len(shells), 48)
+
+    maps = fill_tracer_maps(iter(matter), offset, scale, out=out)
+
+    assert np.shares_memory(maps, out)
+    for shell, delta_m, delta_g, T_HI in zip(shells, matter, maps[0], maps[1]):
+        z = shell.zeff
+        assert np.allclose(delta_g, galaxy_bias(z) * delta_m, rtol=1e-6, atol=1e-8)
+        assert np.allclose(T_HI, T_HI_bar(z) * (1 + b_HI(z) * delta_m), rtol=1e-6, atol=1e-8)
+
+def test_fill_tracer_maps_float32():
+
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    rng = np.random.default_rng(seed=42)
+    matter = [rng.normal(size=48) for _ in shells]
+
+    offset, scale = tracer_coefficients(shells, [HI_coefficients])
+    maps = fill_tracer_maps(matter, offset, scale, dtype=np.float32)
+    expected = fill_tracer_maps(matter, offset, scale)
+
+    assert maps.dtype == np.float32
+    assert np.allclose(maps, expected, rtol=1e-6)
+
+def test_fill_tracer_maps_too_many_fields():
+
+    shells = glass.linear_windows(np.array([0.0, 0.2, 0.4, 0.6]))
+    offset, scale = tracer_coefficients(shells, [galaxy_coefficients])
+    matter = np.zeros((len(shells) + 1, 12))
+
+    with pytest.raises(ValueError, match="more fields"):
+        fill_tracer_maps(matter, offset, scale)
+    with pytest.raises(ValueError, match="more fields"):
+        convert_DM_to_HI(shells, matter)